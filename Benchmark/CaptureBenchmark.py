@@ -0,0 +1,143 @@
+import os, sys, shutil
+import time
+import json
+import argparse
+import tempfile
+
+# リポジトリ直下のモジュールを読み込むため
+REPO_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, REPO_DIR)
+
+# 疑似カメラ、無音、画面なしで動作
+os.environ.setdefault("SBC_CAMERA", "fake")
+os.environ.setdefault("SHUTTER_SOUND", "silent")
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+
+# 作業フォルダの作成
+# Configure、Resourceをコピーし、空の書籍を1冊作成して移動する
+def prepare_workspace(bookid="0001"):
+    workspace = tempfile.mkdtemp(prefix="sbc_benchmark_")
+    shutil.copytree(os.path.join(REPO_DIR, "Configure"), os.path.join(workspace, "Configure"))
+    shutil.copytree(os.path.join(REPO_DIR, "Resource"), os.path.join(workspace, "Resource"))
+    book_dir = os.path.join(workspace, "BookShelf", bookid)
+    os.makedirs(book_dir)
+    with open(os.path.join(workspace, "Resource", "blankinfo.json"), 'r', encoding="utf-8") as f:
+        book_info = json.load(f)
+    book_info['id'] = bookid
+    with open(os.path.join(book_dir, "bookinfo.json"), 'w') as fout:
+        json.dump(book_info, fout, indent=4)
+    for cover in ["front", "back"]:
+        shutil.copy(os.path.join(workspace, "Resource", f"{cover}.jpg"), os.path.join(book_dir, f"{cover}_original.jpg"))
+        shutil.copy(os.path.join(workspace, "Resource", f"{cover}.jpg"), os.path.join(book_dir, f"{cover}_thumnail.jpg"))
+    os.chdir(workspace)
+    return workspace, bookid
+
+
+# 疑似カメラの遅延と撮影モードを設定してカメラ開始
+def setup_cameras(args):
+    from GlobalVariables import picam2s, picapmodes, active_piconfig
+    for camid, camera in enumerate(picam2s):
+        camera.latency.update({"switch": args.switch, "still_frame": args.still_frame, "frame": args.frame})
+        picapmodes[camid] = args.capture_mode
+        camera.stop()
+        camera.configure(active_piconfig(camid))
+        camera.start()
+    return picam2s
+
+
+# 条件が満たされるまでイベント処理を続ける
+def wait_until(app, condition, timeout=600):
+    start = time.perf_counter()
+    while not condition():
+        app.processEvents()
+        time.sleep(0.005)
+        if time.perf_counter() - start > timeout:
+            raise TimeoutError("タイムアウトしました")
+
+
+# 撮影パイプライン(CaptureWorker)のベンチマーク
+# 撮影、後処理のスレッド構成はGUIと同じで、Widgetは作成しない
+def run_pipeline(args):
+    from PyQt5.QtCore import QCoreApplication
+    app = QCoreApplication.instance() or QCoreApplication(sys.argv)
+    from GlobalVariables import configfiles
+    from CaptureWorker import CaptureWorker
+
+    cameras = setup_cameras(args)
+    worker = CaptureWorker()
+    book_dir = os.path.join(".", "BookShelf", args.bookid)
+    start = time.perf_counter()
+    for spread in range(args.spreads):
+        wait_until(app, worker.can_accept)
+        prefix = os.path.join(book_dir, f"spread{spread:04d}")
+        worker.capture([(0, prefix + "_left_original.jpg", 90, configfiles[0]),
+                        (1, prefix + "_right_original.jpg", 270, configfiles[1])])
+        for camera in cameras:
+            camera.turn_page()
+    wait_until(app, lambda: worker.pending == 0 and not worker.capturing)
+    return time.perf_counter() - start, worker
+
+
+# 書籍編集ページ(BookEditPage)のシャッター操作からのベンチマーク
+def run_page(args):
+    from PyQt5.QtWidgets import QApplication
+    app = QApplication.instance() or QApplication(sys.argv)
+    from BookEditPage import BookEditPage
+
+    cameras = setup_cameras(args)
+    page = BookEditPage(args.bookid)
+    page.show()
+    start = time.perf_counter()
+    for spread in range(args.spreads):
+        wait_until(app, page.shutterButton.isEnabled)
+        page.on_shutterbutton_clicked()
+        for camera in cameras:
+            camera.turn_page()
+    wait_until(app, lambda: page.captureWorker.pending == 0 and not page.captureWorker.capturing)
+    return time.perf_counter() - start, page.captureWorker
+
+
+# 射影変換のみのベンチマーク(1枚毎の画像変換、変換済み画像の保存なし)
+def run_transform(args):
+    import ImageTransform
+    from GlobalVariables import configfiles
+    from FakePicamera2 import synthesize_spread
+    frame = synthesize_spread(4608, 2592)
+    ImageTransform.transform(frame, configfiles[0], 90)
+    start = time.perf_counter()
+    for _ in range(args.spreads):
+        ImageTransform.transform(frame, configfiles[0], 90)
+        ImageTransform.transform(frame, configfiles[1], 270)
+    return time.perf_counter() - start, None
+
+
+MODES = {"pipeline": run_pipeline, "page": run_page, "transform": run_transform}
+
+
+if __name__ == '__main__':
+    # 使い方: python Benchmark/CaptureBenchmark.py [--mode pipeline|page|transform] [--spreads 20]
+    parser = argparse.ArgumentParser(description="疑似カメラで撮影処理の速度(見開き/分)を計測します")
+    parser.add_argument("--mode", choices=list(MODES), default="pipeline")
+    parser.add_argument("--spreads", type=int, default=20, help="撮影する見開き数")
+    parser.add_argument("--capture-mode", type=int, default=0, help="撮影モード(0:モード切替, 1:常時静止画)")
+    parser.add_argument("--switch", type=float, default=0.3, help="モード切替の遅延(秒)")
+    parser.add_argument("--still-frame", type=float, default=1/14, help="フル解像度のフレーム間隔(秒)")
+    parser.add_argument("--frame", type=float, default=1/30, help="プレビューのフレーム間隔(秒)")
+    parser.add_argument("--keep", action="store_true", help="作業フォルダを削除しない")
+    args = parser.parse_args()
+
+    workspace, args.bookid = prepare_workspace()
+    print(f"作業フォルダ: {workspace}")
+    try:
+        elapsed, worker = MODES[args.mode](args)
+        print(f"モード: {args.mode}  見開き: {args.spreads}  所要時間: {elapsed:.1f} 秒")
+        print(f"速度: {args.spreads / elapsed * 60:.1f} 見開き/分")
+        if worker is not None:
+            from CaptureLog import book_log, format_summary
+            print(worker.stats_text())
+            print(format_summary(book_log(os.path.join(".", "BookShelf", args.bookid)).summary()))
+    finally:
+        os.chdir(REPO_DIR)
+        if not args.keep:
+            shutil.rmtree(workspace)
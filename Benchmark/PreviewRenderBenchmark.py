@@ -0,0 +1,91 @@
+import os, sys
+import time
+import argparse
+import numpy as np
+import cv2
+
+# リポジトリ直下のモジュールを読み込むため
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+# 疑似カメラ、画面なしで動作
+os.environ.setdefault("SBC_CAMERA", "fake")
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+from PyQt5.QtWidgets import QApplication
+from PyQt5.QtGui import QImage, QPixmap, QTransform
+from PyQt5.QtCore import Qt
+
+from CustomQCameraPreview import CustomQCameraPreview
+from FakePicamera2 import synthesize_spread, convert_format
+
+
+# 従来の描画(RGB888のQImage -> QPixmap -> 回転したQPixmapを作成 -> 毎フレームfitInView)
+class LegacyCameraPreview(CustomQCameraPreview):
+    def update_frame(self, frame=None):
+        frame = self.frame if frame is None else frame
+        if frame is None:
+            return
+        self.frame = frame
+        height, width, channel = frame.shape
+        bytes_per_line = 3 * width
+        q_image = QImage(frame.data, width, height, bytes_per_line, QImage.Format_RGB888)
+        pixmap = QPixmap.fromImage(q_image)
+        transform = QTransform().rotate(self.rotation_angle)
+        rotated_pixmap = pixmap.transformed(transform, Qt.SmoothTransformation)
+        self.pixmap_item.setPixmap(rotated_pixmap)
+        self.fitInView(self.pixmap_item, Qt.KeepAspectRatio)
+
+    # 回転済みのQPixmapのため、アイテムは回転しない
+    def fit_view(self):
+        self.scene.setSceneRect(self.pixmap_item.sceneBoundingRect())
+        self.fitInView(self.pixmap_item, Qt.KeepAspectRatio)
+
+
+# 1フレーム毎のCPU時間(ミリ秒)
+# フレームの転送から画面への描画(repaint)まで
+def measure(app, preview, frames, repeat):
+    times = []
+    for i in range(repeat):
+        frame = frames[i % len(frames)]
+        start = time.process_time()
+        preview.update_frame(frame)
+        preview.viewport().repaint()
+        times.append((time.process_time() - start) * 1000)
+        app.processEvents()
+    return times
+
+
+def report(name, times):
+    print(f"{name:28s} 平均 {np.mean(times):7.2f} ms  中央値 {np.median(times):7.2f} ms  p95 {np.percentile(times, 95):7.2f} ms")
+
+
+if __name__ == '__main__':
+    # 使い方: python Benchmark/PreviewRenderBenchmark.py [--repeat 200] [--rotate 90]
+    parser = argparse.ArgumentParser(description="カメラプレビューの描画速度比較(1フレーム毎のCPU時間)")
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--width", type=int, default=2000, help="プレビューフレームの幅")
+    parser.add_argument("--height", type=int, default=1124, help="プレビューフレームの高さ")
+    parser.add_argument("--rotate", type=int, default=90, help="回転角度")
+    parser.add_argument("--view", type=int, nargs=2, default=[480, 800], help="プレビュー画面のサイズ")
+    args = parser.parse_args()
+
+    app = QApplication(sys.argv)
+    from GlobalVariables import picam2s
+
+    # ページめくり相当の数フレーム
+    images = [synthesize_spread(args.width, args.height, page) for page in range(4)]
+    print(f"フレーム: {args.width}x{args.height}  回転: {args.rotate}  画面: {args.view[0]}x{args.view[1]}  繰り返し: {args.repeat}")
+
+    for name, preview_class, format in [("従来(BGR888, 回転コピー)", LegacyCameraPreview, "BGR888"),
+                                         ("アイテム変換(XRGB8888)", CustomQCameraPreview, "XRGB8888")]:
+        frames = [convert_format(image, format).copy() for image in images]
+        preview = preview_class(picam2s[0])
+        preview.resize(*args.view)
+        preview.show()
+        preview.rotation_angle = args.rotate
+        preview.update_frame(frames[0])
+        preview.reset_view()
+        # カメラからのフレームは受け取らない
+        preview.broker.unsubscribe(preview.on_frame)
+        report(name, measure(app, preview, frames, args.repeat))
+        preview.hide()
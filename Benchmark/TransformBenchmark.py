@@ -0,0 +1,69 @@
+import os, sys
+import time
+import argparse
+import json
+import numpy as np
+import cv2
+
+# リポジトリ直下のモジュールを読み込むため
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import ImageTransform
+
+
+# 従来の画像変換(毎回コンフィグ読み込み、射影変換行列の計算、warpPerspective)
+def transform_legacy(image_org, config_file):
+    with open(config_file,'r', encoding="utf-8") as f:
+        config = json.load(f)
+    src = np.float32([(x, y) for x, y in config["ImageTransform"]["AcrylicPoints"]])
+    M = ImageTransform.perspective_matrix(src)
+    return cv2.warpPerspective(image_org, M, ImageTransform.output_size(), borderValue=(0, 0,0))
+
+
+# 所要時間の計測(ミリ秒)
+def measure(func, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        times.append((time.perf_counter() - start) * 1000)
+    return result, times
+
+
+def report(name, times):
+    print(f"{name:24s} 平均 {np.mean(times):8.1f} ms  中央値 {np.median(times):8.1f} ms  最小 {np.min(times):8.1f} ms")
+
+
+if __name__ == '__main__':
+    # 使い方: python Benchmark/TransformBenchmark.py [--repeat 10]
+    parser = argparse.ArgumentParser(description="画像変換の速度比較(12MP入力)")
+    parser.add_argument("--config", default=os.path.join(".", "Configure", "camera0_configure_recommend.json"))
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--width", type=int, default=2592)
+    parser.add_argument("--height", type=int, default=4608)
+    args = parser.parse_args()
+
+    # 12MPの合成画像(回転後のページ画像相当)
+    rng = np.random.default_rng(0)
+    image = cv2.resize(rng.integers(0, 255, (args.height//64, args.width//64, 3), dtype=np.uint8),
+                       (args.width, args.height), interpolation=cv2.INTER_LINEAR)
+    print(f"入力画像: {args.width}x{args.height}  繰り返し: {args.repeat}")
+
+    # 従来の関数
+    legacy, times = measure(lambda: transform_legacy(image, args.config), args.repeat)
+    report("従来(warpPerspective)", times)
+
+    # 射影変換行列をキャッシュ
+    engine = ImageTransform.TransformEngine(use_remap=False)
+    _, times = measure(lambda: engine.transform(image, args.config), args.repeat)
+    report("行列キャッシュ", times)
+
+    # remapテーブルをキャッシュ(初回はテーブル作成)
+    engine = ImageTransform.TransformEngine(use_remap=True)
+    _, times = measure(lambda: engine.transform(image, args.config), 1)
+    report("remapテーブル作成(初回)", times)
+    remapped, times = measure(lambda: engine.transform(image, args.config), args.repeat)
+    report("remapテーブル再利用", times)
+
+    # 結果の差分
+    diff = np.abs(legacy.astype(np.int16) - remapped.astype(np.int16))
+    print(f"従来との差分: 最大 {diff.max()}  平均 {diff.mean():.4f}")
@@ -1,4 +1,5 @@
 import os
+import time
 import json, shutil
 from datetime import datetime
 import numpy as np
@@ -8,13 +9,18 @@ from PIL import Image
 import pyzbar.pyzbar as pyzbar
 import urllib
 
-from playsound import playsound
+# シャッター音
+from ShutterSound import get_shutter_sound
+# ページめくり検出
+from PageTurnDetector import PageTurnDetector, load_detector_config
+# 処理時間ログ
+from CaptureLog import book_log, spread_side, format_summary
 
 # Qt関係
-from PyQt5.QtCore import Qt, QTimer, QAbstractTableModel
+from PyQt5.QtCore import Qt, QAbstractTableModel
 from PyQt5.QtWidgets import QApplication, QMainWindow, QWidget, QGroupBox, QMenu, QMessageBox
 from PyQt5.QtWidgets import QHBoxLayout, QVBoxLayout, QSpacerItem, QSizePolicy
-from PyQt5.QtWidgets import QPushButton, QComboBox
+from PyQt5.QtWidgets import QPushButton, QComboBox, QLabel, QCheckBox
 from PyQt5.QtGui import QIcon
 from PyQt5.QtWidgets import QTableView, QStyledItemDelegate, QHeaderView, QStyle, QAbstractItemView
 from PyQt5.QtGui import QStandardItemModel, QStandardItem, QPixmap, QBrush, QColor
@@ -32,7 +38,20 @@ from GlobalVariables import picam2s, piconfigs, pimetadatas, configfiles
 
 # 画像変換
 import cv2
-import ImageTransform
+# 派生画像の記録
+from DerivedCache import ensure_derived
+# 書籍情報の読み込み
+from BookStore import load_book_info, new_spread_prefix
+# コンフィグファイルのキャッシュと変更通知
+from ConfigStore import camera_rotate_angle
+from ConfigWatcher import config_watcher
+# 縮小済みサムネイルのキャッシュ
+from ThumbnailCache import thumbnail_cache
+
+# 静止画撮影
+from CameraCapture import capture_still_array
+from CaptureProcess import rotate_frame
+from CaptureWorker import CaptureWorker
 
 # QImage->PILImage変換
 def qimage_to_pilimage(qimage):
@@ -108,10 +127,8 @@ class ThumbnailTableModel(QtCore.QAbstractTableModel):
             else:
                 return None
 
-            pixmap = QPixmap(image_path)
-            if not pixmap.isNull():
-                return pixmap.scaledToHeight(hicon, Qt.SmoothTransformation)
-                #return pixmap.scaled(64, 64, QtCore.Qt.KeepAspectRatio, QtCore.Qt.SmoothTransformation)
+            # 描画、スクロール毎に呼ばれるため、縮小済みのキャッシュを使用
+            return thumbnail_cache.pixmap(image_path, hicon)
 
         return None
 
@@ -138,8 +155,20 @@ class ThumbnailTableModel(QtCore.QAbstractTableModel):
 
     def removeRow(self, position):
         self.beginRemoveRows(QtCore.QModelIndex(), position, position)
-        self._data.pop(position)
+        item = self._data.pop(position)
         self.endRemoveRows()
+        # 削除したページのサムネイルをキャッシュから削除
+        thumbnail_cache.invalidate(item[1])
+        thumbnail_cache.invalidate(item[3])
+
+    # サムネイル画像の再描画
+    def refresh_image(self, image_path):
+        thumbnail_cache.invalidate(image_path)
+        for row, item in enumerate(self._data):
+            for column in [1, 3]:
+                if item[column] == image_path:
+                    index = self.index(row, column)
+                    self.dataChanged.emit(index, index, [QtCore.Qt.DecorationRole])
 
 
 class ThumbnailTableView(QTableView):
@@ -239,17 +268,6 @@ def get_combobox_model(disableIndex=[]):
     return model
 
 
-# 書籍情報を取得
-def load_book_info(bookid):
-    # 書籍フォルダ
-    book_dir = os.path.join(".", "BookShelf", bookid)
-    # 書籍情報読み取り
-    json_file = os.path.join(book_dir, "bookinfo.json")
-    with open(json_file,'r', encoding="utf-8") as f:
-        bookInfo = json.load(f)
-    return bookInfo
-
-
 # 本棚ページ
 class BookEditPage(QWidget):
     # 初期化
@@ -342,11 +360,35 @@ class BookEditPage(QWidget):
         self.rightComboBox.setCurrentIndex(1)
         self.rightComboBox.currentIndexChanged.connect(self.on_rightcombobox_changed)
 
+        # 撮影後の後処理ワーカー
+        self.captureWorker = CaptureWorker(self)
+        self.captureWorker.finished.connect(self.on_postprocess_finished)
+        self.captureWorker.failed.connect(self.on_postprocess_failed)
+        self.captureWorker.captureFailed.connect(self.on_capture_failed)
+        self.captureWorker.statsChanged.connect(self.on_capture_stats_changed)
+
+        # シャッター音(全ページで共有し、読み込みは初回のみ)
+        self.shutterSound = get_shutter_sound()
+        
+        # 処理時間ログ
+        self.captureLog = book_log(os.path.join(".", "BookShelf", bookid))
+        
+        # 処理待ちキュー、処理速度の表示
+        self.captureStatus = QLabel(self.captureWorker.stats_text())
+        
+        # 撮影ボタンの有効化フラグ(処理待ちキューが満杯の間は無効)
+        self.shutter_allowed = True
+        
         # 撮影ボタン
         self.shutterButton = QPushButton("")
         self.shutterButton.setIcon(QIcon("./Resource/shutter.png"))
         self.shutterButton.clicked.connect(self.on_shutterbutton_clicked)
         
+        # 自動撮影(ページめくりを検出して撮影)
+        self.autoCaptureCheckBox = QCheckBox("自動撮影")
+        self.autoCaptureCheckBox.toggled.connect(self.on_autocapture_toggled)
+        self.pageTurnDetector = None
+        
         # 左ページプレビュー
         self.leftPagePreview = CustomQImageViewer("./Resource/left.png")
         self.leftPagePreview.hide()
@@ -361,6 +403,13 @@ class BookEditPage(QWidget):
         # 右カメラプレビュー
         self.rightCameraPreview = CustomQCameraPreview(picam2s[1])
         
+        # 自動撮影用のプレビューフレーム
+        self.leftCameraPreview.frameUpdated.connect(lambda frame: self.on_preview_frame(frame, 0))
+        self.rightCameraPreview.frameUpdated.connect(lambda frame: self.on_preview_frame(frame, 1))
+        # 非表示のプレビューは自動撮影の静止判定から外す
+        self.leftCameraPreview.previewHidden.connect(lambda: self.on_preview_hidden(0))
+        self.rightCameraPreview.previewHidden.connect(lambda: self.on_preview_hidden(1))
+        
         # 左ページ画像変換ビュー
         #self.leftTransform = CustomQImageViewer2()
         #self.leftTransform.hide()
@@ -417,6 +466,9 @@ class BookEditPage(QWidget):
         
         # 見開きプレビュー一覧
         leftVBoxLayout.addWidget(self.thumbnailTable)
+        
+        # 処理待ちキュー、処理速度
+        leftVBoxLayout.addWidget(self.captureStatus)
                 
         # 右半分Widget
         rightWidget = QWidget()
@@ -440,6 +492,8 @@ class BookEditPage(QWidget):
         # 撮影ボタン
         ctrlHBoxLayout.addItem(QSpacerItem(10, 10, QSizePolicy.Expanding, QSizePolicy.Minimum))
         ctrlHBoxLayout.addWidget(self.shutterButton)
+        # 自動撮影
+        ctrlHBoxLayout.addWidget(self.autoCaptureCheckBox)
         ctrlHBoxLayout.addItem(QSpacerItem(10, 10, QSizePolicy.Expanding, QSizePolicy.Minimum))
         # 右コンボボックス
         ctrlHBoxLayout.addWidget(self.rightComboBox)
@@ -462,10 +516,15 @@ class BookEditPage(QWidget):
         previewHBoxLayout.addWidget(self.rightPagePreview)
         previewHBoxLayout.addWidget(self.rightCameraPreview)
         
-        # カメラプレビュー回転用タイマ
-        self.timer = QTimer(self)
-        self.timer.timeout.connect(self.update_camera_preview)
-        self.timer.start(30)
+        # カメラプレビュー回転
+        # コンフィグファイルの変更通知で更新(表示時、カメラ切り替え時にも更新)
+        config_watcher().configChanged.connect(self.update_camera_preview)
+
+
+    # ページ表示時にカメラプレビューの回転を更新
+    def showEvent(self, event):
+        self.update_camera_preview()
+        super().showEvent(event)
 
 
     # 見開きプレビューテーブルの行をクリック時の動作
@@ -532,9 +591,9 @@ class BookEditPage(QWidget):
             
         # シャッターボタン設定
         if leftfile =="left.png" or rightfile == "right.png":
-            self.shutterButton.setEnabled(True)
+            self.update_shutter_button(True)
         else:
-            self.shutterButton.setEnabled(False)
+            self.update_shutter_button(False)
 
         # 書籍情報json更新
         self.update_bookinfo_ordered()
@@ -544,7 +603,8 @@ class BookEditPage(QWidget):
     def on_leftcombobox_changed(self, index):
         # カメラ0、カメラ1
         if index in [0, 1]:
-            self.leftCameraPreview.camera = picam2s[index]
+            self.leftCameraPreview.set_camera(picam2s[index])
+            self.update_camera_preview()
         
         # オリジナル画、変換済み画像
         if index in [2, 4]:
@@ -568,13 +628,9 @@ class BookEditPage(QWidget):
                     leftfile = leftfile.replace('_thumnail', '_original')
                 
                 # 変換済み画像の場合
+                # 元画像、アクリル板の4点座標が変わっている場合は作り直す
                 if index == 4:
-                    leftfile = leftfile.replace('_thumnail', '_transformed')
-                    if not os.path.exists(leftfile):
-                        file_org = leftfile.replace('_transformed', '_original')
-                        image_org = cv2.imread(file_org)
-                        image_trans = ImageTransform.transform(image_org, configfiles[0])
-                        cv2.imwrite(leftfile, image_trans)
+                    leftfile = ensure_derived(leftfile.replace('_thumnail', '_original'))
                 
                 # 左ページプレビュー更新
                 self.leftPagePreview.reset_image(leftfile)
@@ -603,7 +659,8 @@ class BookEditPage(QWidget):
     def on_rightcombobox_changed(self, index):
         # カメラ0、カメラ1
         if index in [0, 1]:
-            self.rightCameraPreview.camera = picam2s[index]
+            self.rightCameraPreview.set_camera(picam2s[index])
+            self.update_camera_preview()
             
         # オリジナル画像、変換済み画像
         if index in [2, 4]:
@@ -627,13 +684,9 @@ class BookEditPage(QWidget):
                     rightfile = rightfile.replace('_thumnail', '_original')
                 
                 # 変換済み画像の場合
+                # 元画像、アクリル板の4点座標が変わっている場合は作り直す
                 if index == 4:
-                    rightfile = rightfile.replace('_thumnail', '_transformed')
-                    if not os.path.exists(rightfile):
-                        file_org = rightfile.replace('_transformed', '_original')
-                        image_org = cv2.imread(file_org)
-                        image_trans = ImageTransform.transform(image_org, configfiles[1])
-                        cv2.imwrite(rightfile, image_trans)
+                    rightfile = ensure_derived(rightfile.replace('_thumnail', '_original'))
                 
                 # 右ページプレビュー更新
                 self.rightPagePreview.reset_image(rightfile)
@@ -663,7 +716,8 @@ class BookEditPage(QWidget):
     def on_rightcombobox_changed2(self, index):
         # カメラ0、カメラ1
         if index in [0, 1]:
-            self.rightCameraPreview.camera = picam2s[index]
+            self.rightCameraPreview.set_camera(picam2s[index])
+            self.update_camera_preview()
 
         # オリジナル画像、変換済み画像
         if index in [2, 4]:
@@ -674,13 +728,9 @@ class BookEditPage(QWidget):
             rightfile = os.path.join(".", "BookShelf", self.bookid, f"{cover}_original.jpg")
             
             # 変換済み画像の場合
+            # 元画像、アクリル板の4点座標が変わっている場合は作り直す
             if index == 4:
-                rightfile = rightfile.replace('_original', '_transformed')
-                if not os.path.exists(rightfile):
-                    file_org = rightfile.replace('_transformed', '_original')
-                    image_org = cv2.imread(file_org)
-                    image_trans = ImageTransform.transform(image_org, configfiles[1])
-                    cv2.imwrite(rightfile, image_trans)
+                rightfile = ensure_derived(rightfile)
             
             # 右ページプレビュー更新
             self.rightPagePreview.reset_image(rightfile)
@@ -696,79 +746,64 @@ class BookEditPage(QWidget):
         if index in [0, 1]:
             self.rightCameraPreview.show()
             self.rightPagePreview.hide()
-            self.shutterButton.setEnabled(True)
+            self.update_shutter_button(True)
         elif index in [2, 3, 4]:
             # 非表示、表示切り替え
             self.rightCameraPreview.hide()
             self.rightPagePreview.show()
-            self.shutterButton.setEnabled(False)
+            self.update_shutter_button(False)
 
 
     # シャッターボタンクリック時の動作
     def on_shutterbutton_clicked(self):
-        # タイムスタンプ
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        # 処理待ちキューが満杯の場合は受け付けない
+        if not self.captureWorker.can_accept():
+            return
+        
+        # 自動撮影の基準画像を更新
+        if self.pageTurnDetector is not None:
+            self.pageTurnDetector.mark_captured()
+        
+        # タイムスタンプ(同じ秒に連続撮影した場合は連番を付与)
+        timestamp = new_spread_prefix(self.bookid, self.bookinfo["ordered"])
 
         # ファイル形式はいったんJPG固定
         filetype = "jpg"
 
         # 左ページについて
         leftfile = os.path.join(".", "BookShelf", self.bookid, timestamp + f"_left_original.{filetype}")
+        # 右ページについて
+        rightfile = os.path.join(".", "BookShelf", self.bookid, timestamp + f"_right_original.{filetype}")
         
+        # 撮影対象(カメラ番号, ファイル名, 回転角度, コンフィグファイル)
+        captures = []
         # カメラ0, 1
         if self.leftComboBox.currentIndex() in [0, 1]:
-            # カメラ番号
             camid = self.leftComboBox.currentIndex()
-            # 静止画撮影
-            picam2s[camid].switch_mode_and_capture_file(piconfigs[camid]["still"], leftfile)
-            # 回転変換
-            qimage = QImage(leftfile)
-            rotate_angle = self.leftCameraPreview.rotation_angle
-            transform = QTransform().rotate(rotate_angle)
-            qimage = qimage.transformed(transform)
-            # オリジナル画像を保存
-            qimage.save(leftfile, 'JPEG', quality=100)
-            # サムネイル画像
-            thum_height = 400
-            thum_width = int(thum_height * qimage.width() / qimage.height())
-            qthum = qimage.scaled(thum_width, thum_height, aspectRatioMode=Qt.KeepAspectRatio)
-            qthum.save(leftfile.replace('original', 'thumnail'), 'JPEG', quality=100)
-            # 変換済み画像
-            image_org = cv2.imread(leftfile)
-            imaeg_trans = ImageTransform.transform(image_org, configfiles[camid])
-            cv2.imwrite(leftfile.replace('original', 'transformed'), imaeg_trans)
+            captures.append((camid, leftfile, self.leftCameraPreview.rotation_angle, configfiles[camid]))
+        if self.rightComboBox.currentIndex() in [0, 1]:
+            camid = self.rightComboBox.currentIndex()
+            captures.append((camid, rightfile, self.rightCameraPreview.rotation_angle, configfiles[camid]))
+        
+        # 静止画撮影
+        # 左右のカメラを同時に撮影し、フレームを処理待ちキューへ投入
+        # オリジナル、サムネイル、変換済み画像はバックグラウンドで処理して、完了後にサムネイルを更新
+        if len(captures) > 0:
+            self.captureWorker.capture(captures)
+        
+        # シャッター音
+        # 再生完了を待たずに次の処理へ進む
+        start = time.perf_counter()
+        self.shutterSound.play()
+        self.captureLog.append(timestamp, "sound", time.perf_counter() - start)
+        
         # ブランク画像
-        elif self.leftComboBox.currentIndex() == 3:
+        if self.leftComboBox.currentIndex() == 3:
             # ブランク画像をコピー
             leftblank = os.path.join(".", "Resource", "left.png")
             shutil.copy(leftblank, leftfile)
             shutil.copy(leftblank, leftfile.replace('original', 'thumnail'))
         
-        # 右ページについて
-        rightfile = os.path.join(".", "BookShelf", self.bookid, timestamp + f"_right_original.{filetype}")
-        
-        # カメラ0, 1
-        if self.rightComboBox.currentIndex() in [0, 1]:
-            # カメラ番号
-            camid = self.rightComboBox.currentIndex()
-            # 静止画撮影
-            picam2s[camid].switch_mode_and_capture_file(piconfigs[camid]["still"], rightfile)
-            # 回転変換
-            qimage = QImage(rightfile)
-            rotate_angle = self.rightCameraPreview.rotation_angle
-            transform = QTransform().rotate(rotate_angle)
-            qimage = qimage.transformed(transform)
-            # オリジナル画像を保存
-            qimage.save(rightfile, 'JPEG', quality=100)
-            # サムネイル画像
-            thum_height = 400
-            thum_width = int(thum_height * qimage.width() / qimage.height())
-            qthum = qimage.scaled(thum_width, thum_height, aspectRatioMode=Qt.KeepAspectRatio)
-            qthum.save(rightfile.replace('original', 'thumnail'), 'JPEG', quality=100)
-            # 変換済み画像
-            image_org = cv2.imread(rightfile)
-            imaeg_trans = ImageTransform.transform(image_org, configfiles[camid])
-            cv2.imwrite(rightfile.replace('original', 'transformed'), imaeg_trans)
         # ブランク画像
         if self.rightComboBox.currentIndex() == 3:
             # ブランク画像をコピー
@@ -788,7 +823,9 @@ class BookEditPage(QWidget):
         self.thumbnailTable.setRowHeight(row, hrow)
 
         # 書籍情報json更新
+        start = time.perf_counter()
         self.update_bookinfo_ordered()
+        self.captureLog.append(timestamp, "bookinfo", time.perf_counter() - start)
         
         # 新規ページを選択中にしておく
         # どうも位置が近いと移動しない
@@ -805,11 +842,94 @@ class BookEditPage(QWidget):
         last_index = self.thumbnailModel.index(last_row, 0)
         self.thumbnailTable.selectRow(last_row)
         self.thumbnailTable.scrollTo(last_index, QAbstractItemView.PositionAtBottom)
-        
-        # シャッター音
-        # どうも初回の音がでない？
-        se = os.path.join('.', 'Resource', 'shutter.mp3')
-        playsound(se)
+
+
+    # 自動撮影の切り替え
+    # 有効化する毎にコンフィグファイルを読み直す
+    def on_autocapture_toggled(self, checked):
+        if checked:
+            self.pageTurnDetector = PageTurnDetector(load_detector_config())
+        else:
+            self.pageTurnDetector = None
+
+
+    # プレビューフレーム更新時の動作(自動撮影)
+    # ページめくりの後、画像が静止したら撮影する
+    def on_preview_frame(self, frame, side):
+        if self.pageTurnDetector is None:
+            return
+        # 書籍情報、カバー設定中は対象外
+        if self.bookInfoSetting.isVisible():
+            return
+        if self.pageTurnDetector.update(frame, side) and self.shutterButton.isEnabled():
+            self.on_shutterbutton_clicked()
+
+
+    # プレビュー非表示時の動作(自動撮影)
+    # フレームが届かなくなるため、静止判定の対象から外す
+    def on_preview_hidden(self, side):
+        if self.pageTurnDetector is not None:
+            self.pageTurnDetector.forget(side)
+
+
+    # 撮影ボタンの有効、無効を更新
+    # 処理待ちキューが満杯、または撮影中の間は無効にする
+    def update_shutter_button(self, enabled=None):
+        if enabled is not None:
+            self.shutter_allowed = enabled
+        self.shutterButton.setEnabled(self.shutter_allowed and self.captureWorker.can_accept())
+
+
+    # 処理待ちキュー、処理速度の更新時の動作
+    def on_capture_stats_changed(self):
+        self.captureStatus.setText(self.captureWorker.stats_text())
+        # 処理段階毎の所要時間(p50/p95)
+        self.captureStatus.setToolTip(format_summary(self.captureLog.summary()))
+        self.update_shutter_button()
+
+
+    # 撮影失敗時の動作
+    # ファイルのない見開きが残らないよう、一覧と書籍情報から削除する
+    def on_capture_failed(self, message, filenames):
+        print(f"撮影エラー: {message}")
+        for filename in filenames:
+            self.remove_failed_spread(filename)
+        QMessageBox.critical(self, "撮影エラー", "静止画の撮影に失敗しました。", QMessageBox.Ok)
+
+
+    # 撮影後の後処理完了時の動作
+    def on_postprocess_finished(self, filename):
+        # 見開きプレビューのサムネイル更新
+        # キャッシュを破棄してサムネイルを読み込み、読み込み時間を記録する
+        # 再描画はdataChangedによる通常の更新で行う(読み込み済みのキャッシュを使用)
+        thumbnail_file = filename.replace('original', 'thumnail')
+        self.thumbnailModel.refresh_image(thumbnail_file)
+        start = time.perf_counter()
+        thumbnail_cache.pixmap(thumbnail_file, hicon)
+        spread, side = spread_side(filename)
+        book_log(os.path.dirname(filename)).append(spread, "reload", time.perf_counter() - start, side)
+
+
+    # 撮影後の後処理失敗時の動作
+    # 撮影失敗時と同様に、見開きを一覧と書籍情報から削除する
+    def on_postprocess_failed(self, filename, message):
+        print(f"後処理エラー: {filename} {message}")
+        self.remove_failed_spread(filename)
+        QMessageBox.critical(self, "保存エラー", f"撮影画像の保存に失敗しました。\n{os.path.basename(filename)}", QMessageBox.Ok)
+
+
+    # 撮影、保存に失敗した見開きを一覧と書籍情報から削除
+    # 表紙、裏表紙の場合、削除済みの場合は何もしない
+    def remove_failed_spread(self, filename):
+        spread, side = spread_side(filename)
+        if side is None:
+            return
+        leftname = f"{spread}_left_thumnail.jpg"
+        for row in range(self.thumbnailModel.rowCount()):
+            if self.thumbnailModel.data(self.thumbnailModel.index(row, 0), QtCore.Qt.DisplayRole) == leftname:
+                self.thumbnailModel.removeRow(row)
+                self.update_bookinfo_ordered()
+                return
 
 
     # 書籍情報(ページ並び順)の更新
@@ -847,6 +967,10 @@ class BookEditPage(QWidget):
     # シャッターボタンクリック時の動作
     # 書籍情報設定時
     def on_shutterbutton_clicked2(self):
+        # 処理待ちキューが満杯の場合は受け付けない
+        if not self.captureWorker.can_accept(1):
+            return
+        
         # ファイル名
         filename = 'front_original.jpg' if self.coverComboBox.currentIndex() == 0 else 'back_original.jpg'
         filename = os.path.join(".", "BookShelf", self.bookid, filename)
@@ -859,29 +983,14 @@ class BookEditPage(QWidget):
         # カメラ番号
         camid = self.rightComboBox.currentIndex()
         # 静止画撮影
-        picam2s[camid].switch_mode_and_capture_file(piconfigs[camid]["still"], filename)
-        # 回転変換
-        qimage = QImage(filename)
-        rotate_angle = self.rightCameraPreview.rotation_angle
-        transform = QTransform().rotate(rotate_angle)
-        qimage = qimage.transformed(transform)
-        # 上書き保存
-        qimage.save(filename, 'JPEG', quality=100)
-        
-        # サムネイル画像
-        thum_height = 400
-        thum_width = int(thum_height * qimage.width() / qimage.height())
-        qthum = qimage.scaled(thum_width, thum_height, aspectRatioMode=Qt.KeepAspectRatio)
-        qthum.save(filename.replace('original', 'thumnail'), 'JPEG', quality=100)
-        
-        # 変換済み画像
-        image_org = cv2.imread(filename)
-        imaeg_trans = ImageTransform.transform(image_org, configfiles[camid])
-        cv2.imwrite(filename.replace('original', 'transformed'), imaeg_trans)
+        # オリジナル、サムネイル、変換済み画像はバックグラウンドで処理
+        self.captureWorker.capture([(camid, filename, self.rightCameraPreview.rotation_angle, configfiles[camid])])
         
         # シャッター音
-        se = os.path.join('.', 'Resource', 'shutter.mp3')
-        playsound(se)
+        start = time.perf_counter()
+        self.shutterSound.play()
+        spread, side = spread_side(filename)
+        self.captureLog.append(spread, "sound", time.perf_counter() - start, side)
 
 
     # 見開きプレビューの列幅調整
@@ -913,17 +1022,13 @@ class BookEditPage(QWidget):
         self.adjust_column_widths()
 
 
-    def update_camera_preview(self):
+    # カメラプレビューの回転をコンフィグに合わせる
+    def update_camera_preview(self, *args):
         # 左カメラプレビュー回転
         camid = self.leftComboBox.currentIndex()
         if camid in [0, 1]:
-            # コンフィグファイル読み込み
-            config_file = configfiles[camid]
-            with open(config_file,'r', encoding="utf-8") as f:
-                config = json.load(f)
-            
-            # 回転角度
-            rotate_angle = config["BasicSetting"]["RoteIndex"]*90 % 360
+            # 回転角度(コンフィグはキャッシュから取得)
+            rotate_angle = camera_rotate_angle(configfiles[camid])
             
             # 回転角度が異なれば
             if rotate_angle != self.leftCameraPreview.rotation_angle:
@@ -932,13 +1037,8 @@ class BookEditPage(QWidget):
         # 右カメラプレビュー
         camid = self.rightComboBox.currentIndex()
         if camid in [0, 1]:
-            # コンフィグファイル読み込み
-            config_file = configfiles[camid]
-            with open(config_file,'r', encoding="utf-8") as f:
-                config = json.load(f)
-            
-            # 回転角度
-            rotate_angle = config["BasicSetting"]["RoteIndex"]*90 % 360
+            # 回転角度(コンフィグはキャッシュから取得)
+            rotate_angle = camera_rotate_angle(configfiles[camid])
             
             # 回転角度が異なれば
             if rotate_angle != self.rightCameraPreview.rotation_angle:
@@ -1073,25 +1173,20 @@ class BookEditPage(QWidget):
             # カメラ番号
             camid = self.rightComboBox.currentIndex()
             # 静止画撮影
-            book_dir = os.path.join(".", "BookShelf", self.bookid)
-            filename = os.path.join(book_dir, "tmp.jpg")
-            picam2s[camid].switch_mode_and_capture_file(piconfigs[camid]["still"], filename)
+            frame, _ = capture_still_array(camid)
             # 回転変換
-            qimage = QImage(filename)
-            rotate_angle = self.rightCameraPreview.rotation_angle
-            transform = QTransform().rotate(rotate_angle)
-            qimage = qimage.transformed(transform)
-            # PIL変換
-            pimage = qimage_to_pilimage(qimage)
-            # 一時ファイル削除
-            os.remove(filename)
+            frame = rotate_frame(frame, self.rightCameraPreview.rotation_angle)
+            # PIL変換(BGR->RGB)
+            pimage = Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
         else:
             # 表紙or裏表紙
             cover = 'front' if self.coverComboBox.currentIndex()==0 else 'back'
             # オリジナルor変換済み
             post = 'original' if self.rightComboBox.currentIndex()==2 else 'transformed'
             # ファイル名
-            filename = os.path.join(".", "BookShelf", self.bookid, f"{cover}_{post}.jpg")
+            filename = os.path.join(".", "BookShelf", self.bookid, f"{cover}_original.jpg")
+            if post == 'transformed':
+                filename = ensure_derived(filename)
             # 読み込み
             qimage = QImage(filename)
             # PIL変換
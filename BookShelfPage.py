@@ -1,14 +1,14 @@
-import os, glob, shutil
+import os, sys, glob, shutil
 import json
 import numpy as np
 
 # Qt関係
-from PyQt5.QtCore import Qt, QTimer
+from PyQt5.QtCore import Qt, QTimer, QProcess
 from PyQt5.QtWidgets import QApplication, QMainWindow, QWidget, QMessageBox
 from PyQt5.QtWidgets import QTabWidget, QFrame
 from PyQt5.QtWidgets import QHBoxLayout, QVBoxLayout, QFormLayout, QSplitter
 from PyQt5.QtWidgets import QComboBox, QPushButton, QLabel, QLineEdit, QCheckBox, QSpinBox
-from PyQt5.QtWidgets import QTextEdit, QSizePolicy
+from PyQt5.QtWidgets import QTextEdit, QSizePolicy, QProgressDialog
 from PyQt5.QtGui import QIcon
 from PyQt5.QtGui import QStandardItemModel, QStandardItem
 from PyQt5.QtGui import QImage, QPainter, QPalette, QPixmap, QBrush, QColor
@@ -19,6 +19,13 @@ from CustomQBookPreview import CustomQBookPreview
 from CustomQWidgets import yes_no_dialog
 from CustomQDialog import FileFolderDialog
 
+# 派生画像の記録
+from DerivedCache import ensure_derived_path
+# 書籍フォルダ操作(Qtなしの共通処理)
+from BookStore import load_book_infos, create_book, export_book
+# 縮小済みサムネイルのキャッシュ
+from ThumbnailCache import thumbnail_cache
+
 # 書籍一覧テーブル用モデル
 class BookTableModel(QAbstractTableModel):
     def __init__(self, books):
@@ -130,22 +137,6 @@ class BookInfoModel(QAbstractTableModel):
         self.endResetModel()
 
 
-# 本棚からすべての書籍情報を取得
-def load_book_infos():
-    # 書籍一覧
-    book_infos = []
-    for book_dir in sorted(glob.glob(os.path.join(".", "BookShelf", '*'))):
-        # 書籍情報読み取り
-        json_file = os.path.join(book_dir, "bookinfo.json")
-        with open(json_file,'r', encoding="utf-8") as f:
-            book_info = json.load(f)
-        # サムネイル
-        book_info["thumbnail"] = os.path.join(book_dir, "front_thumnail.jpg")
-        # 追加
-        book_infos.append(book_info)
-    return book_infos
-
-
 # 本棚ページ
 class BookShelfPage(QWidget):
     # 初期化
@@ -174,6 +165,12 @@ class BookShelfPage(QWidget):
         exportBookButton = QPushButton("エクスポート")
         exportBookButton.clicked.connect(self.on_exportBookButton_clicked)
 
+        # 一括変換ボタン
+        transformBookButton = QPushButton("一括変換")
+        transformBookButton.clicked.connect(self.on_transformBookButton_clicked)
+        # 一括変換のプロセス
+        self.transformProcess = None
+
         # 検索ボックス
         searchEditBox = QLineEdit(self)
         searchEditBox.setPlaceholderText('タイトルを入力....')
@@ -229,6 +226,8 @@ class BookShelfPage(QWidget):
         # プレビュー画像
         blank = "./Resource/preview.png"
         self.bookPreview = CustomQBookPreview([blank])
+        # 変換済み画像は表示するページのみ、古い場合に作り直す
+        self.bookPreview.resolve = ensure_derived_path
 
         # 書籍情報テーブル
         self.bookInfo = QTableView()
@@ -275,6 +274,8 @@ class BookShelfPage(QWidget):
         ctrlHBoxLayout.addWidget(deleteBookButton, 1)
         # エクスポートボタン
         ctrlHBoxLayout.addWidget(exportBookButton, 1)
+        # 一括変換ボタン
+        ctrlHBoxLayout.addWidget(transformBookButton, 1)
         # 検索ボックス
         ctrlHBoxLayout.addWidget(searchEditBox, 3)
         # 検索ボタン
@@ -370,48 +371,8 @@ class BookShelfPage(QWidget):
     
     # 新規ボタンクリック時の動作
     def on_newbutton_clicked(self):
-        # 新規書籍ID
-        book_dirs = [os.path.basename(bookdir) for bookdir in sorted(glob.glob(os.path.join(".", "BookShelf", "*")))]
-        max_book_id = int(book_dirs[-1]) if len(book_dirs)>0 else 0
-        bookid = f"{max_book_id+1:04d}"
-        
         # 新規書籍フォルダ作成
-        book_dirs = os.path.join(".", "BookShelf", bookid)
-        os.mkdir(book_dirs)
-        
-        # 書籍情報作成
-        json_file = os.path.join(".", "Resource", "blankinfo.json")
-        with open(json_file,'r', encoding="utf-8") as f:
-            book_info = json.load(f)
-        
-        # 書籍ID
-        book_info['id'] = bookid
-        
-        # 出力
-        json_file = os.path.join(book_dirs, "bookinfo.json")
-        with open(json_file, 'w') as fout:
-            json.dump(book_info, fout, indent=4)
-            
-        # 表紙をコピー
-        src = os.path.join(".", "Resource", "front.jpg")
-        dst = os.path.join(book_dirs, "front_original.jpg")
-        shutil.copy(src, dst)
-        # サムネイル
-        qimage = QImage(dst)
-        thum_height = 400
-        thum_width = int(thum_height * qimage.width() / qimage.height())
-        qthum = qimage.scaled(thum_width, thum_height, aspectRatioMode=Qt.KeepAspectRatio)
-        qthum.save(dst.replace('original', 'thumnail'), 'JPEG', quality=100)
-        # 裏表紙コピー
-        src = os.path.join(".", "Resource", "back.jpg")
-        dst = os.path.join(book_dirs, "back_original.jpg")
-        shutil.copy(src, dst) 
-        # サムネイル
-        qimage = QImage(dst)
-        thum_height = 400
-        thum_width = int(thum_height * qimage.width() / qimage.height())
-        qthum = qimage.scaled(thum_width, thum_height, aspectRatioMode=Qt.KeepAspectRatio)
-        qthum.save(dst.replace('original', 'thumnail'), 'JPEG', quality=100)
+        bookid = create_book()
         
         # 書籍編集ページの立ち上げ
         # 親Wigetを辿って、書籍編集ページ立ち上げ
@@ -461,6 +422,7 @@ class BookShelfPage(QWidget):
             # 書籍フォルダを削除
             book_dir = os.path.join(".", "BookShelf", bookid)
             shutil.rmtree(book_dir)
+            thumbnail_cache.invalidate_dir(book_dir)
             
             # 書籍リスト更新
             self.reload_bookshelf()
@@ -508,81 +470,85 @@ class BookShelfPage(QWidget):
         bookinfo = self.books.books[selected_row]
         bookid = bookinfo['id']
         
-        # 一時フォルダ作成
-        tmp_dir = os.path.join(".", f"tmp{bookid}")
-        if os.path.exists(tmp_dir):
-            shutil.rmtree(tmp_dir)
-        os.mkdir(tmp_dir)
-        
-        # 書籍情報を再読み込み
-        json_file = os.path.join(".", "BookShelf", bookid, 'bookinfo.json')
-        with open(json_file,'r', encoding="utf-8") as f:
-            bookinfo = json.load(f)
-        
         # 画像種類
         postfix = "original" if self.imageComboBox.currentIndex() == 0 else "transformed"
         
-        # ページ順のファイルパス一覧を作成
-        book_dir = os.path.join(".", "BookShelf", bookid)
-        image_paths = []
-        if bookinfo['binder']=="left":
-            image_paths = [[os.path.join(book_dir, f"{prefix}_left_{postfix}.jpg"), 
-                            os.path.join(book_dir, f"{prefix}_right_{postfix}.jpg")] \
-                            for prefix in bookinfo['ordered']]
-        else:
-            image_paths = [[os.path.join(book_dir, f"{prefix}_right_{postfix}.jpg"), 
-                            os.path.join(book_dir, f"{prefix}_left_{postfix}.jpg")] \
-                            for prefix in bookinfo['ordered']]
-        if len(image_paths) != 0:
-            # 一次元配列にフラット化
-            image_paths = np.array(image_paths).flatten()
-            # 表紙と裏表紙を追加
-            image_paths = np.insert(image_paths, 0, os.path.join(book_dir, f"front_{postfix}.jpg"))
-            image_paths = np.append(image_paths, os.path.join(book_dir, f"back_{postfix}.jpg"))
-        else:
-            image_paths = [os.path.join(book_dir, f"front_{postfix}.jpg"), os.path.join(book_dir, f"back_{postfix}.jpg")]
-        
-        # ページ順にりネームしてコピー
-        for i, image_file in enumerate(image_paths):
-            src = image_file
-            filename = f"{i:04d}_" + os.path.basename(image_file)
-            dst = os.path.join(tmp_dir, filename)
-            shutil.copy(src, dst)
-        
-        # フォルダ保存の場合
-        if os.path.splitext(dialog.save_path)[1] == "":
-            # 一時フォルダをリネームして移動する
-            src = tmp_dir
-            dst = dialog.save_path
-            shutil.move(src, dst)
-       
-        # tar指定の場合 
-        elif os.path.splitext(dialog.save_path)[1] == ".tar":
-            filename = os.path.basename(dialog.save_path)
-            filename = os.path.splitext(filename)[0]
-            shutil.make_archive(base_name=filename, format="gztar", root_dir=tmp_dir)
-            shutil.rmtree(tmp_dir)
-        
-        # zip指定の場合 
-        elif os.path.splitext(dialog.save_path)[1] == ".zip":
-            filename = os.path.basename(dialog.save_path)
-            filename = os.path.splitext(filename)[0]
-            shutil.make_archive(base_name=filename, format="zip", root_dir=tmp_dir)
-            shutil.rmtree(tmp_dir)
-        
-        # pdf指定の場合 
-        elif os.path.splitext(dialog.save_path)[1] == ".pdf":
-            import img2pdf
-            from PIL import Image
-            image_files = sorted(glob.glob(os.path.join(tmp_dir, "*.jpg")))
-            with open(dialog.save_path, "wb") as f:
-                f.write(img2pdf.convert([Image.open(image_file).filename for image_file in image_files]))
-            shutil.rmtree(tmp_dir)
+        # ページ順にりネームして保存
+        export_book(bookid, dialog.save_path, postfix)
         
         # 完了メッセージを表示
         QMessageBox.information(self, "エクスポート完了", "処理が完了しました。")
 
 
+    # 一括変換ボタンクリック時の動作
+    # 選択中の書籍(未選択の場合は全書籍)の変換済み画像を別プロセスで再作成する
+    def on_transformBookButton_clicked(self):
+        # 実行中の場合はスルー
+        if self.transformProcess is not None:
+            return
+
+        # 対象の書籍
+        indexes = self.bookShelf.selectionModel().selectedRows()
+        if indexes:
+            bookinfo = self.books.books[indexes[0].row()]
+            args = [bookinfo['id']]
+        else:
+            ans = yes_no_dialog('一括変換', '全書籍の変換済み画像を更新しますか？')
+            if ans ==False:
+                return
+            args = ["--all"]
+
+        # 進捗ダイアログ
+        self.transformProgress = QProgressDialog("変換対象を確認中....", "中断", 0, 0, self)
+        self.transformProgress.setWindowTitle("一括変換")
+        self.transformProgress.setWindowModality(Qt.WindowModal)
+        self.transformProgress.setMinimumDuration(0)
+        self.transformProgress.canceled.connect(self.on_transformProgress_canceled)
+
+        # BulkTransform.pyをコマンドラインと同じ形で起動
+        # GUIとは別プロセスのため、変換中もGUIは止まらない
+        script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "BulkTransform.py")
+        self.transformProcess = QProcess(self)
+        self.transformProcess.setWorkingDirectory(os.getcwd())
+        self.transformProcess.readyReadStandardOutput.connect(self.on_transformProcess_output)
+        self.transformProcess.finished.connect(self.on_transformProcess_finished)
+        self.transformProcess.start(sys.executable, [script] + args)
+
+
+    # 一括変換の進捗表示
+    def on_transformProcess_output(self):
+        while self.transformProcess.canReadLine():
+            line = bytes(self.transformProcess.readLine()).decode("utf-8").strip()
+            # "完了数/総数 ファイル名"
+            count, _, filename = line.partition(" ")
+            done, _, total = count.partition("/")
+            if done.isdigit() and total.isdigit():
+                self.transformProgress.setMaximum(int(total))
+                self.transformProgress.setValue(int(done))
+                self.transformProgress.setLabelText(os.path.basename(filename))
+
+
+    # 一括変換の中断
+    # 変換済みの画像は残るため、次回は続きから変換する
+    def on_transformProgress_canceled(self):
+        if self.transformProcess is not None:
+            self.transformProcess.terminate()
+
+
+    # 一括変換終了時の動作
+    def on_transformProcess_finished(self, exitCode, exitStatus):
+        self.transformProgress.canceled.disconnect(self.on_transformProgress_canceled)
+        self.transformProgress.close()
+        self.transformProcess = None
+        if exitCode == 0 and exitStatus == QProcess.NormalExit:
+            QMessageBox.information(self, "一括変換完了", "処理が完了しました。")
+        else:
+            QMessageBox.information(self, "一括変換中断", "変換を中断しました。再実行すると続きから変換します。")
+        # プレビュー更新
+        if self.imageComboBox.currentIndex() == 1 and self.bookShelf.selectionModel().selectedRows():
+            self.on_imageComboBox_change(1)
+
+
     # 画像種類変更時の動作
     def on_imageComboBox_change(self, index):
         # 画像種類
@@ -0,0 +1,175 @@
+import os, glob, shutil
+import json
+from datetime import datetime
+
+# 本棚の書籍フォルダ操作(Qtを使用しない)
+# 本棚ページ、コマンドライン(HeadlessCapture)の両方から使用する
+
+# 本棚フォルダ
+BOOKSHELF_DIR = os.path.join(".", "BookShelf")
+
+# エクスポート形式(拡張子なしはフォルダ)
+EXPORT_FORMATS = ["", ".tar", ".zip", ".pdf"]
+
+
+# 書籍フォルダ
+def book_dir(bookid):
+    return os.path.join(BOOKSHELF_DIR, bookid)
+
+
+# 書籍情報の読み込み
+def load_book_info(bookid):
+    json_file = os.path.join(book_dir(bookid), "bookinfo.json")
+    with open(json_file,'r', encoding="utf-8") as f:
+        return json.load(f)
+
+
+# 書籍情報の保存
+def save_book_info(bookid, book_info):
+    json_file = os.path.join(book_dir(bookid), "bookinfo.json")
+    with open(json_file, 'w') as fout:
+        json.dump(book_info, fout, indent=4)
+
+
+# 本棚からすべての書籍情報を取得
+def load_book_infos():
+    # 書籍一覧
+    book_infos = []
+    for book_path in sorted(glob.glob(os.path.join(BOOKSHELF_DIR, '*'))):
+        # 書籍情報読み取り
+        json_file = os.path.join(book_path, "bookinfo.json")
+        with open(json_file,'r', encoding="utf-8") as f:
+            book_info = json.load(f)
+        # サムネイル
+        book_info["thumbnail"] = os.path.join(book_path, "front_thumnail.jpg")
+        # 追加
+        book_infos.append(book_info)
+    return book_infos
+
+
+# 新規書籍の作成
+# 戻り値: 書籍ID
+def create_book():
+    # サムネイル作成(PIL)は新規作成時のみ読み込む
+    from ThumbnailMaker import make_thumbnail_file
+
+    # 新規書籍ID
+    book_dirs = [os.path.basename(path) for path in sorted(glob.glob(os.path.join(BOOKSHELF_DIR, "*")))]
+    max_book_id = int(book_dirs[-1]) if len(book_dirs)>0 else 0
+    bookid = f"{max_book_id+1:04d}"
+
+    # 新規書籍フォルダ作成
+    os.makedirs(book_dir(bookid))
+
+    # 書籍情報作成
+    json_file = os.path.join(".", "Resource", "blankinfo.json")
+    with open(json_file,'r', encoding="utf-8") as f:
+        book_info = json.load(f)
+    book_info['id'] = bookid
+    save_book_info(bookid, book_info)
+
+    # 表紙、裏表紙をコピーしてサムネイル作成
+    for cover in ["front", "back"]:
+        src = os.path.join(".", "Resource", f"{cover}.jpg")
+        dst = os.path.join(book_dir(bookid), f"{cover}_original.jpg")
+        shutil.copy(src, dst)
+        make_thumbnail_file(dst, dst.replace('original', 'thumnail'))
+    return bookid
+
+
+# 新しい見開きのファイル名の接頭辞(撮影日時)
+# 同じ秒に連続撮影した場合は連番を付与
+def new_spread_prefix(bookid, ordered):
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    prefix, number = timestamp, 1
+    while prefix in ordered or \
+          os.path.exists(os.path.join(book_dir(bookid), prefix + "_left_thumnail.jpg")):
+        prefix = f"{timestamp}_{number}"
+        number += 1
+    return prefix
+
+
+# 見開きを書籍情報のページ並び順へ追加
+# position: 挿入位置(省略時は末尾)
+def add_spread(bookid, prefix, position=None):
+    book_info = load_book_info(bookid)
+    ordered = book_info["ordered"]
+    ordered.insert(len(ordered) if position is None else position, prefix)
+    # 更新日時
+    book_info["moddate"] = datetime.now().strftime("%Y%m%d_%H%M%S")
+    save_book_info(bookid, book_info)
+    return book_info
+
+
+# 見開きを書籍情報のページ並び順から削除(撮影、保存に失敗した場合)
+def remove_spread(bookid, prefix):
+    book_info = load_book_info(bookid)
+    if prefix in book_info["ordered"]:
+        book_info["ordered"].remove(prefix)
+        book_info["moddate"] = datetime.now().strftime("%Y%m%d_%H%M%S")
+        save_book_info(bookid, book_info)
+    return book_info
+
+
+# ページ順の画像ファイル一覧(表紙、本文、裏表紙)
+# postfix: "original" または "transformed"
+def export_image_paths(bookid, postfix="original"):
+    book_info = load_book_info(bookid)
+    path = book_dir(bookid)
+    # 綴じ方向で左右ページの順番が変わる
+    sides = ["left", "right"] if book_info['binder']=="left" else ["right", "left"]
+    image_paths = [os.path.join(path, f"front_{postfix}.jpg")]
+    for prefix in book_info['ordered']:
+        image_paths += [os.path.join(path, f"{prefix}_{side}_{postfix}.jpg") for side in sides]
+    image_paths.append(os.path.join(path, f"back_{postfix}.jpg"))
+    return image_paths
+
+
+# 書籍のエクスポート
+# save_path: 保存先(拡張子なしはフォルダ、.tar、.zip、.pdf)
+# 変換済み画像が古い場合、削除されている場合は作り直す
+def export_book(bookid, save_path, postfix="original"):
+    from DerivedCache import ensure_derived_path
+
+    extension = os.path.splitext(save_path)[1]
+    if extension not in EXPORT_FORMATS:
+        raise ValueError(f"未対応のエクスポート形式: {extension}")
+
+    # 一時フォルダ作成
+    tmp_dir = os.path.join(".", f"tmp{bookid}")
+    if os.path.exists(tmp_dir):
+        shutil.rmtree(tmp_dir)
+    os.mkdir(tmp_dir)
+
+    # ページ順にりネームしてコピー
+    for i, image_file in enumerate(export_image_paths(bookid, postfix)):
+        src = ensure_derived_path(image_file)
+        filename = f"{i:04d}_" + os.path.basename(image_file)
+        shutil.copy(src, os.path.join(tmp_dir, filename))
+
+    # フォルダ保存の場合
+    if extension == "":
+        # 一時フォルダをリネームして移動する
+        shutil.move(tmp_dir, save_path)
+
+    # tar指定の場合
+    elif extension == ".tar":
+        filename = os.path.splitext(os.path.basename(save_path))[0]
+        shutil.make_archive(base_name=filename, format="gztar", root_dir=tmp_dir)
+        shutil.rmtree(tmp_dir)
+
+    # zip指定の場合
+    elif extension == ".zip":
+        filename = os.path.splitext(os.path.basename(save_path))[0]
+        shutil.make_archive(base_name=filename, format="zip", root_dir=tmp_dir)
+        shutil.rmtree(tmp_dir)
+
+    # pdf指定の場合
+    elif extension == ".pdf":
+        import img2pdf
+        from PIL import Image
+        image_files = sorted(glob.glob(os.path.join(tmp_dir, "*.jpg")))
+        with open(save_path, "wb") as f:
+            f.write(img2pdf.convert([Image.open(image_file).filename for image_file in image_files]))
+        shutil.rmtree(tmp_dir)
+    return save_path
@@ -0,0 +1,120 @@
+import os, sys, glob
+import argparse
+import signal
+import multiprocessing
+import cv2
+
+# 派生画像の記録
+from DerivedCache import derived_path, make_transformed_file, book_cache, evict, TMP_SUFFIX
+
+
+# 書籍フォルダの変換対象一覧
+# 元画像、アクリル板の4点座標が変換時から変わった画像、変換済み画像がない画像が対象
+# force: 変換済み画像が最新でも再変換する
+def transform_jobs(book_dir, force=False):
+    cache = book_cache(book_dir)
+    jobs = []
+    for src in sorted(glob.glob(os.path.join(book_dir, "*_original.jpg"))):
+        if force or not cache.is_fresh(src, "transformed"):
+            jobs.append((src, derived_path(src, "transformed"), cache.config_file(src)))
+    return jobs
+
+
+# 1枚の画像変換(ワーカープロセスで呼ばれる)
+def transform_file(job):
+    src, dst, config_file = job
+    make_transformed_file(src, dst, config_file)
+    return src, config_file
+
+
+# ワーカープロセスの初期化
+# プロセス単位で並列化するため、OpenCV内のスレッドは1つにする
+def init_worker():
+    cv2.setNumThreads(1)
+    # 中断は親プロセスで処理し、ワーカーは親からの停止に従う
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+
+
+# 作成途中のファイルを削除
+def remove_tmp_files(book_dirs):
+    for book_dir in book_dirs:
+        for tmp in glob.glob(os.path.join(book_dir, "*" + TMP_SUFFIX)):
+            os.remove(tmp)
+
+
+# 書籍フォルダの変換済み画像を一括で再作成
+# workers: 並列数(省略時はCPUコア数)
+# progress: 1枚終わる毎に呼ばれる関数 progress(完了数, 総数, 変換済み画像ファイル名)
+# cancelled: 中断する場合にTrueを返す関数
+# 変換済みの画像は次回スキップされるため、中断後に再実行すると続きから処理する
+# 戻り値: (完了数, 総数)
+def bulk_transform(book_dirs, workers=None, force=False, progress=None, cancelled=None):
+    jobs = [job for book_dir in book_dirs for job in transform_jobs(book_dir, force)]
+    total = len(jobs)
+    done = 0
+    if total == 0:
+        return done, total
+
+    workers = workers if workers is not None else os.cpu_count()
+    pool = multiprocessing.Pool(processes=min(workers, total), initializer=init_worker)
+    try:
+        for src, config_file in pool.imap_unordered(transform_file, jobs):
+            # 変換済み画像を記録
+            dst = book_cache(os.path.dirname(src)).record(src, "transformed", config_file)
+            done += 1
+            if progress is not None:
+                progress(done, total, dst)
+            if cancelled is not None and cancelled():
+                break
+        else:
+            pool.close()
+            return done, total
+    finally:
+        # 中断、エラー時は処理中のワーカーを停止
+        pool.terminate()
+        pool.join()
+        remove_tmp_files(book_dirs)
+        # 容量上限を超えた変換済み画像を削除
+        evict()
+    return done, total
+
+
+# 本棚の全書籍フォルダ
+def all_book_dirs():
+    return sorted(path for path in glob.glob(os.path.join(".", "BookShelf", "*")) if os.path.isdir(path))
+
+
+# SIGTERMで中断(GUIから停止された場合)
+def on_sigterm(signum, frame):
+    raise KeyboardInterrupt
+
+
+if __name__ == '__main__':
+    # 使い方: python BulkTransform.py 0001 0002 [--workers 4] [--force]
+    #         python BulkTransform.py --all
+    parser = argparse.ArgumentParser(description="書籍の変換済み画像を一括で再作成します")
+    parser.add_argument("bookids", nargs="*", help="書籍ID")
+    parser.add_argument("--all", action="store_true", help="本棚の全書籍を対象にする")
+    parser.add_argument("--workers", type=int, default=None, help="並列数")
+    parser.add_argument("--force", action="store_true", help="変換済み画像が新しくても再変換する")
+    args = parser.parse_args()
+    if args.all:
+        book_dirs = all_book_dirs()
+    else:
+        book_dirs = [os.path.join(".", "BookShelf", bookid) for bookid in args.bookids]
+    if len(book_dirs) == 0:
+        parser.error("書籍IDまたは--allを指定してください")
+
+    signal.signal(signal.SIGTERM, on_sigterm)
+
+    # 進捗表示(1行毎に "完了数/総数 ファイル名")
+    def report(done, total, dst):
+        print(f"{done}/{total} {dst}", flush=True)
+
+    try:
+        done, total = bulk_transform(book_dirs, args.workers, args.force, report)
+    except KeyboardInterrupt:
+        print("中断しました。再実行すると続きから変換します。", flush=True)
+        sys.exit(1)
+    print(f"{done}枚の画像を変換しました", flush=True)
@@ -0,0 +1,101 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# PiCamera2グローバル変数
+from GlobalVariables import picam2s, piconfigs, picapmodes, camera_locks, CAPTURE_MODE_STILL
+
+# 左右撮影のずれ許容値(ミリ秒)
+SKEW_WARNING_MS = 50.0
+
+# 撮影用スレッドプール(カメラ台数分)
+capture_executor = ThreadPoolExecutor(max_workers=len(picam2s), thread_name_prefix="capture")
+
+
+# 1台分の静止画撮影
+# ファイルを経由せずにフレーム(NumPy配列)とメタデータを返却
+# stage_timesを渡すとモード切替(mode_switch)、フレーム取得(sensor)の所要時間(秒)を格納する
+# 撮影中はカメラのロックを保持し、プレビューのコンフィグ変更を待たせる
+def capture_still_array(camid, stage_times=None):
+    with camera_locks[camid]:
+        stage_times = {} if stage_times is None else stage_times
+        stage_times["mode_switch"] = 0.0
+        camera = picam2s[camid]
+        preview_config = None
+        if picapmodes[camid] != CAPTURE_MODE_STILL:
+            # プレビューから静止画へモード切替
+            start = time.perf_counter()
+            preview_config = camera.camera_config
+            camera.switch_mode(piconfigs[camid]["still"])
+            stage_times["mode_switch"] += time.perf_counter() - start
+
+        # 常時静止画コンフィグの場合はモード切替なしで次のフレームを取得
+        start = time.perf_counter()
+        request = camera.capture_request()
+        try:
+            frame = request.make_array("main")
+            metadata = request.get_metadata()
+        finally:
+            request.release()
+        stage_times["sensor"] = time.perf_counter() - start
+
+        # プレビューへ戻す
+        if preview_config is not None:
+            start = time.perf_counter()
+            camera.switch_mode(preview_config)
+            stage_times["mode_switch"] += time.perf_counter() - start
+        return frame, metadata if metadata is not None else {}
+
+
+# 同一カメラの撮影は順番に実施
+def capture_still_arrays(camids, stage_times_list=None):
+    stage_times_list = stage_times_list if stage_times_list is not None else [None] * len(camids)
+    return [capture_still_array(camid, stage_times) for camid, stage_times in zip(camids, stage_times_list)]
+
+
+# 複数カメラの同時撮影
+# camids: [カメラ番号, ...]
+# stage_times_list: camidsと同じ並びの所要時間の格納先(省略可)
+# 戻り値: camidsと同じ並びの(フレーム, メタデータ)一覧
+def capture_arrays_parallel(camids, stage_times_list=None):
+    stage_times_list = stage_times_list if stage_times_list is not None else [{} for _ in camids]
+    # カメラ毎にまとめる
+    groups = {}
+    for ijob, camid in enumerate(camids):
+        groups.setdefault(camid, []).append(ijob)
+
+    # カメラ毎にスレッドで撮影開始
+    futures = []
+    for camid, ijobs in groups.items():
+        future = capture_executor.submit(capture_still_arrays, [camid] * len(ijobs),
+                                         [stage_times_list[ijob] for ijob in ijobs])
+        futures.append((ijobs, future))
+
+    # 撮影完了待ち
+    results = [None] * len(camids)
+    for ijobs, future in futures:
+        for ijob, result in zip(ijobs, future.result()):
+            results[ijob] = result
+    return results
+
+
+# 左右のセンサタイムスタンプのずれ(ミリ秒)
+# タイムスタンプが取得できない場合はNone
+def sensor_timestamp_skew(left_metadata, right_metadata):
+    left = left_metadata.get("SensorTimestamp") if left_metadata else None
+    right = right_metadata.get("SensorTimestamp") if right_metadata else None
+    if left is None or right is None:
+        return None
+    # SensorTimestampはナノ秒
+    return abs(left - right) / 1e6
+
+
+# 左右撮影のずれを確認して表示
+def report_timestamp_skew(left_metadata, right_metadata):
+    skew = sensor_timestamp_skew(left_metadata, right_metadata)
+    if skew is None:
+        return None
+    if skew > SKEW_WARNING_MS:
+        print(f"警告: 左右撮影のずれが大きいです {skew:.1f} ms")
+    else:
+        print(f"左右撮影のずれ: {skew:.1f} ms")
+    return skew
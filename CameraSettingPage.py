@@ -5,7 +5,7 @@ import numpy as np
 import cv2
 
 # Qt関係
-from PyQt5.QtCore import Qt, QTimer
+from PyQt5.QtCore import Qt, QTimer, pyqtSignal
 from PyQt5.QtWidgets import QApplication, QMainWindow, QWidget, QFileDialog
 from PyQt5.QtWidgets import QTabWidget, QFrame
 from PyQt5.QtWidgets import QHBoxLayout, QVBoxLayout, QFormLayout
@@ -16,17 +16,31 @@ from PyQt5.QtGui import QPainter, QPalette
 from PyQt5.QtGui import QImage, QPixmap, QTransform
 from PyQt5.QtCore import QPointF
 # カスタムWidget
-from CustomQWidgets import logControlSlider, controlSlider, QCircleLabel
+from CustomQWidgets import logControlSlider, controlSlider, QCircleLabel, QLivePlot
 from CustomQCameraPreview import CustomQCameraPreview
 from CustomQImageViewer2 import CustomQImageViewer2
 
-# PiCamera2関係
-from picamera2 import Picamera2, Preview
-from picamera2.previews.qt import QGlPicamera2
-from libcamera import Transform
-
 # PiCamera2グローバル変数
 from GlobalVariables import picam2s, piconfigs, pimetadatas, configfiles
+from GlobalVariables import picapmodes, update_piconfigs, active_piconfig, camera_locks
+# コンフィグファイルのキャッシュ
+from ConfigStore import config_store
+# カメラ毎のプレビューフレーム配信
+from FrameBroker import frame_broker
+# フォーカス評価値
+from FocusMetric import FocusMeter
+
+# 静止画撮影
+from CameraCapture import capture_still_array
+from CaptureProcess import rotate_frame
+
+# フォーカス評価値のグラフの表示期間(秒)、更新間隔(ミリ秒)、色
+FOCUS_PLOT_SECONDS = 10.0
+FOCUS_PLOT_INTERVAL = 100
+FOCUS_PLOT_COLORS = [Qt.red, Qt.cyan]
+
+# カメラ使用中でコンフィグを反映できない場合の再試行間隔(ミリ秒)
+CONFIG_RETRY_DELAY = 200
 
 # 基本設定タブ
 class BasicSettingTab(QTabWidget):
@@ -73,6 +87,13 @@ class BasicSettingTab(QTabWidget):
         self.sensorFormat.setEnabled(False)
         formLayout.addRow("センサーモード", self.sensorFormat)
         
+        # 撮影モードのコンボボックス
+        # 0:撮影毎にモード切替、1:常時静止画コンフィグ(プレビューはlores)
+        self.captureMode = QComboBox()
+        self.captureMode.addItems(["撮影毎にモード切替", "常時静止画(モード切替なし)"])
+        self.captureMode.setCurrentIndex(picapmodes[camid])
+        formLayout.addRow("撮影モード", self.captureMode)
+        
         # 画像幅のスピンボックス
         self.imageWidth = QSpinBox()
         self.imageWidth.setMaximum(self.current_sensor_mode["size"][0])
@@ -92,6 +113,8 @@ class BasicSettingTab(QTabWidget):
         # 画像の縦横サイズを変更時は反映ボタンを有効化
         self.imageWidth.valueChanged.connect(lambda: self.resButton.setEnabled(True))
         self.imageHeight.valueChanged.connect(lambda: self.resButton.setEnabled(True))
+        # 撮影モード変更時も反映ボタンを有効化
+        self.captureMode.currentIndexChanged.connect(lambda: self.resButton.setEnabled(True))
         
         # 画像サイズ
         resolution = QWidget()
@@ -125,50 +148,39 @@ class BasicSettingTab(QTabWidget):
 
 
     # カメラコンフィグ更新
+    # 戻り値: 反映した場合True、静止画撮影中、プレビューのサイズ変更中で反映できない場合False
     def update_basic_config(self):
-        # カメラ停止
-        picam2s[self.camid].stop()
-        
-        # 静止画コンフィグ更新
-        piconfigs[self.camid]["still"]['main']['size'] = (self.imageWidth.value(), self.imageHeight.value())
-        piconfigs[self.camid]["still"]['raw'] = self.current_sensor_mode
-        
-        # プレビューコンフィグ更新
-        piconfigs[self.camid]["preview"]['main']['format'] = "BGR888"
-        preview_width = self.imageWidth.value() if self.imageWidth.value() < 2000 else 2000
-        preview_height = int(preview_width* (self.imageHeight.value() / self.imageWidth.value()))
-        preview_height = preview_height if preview_height%2==0 else preview_height-1
-        piconfigs[self.camid]["preview"]['main']['size'] = (preview_width, preview_height)
-        piconfigs[self.camid]["preview"]['raw'] = self.current_sensor_mode
-        
-        # カメラコンフィグ設定
-        picam2s[self.camid].configure(piconfigs[self.camid]["preview"])  
-              
-        # カメラ開始
-        picam2s[self.camid].start()
+        if not camera_locks[self.camid].acquire(blocking=False):
+            return False
+        try:
+            # カメラ停止
+            picam2s[self.camid].stop()
+            
+            # 撮影モード更新
+            picapmodes[self.camid] = self.captureMode.currentIndex()
+            
+            # 静止画、プレビューコンフィグ更新
+            update_piconfigs(self.camid, self.imageWidth.value(), self.imageHeight.value(), self.current_sensor_mode)
+            
+            # カメラコンフィグ設定
+            picam2s[self.camid].configure(active_piconfig(self.camid))  
+                  
+            # カメラ開始
+            picam2s[self.camid].start()
+        finally:
+            camera_locks[self.camid].release()
+        return True
     
     
     # 画像サイズの反映ボタンをクリック時の動作
     def on_resButton_clicked(self):
-        # 静止画用コンフィグの画像サイズ更新
-        piconfigs[self.camid]["still"]['main']['size'] = (self.imageWidth.value(), self.imageHeight.value())
-        
-        # プレビュー用コンフィグの画像サイズ更新
-        piconfigs[self.camid]["preview"]['main']['format'] = "BGR888"
-        preview_width = self.imageWidth.value() if self.imageWidth.value() < 2000 else 2000
-        preview_height = int(preview_width* (self.imageHeight.value() / self.imageWidth.value()))
-        preview_height = preview_height if preview_height%2==0 else preview_height-1
-        piconfigs[self.camid]["preview"]['main']['size'] = (preview_width, preview_height)
-        
-        # カメラ停止
-        picam2s[self.camid].stop()
-        # プレビューコンフィグ更新
-        picam2s[self.camid].configure(piconfigs[self.camid]["preview"])        
-        # カメラ開始
-        picam2s[self.camid].start()
-        
         # 反映ボタン無効化
         self.resButton.setEnabled(False)
+        
+        # カメラ停止、コンフィグ更新、カメラ開始
+        # 静止画撮影中の場合は完了を待って再試行
+        if not self.update_basic_config():
+            QTimer.singleShot(CONFIG_RETRY_DELAY, self.on_resButton_clicked)
     
     
     # 回転ボタンをクリック時の動作
@@ -325,6 +337,9 @@ class ImageTuningTab(QTabWidget):
 
 # フォーカス設定ページ
 class FocusSettingPage(QWidget):
+    # フォーカスピーキングの表示切り替え
+    peakingChanged = pyqtSignal(bool)
+    
     # 初期化
     def __init__(self, camid):        
         # 初期化
@@ -491,6 +506,60 @@ class FocusSettingPage(QWidget):
     
         # MF初期値のため無効化
         self.afWidget.setEnabled(False)
+        
+        # フォーカス評価用Widget
+        evalWidget = QWidget()
+        topVBoxLayout.addWidget(evalWidget)
+        
+        # フォーカス評価用フォームレイアウト
+        evalLayout = QFormLayout()
+        evalWidget.setLayout(evalLayout)
+        
+        # フォーカスピーキング
+        self.peakingCheck = QCheckBox("合焦部分を表示")
+        self.peakingCheck.toggled.connect(self.peakingChanged.emit)
+        evalLayout.addRow("フォーカスピーキング", self.peakingCheck)
+        
+        # 評価値(ラプラシアンの分散)のグラフ
+        # 両カメラの評価値を表示し、選択中のカメラを強調
+        self.focusPlot = QLivePlot(FOCUS_PLOT_SECONDS)
+        evalLayout.addRow(self.focusPlot)
+        
+        # カメラ毎のフォーカス評価
+        # フレームはカメラ毎の配信から受け取り、ページの表示中のみ購読する
+        self.focusMeters = [FocusMeter(f"camera{i}") for i in range(len(picam2s))]
+        
+        # 評価値更新タイマ
+        # ページの表示中のみ動作(showEvent、hideEventで開始、停止)
+        self.focusTimer = QTimer(self)
+        self.focusTimer.timeout.connect(self.update_focus_plot)
+        self.focusTimer.setInterval(FOCUS_PLOT_INTERVAL)
+
+
+    # ページ表示時に評価を開始
+    def showEvent(self, event):
+        for camera, meter in zip(picam2s, self.focusMeters):
+            frame_broker(camera).subscribe(meter.on_frame)
+        self.focusTimer.start()
+        super().showEvent(event)
+
+
+    # ページ非表示時(非アクティブなタブ)に評価を停止
+    def hideEvent(self, event):
+        for camera, meter in zip(picam2s, self.focusMeters):
+            frame_broker(camera).unsubscribe(meter.on_frame)
+        self.focusTimer.stop()
+        super().hideEvent(event)
+
+
+    # 評価値の計算とグラフ更新
+    def update_focus_plot(self):
+        series = []
+        for camid, meter in enumerate(self.focusMeters):
+            meter.measure()
+            times, history = meter.history.history(["Laplacian"], FOCUS_PLOT_SECONDS)
+            series.append((f"camera{camid}", FOCUS_PLOT_COLORS[camid], times, history["Laplacian"], camid == self.camid))
+        self.focusPlot.setSeries(series)
 
 
     # フォーカス方式変更時の動作
@@ -846,6 +915,9 @@ class CameraSettingPage(QWidget):
         # AF/MF、Pan/Zoom、AEC/AWBタブ
         self.controlTabs = CameraControlTab(camid, self.imageTransView)
         self.controlTabs.currentChanged.connect(self.on_controlTabs_changed)
+        # フォーカスピーキングの表示切り替え
+        self.controlTabs.focusPage.peakingChanged.connect(self.cameraPreview0.set_focus_peaking)
+        self.controlTabs.focusPage.peakingChanged.connect(self.cameraPreview1.set_focus_peaking)
         
         # Widget配置
         # 最上位水平レイアウト
@@ -912,9 +984,22 @@ class CameraSettingPage(QWidget):
         picam2s[1].start()
         
         # widgets更新タイマ
+        # ページの表示中のみ動作(showEvent、hideEventで開始、停止)
         self.timer = QTimer(self)
         self.timer.timeout.connect(self.update_realtime_widgets)
-        self.timer.start(30)
+        self.timer.setInterval(30)
+
+
+    # ページ表示時にタイマ再開
+    def showEvent(self, event):
+        self.timer.start()
+        super().showEvent(event)
+
+
+    # ページ非表示時(非アクティブなタブ)にタイマ停止
+    def hideEvent(self, event):
+        self.timer.stop()
+        super().hideEvent(event)
 
 
     # カメラプレビュー回転
@@ -939,7 +1024,9 @@ class CameraSettingPage(QWidget):
         camid = self.cameraSelect.currentIndex()
         
         # メタ情報更新
-        self.controlTabs.metaInfo.setText(pimetadatas[camid])
+        # タブの表示中のみ整形(新しいフレームがなければ前回の文字列)
+        if self.controlTabs.currentWidget() is self.controlTabs.metaInfo:
+            self.controlTabs.metaInfo.setText(pimetadatas[camid].text())
         
         # アクリル板の4点座標を更新
         for ivert, circle in enumerate(self.imageTransView.ellipses):
@@ -973,16 +1060,13 @@ class CameraSettingPage(QWidget):
         filename = datetime.now().strftime("%Y%m%d_%H%M%S") + f"_{'left' if namerule==0 else 'right'}" + f".{filetype}"
         
         # 静止画撮影
-        picam2s[camid].switch_mode_and_capture_file(piconfigs[camid]["still"], filename)
+        frame, _ = capture_still_array(camid)
         
         # 回転変換
-        qimage = QImage(filename)
-        rotate_angle = self.basicSettingTab.rotate_angle
-        transform = QTransform().rotate(rotate_angle)
-        qimage = qimage.transformed(transform)
+        frame = rotate_frame(frame, self.basicSettingTab.rotate_angle)
         
         # ファイル出力
-        qimage.save(filename)
+        cv2.imwrite(filename, frame)
         
         '''
         # カメラ停止
@@ -1032,9 +1116,9 @@ class CameraSettingPage(QWidget):
 
     # コンフィグファイルの設定反映
     def load_camera_configure(self, config_file):
-        # コンフィグファイル読み込み
-        with open(config_file,'r', encoding="utf-8") as f:
-            config = json.load(f)
+        # コンフィグファイル読み込み(キャッシュから取得、更新されていれば読み直す)
+        config_store.check(config_file)
+        config = config_store.get(config_file)
         
         # 基本設定
         # 命名規則
@@ -1058,6 +1142,10 @@ class CameraSettingPage(QWidget):
         text = f"{self.basicSettingTab.rotAngles[self.basicSettingTab.rotIndex]:3d}度"
         self.basicSettingTab.rotLabel.setText(text)
         
+        # 撮影モード
+        index = config["BasicSetting"].get("CaptureMode", 0)
+        self.basicSettingTab.captureMode.setCurrentIndex(index)
+        
         # 基本設定の反映
         self.basicSettingTab.update_basic_config()
         
@@ -1158,6 +1246,9 @@ class CameraSettingPage(QWidget):
         # 回転角度
         config["BasicSetting"]["RoteIndex"] = self.basicSettingTab.rotIndex
         
+        # 撮影モード
+        config["BasicSetting"]["CaptureMode"] = self.basicSettingTab.captureMode.currentIndex()
+        
         # 画質調整
         config["ImageTuning"] = {}
         
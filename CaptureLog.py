@@ -0,0 +1,147 @@
+import os
+import json
+import time
+import argparse
+import threading
+from collections import deque
+import numpy as np
+
+# 書籍フォルダ毎の処理時間ログ(1行1件のJSON)
+LOG_FILE = "capturelog.jsonl"
+
+# 処理段階
+# mode_switch: プレビュー<->静止画のモード切替
+# sensor: センサからのフレーム取得
+# rotate, original, thumbnail, transform: 回転、オリジナル保存(JPEG)、サムネイル、射影変換
+# reload: 見開き一覧のサムネイル再読み込み
+# bookinfo: bookinfo.jsonの書き込み
+# sound: シャッター音の再生開始
+STAGES = ["mode_switch", "sensor", "rotate", "original", "thumbnail", "transform", "reload", "bookinfo", "sound"]
+STAGE_NAMES = {
+    "mode_switch": "モード切替",
+    "sensor": "センサ取得",
+    "rotate": "回転",
+    "original": "JPEG保存",
+    "thumbnail": "サムネイル",
+    "transform": "射影変換",
+    "reload": "サムネイル更新",
+    "bookinfo": "書籍情報保存",
+    "sound": "シャッター音",
+}
+
+# 集計用に保持する直近の件数
+RECENT_RECORDS = 1000
+
+
+# 見開き名とページの左右(オリジナル画像のファイル名から)
+# 同じ見開きの記録を結合できるよう、記録のpageは左右共通の見開き名にして、左右はsideに記録する
+# 表紙、裏表紙の場合はsideなし
+def spread_side(filename):
+    name = os.path.basename(filename).replace("_original", "").rsplit(".", 1)[0]
+    for side in ["left", "right"]:
+        if name.endswith("_" + side):
+            return name[:-len(side) - 1], side
+    return name, None
+
+
+# 処理時間ログ
+# 撮影、後処理の各スレッドから追記される
+class CaptureLog:
+    def __init__(self, book_dir):
+        self.path = os.path.join(book_dir, LOG_FILE)
+        # 直近の記録(集計用)
+        self.recent = deque(maxlen=RECENT_RECORDS)
+        self.lock = threading.Lock()
+
+    # 1件追記
+    # page: 見開き名、side: 左右(見開き単位の処理はNone)
+    # seconds: 処理時間(秒)、fields: カメラ番号など追加の項目
+    def append(self, page, stage, seconds, side=None, **fields):
+        record = {"time": round(time.time(), 3), "page": page, "side": side, "stage": stage, "ms": round(seconds * 1000, 2)}
+        record.update(fields)
+        with self.lock:
+            self.recent.append(record)
+            if not os.path.isdir(os.path.dirname(self.path)):
+                # 書籍フォルダが削除されている場合
+                return record
+            with open(self.path, 'a', encoding="utf-8") as fout:
+                fout.write(json.dumps(record, ensure_ascii=False) + "\n")
+        return record
+
+    # 処理段階毎の所要時間(秒)をまとめて追記
+    def append_stages(self, page, stage_times, side=None, **fields):
+        for stage, seconds in stage_times.items():
+            self.append(page, stage, seconds, side, **fields)
+
+    # 直近の記録の集計
+    def summary(self):
+        with self.lock:
+            records = list(self.recent)
+        return summarize(records)
+
+
+# 書籍フォルダ毎のログ(プロセス内で共有)
+logs = {}
+logs_lock = threading.Lock()
+
+def book_log(book_dir):
+    key = os.path.normpath(book_dir)
+    with logs_lock:
+        if key not in logs:
+            logs[key] = CaptureLog(key)
+        return logs[key]
+
+
+# ログファイルの読み込み
+# last: 処理段階毎に直近の件数のみ使用
+def load_records(path, last=None):
+    records = []
+    with open(path, 'r', encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                records.append(json.loads(line))
+    if last is not None:
+        counts = {}
+        kept = []
+        for record in reversed(records):
+            counts[record["stage"]] = counts.get(record["stage"], 0) + 1
+            if counts[record["stage"]] <= last:
+                kept.append(record)
+        records = kept[::-1]
+    return records
+
+
+# 処理段階毎の集計
+# 戻り値: {処理段階: (件数, p50, p95, 最大)} (ミリ秒)
+def summarize(records):
+    values = {}
+    for record in records:
+        values.setdefault(record["stage"], []).append(record["ms"])
+    summary = {}
+    for stage in STAGES + sorted(set(values) - set(STAGES)):
+        if stage in values:
+            ms = np.array(values[stage])
+            summary[stage] = (len(ms), float(np.percentile(ms, 50)), float(np.percentile(ms, 95)), float(ms.max()))
+    return summary
+
+
+# 集計結果の表示用テキスト
+def format_summary(summary):
+    lines = [f"{'処理':12s} {'件数':>6s} {'p50(ms)':>10s} {'p95(ms)':>10s} {'最大(ms)':>10s}"]
+    for stage, (count, p50, p95, maximum) in summary.items():
+        name = STAGE_NAMES.get(stage, stage)
+        lines.append(f"{name:12s} {count:6d} {p50:10.1f} {p95:10.1f} {maximum:10.1f}")
+    return "\n".join(lines)
+
+
+if __name__ == '__main__':
+    # 使い方: python CaptureLog.py 0001 [--last 100]
+    parser = argparse.ArgumentParser(description="書籍の撮影処理時間ログを集計します")
+    parser.add_argument("bookid", help="書籍ID")
+    parser.add_argument("--last", type=int, default=None, help="処理段階毎に直近の件数のみ集計")
+    args = parser.parse_args()
+    path = os.path.join(".", "BookShelf", args.bookid, LOG_FILE)
+    if not os.path.exists(path):
+        parser.error(f"ログがありません: {path}")
+    print(format_summary(summarize(load_records(path, args.last))))
@@ -0,0 +1,94 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# 静止画撮影
+from CameraCapture import capture_arrays_parallel, report_timestamp_skew
+# 撮影後の画像処理
+from CaptureProcess import save_page_images
+# 派生画像の記録
+from DerivedCache import record_derived, evict_if_needed
+# 処理時間ログ
+from CaptureLog import book_log, spread_side
+
+# 撮影から保存までの処理(Qtを使用しない)
+# GUIのCaptureWorker、コマンドライン(HeadlessCapture)の両方から使用する
+
+# 処理待ちキューの上限(フレーム数)
+# 12MPのフレーム1枚で約35MBのため、上限でメモリ使用量を抑える
+MAX_QUEUED_FRAMES = 4
+
+# 後処理のワーカー数
+POSTPROCESS_WORKERS = 2
+
+# 後処理用スレッドプール
+# 回転、JPEGエンコード、射影変換はOpenCV内でGILを解放するためスレッドで並列化できる
+postprocess_executor = ThreadPoolExecutor(max_workers=POSTPROCESS_WORKERS, thread_name_prefix="postprocess")
+
+
+# 左右同時撮影
+# captures: [(カメラ番号, オリジナル画像ファイル名, 回転角度, コンフィグファイル), ...]
+# 戻り値: capturesと同じ並びの(フレーム, メタデータ)一覧
+def capture_pages(captures):
+    stage_times_list = [{} for _ in captures]
+    results = capture_arrays_parallel([camid for camid, _, _, _ in captures], stage_times_list)
+    # モード切替、フレーム取得の所要時間を記録
+    for (camid, filename, _, _), stage_times in zip(captures, stage_times_list):
+        spread, side = spread_side(filename)
+        book_log(os.path.dirname(filename)).append_stages(spread, stage_times, side, camera=camid)
+    # 左右撮影のずれ確認
+    if len(results) == 2:
+        report_timestamp_skew(results[0][1], results[1][1])
+    return results
+
+
+# 1ページ分の後処理
+# オリジナル、サムネイル、変換済み画像を保存して、処理時間と派生画像の作成元を記録
+def postprocess_page(frame, filename, rotate_angle, config_file):
+    stage_times = {}
+    save_page_images(frame, filename, rotate_angle, config_file, stage_times)
+    spread, side = spread_side(filename)
+    book_log(os.path.dirname(filename)).append_stages(spread, stage_times, side)
+    # サムネイル、変換済み画像の作成元をまとめて記録
+    record_derived(filename, ["thumbnail", "transformed"], config_file)
+    evict_if_needed()
+    return stage_times
+
+
+# 撮影と後処理のパイプライン(Qtなし)
+# 処理待ちのフレームが上限に達している間は、次の撮影を待たせる
+class CapturePipeline:
+    def __init__(self, max_frames=MAX_QUEUED_FRAMES):
+        self.max_frames = max_frames
+        self.slots = threading.Semaphore(max_frames)
+        self.futures = []
+
+    # 撮影して後処理を登録
+    # 戻り値: 後処理のfuture一覧
+    def capture(self, captures):
+        for _ in captures:
+            self.slots.acquire()
+        try:
+            results = capture_pages(captures)
+        except Exception:
+            for _ in captures:
+                self.slots.release()
+            raise
+        futures = []
+        for (camid, filename, rotate_angle, config_file), (frame, _) in zip(captures, results):
+            future = postprocess_executor.submit(postprocess_page, frame, filename, rotate_angle, config_file)
+            future.add_done_callback(lambda future: self.slots.release())
+            futures.append(future)
+            self.futures.append((filename, future))
+        return futures
+
+    # すべての後処理の完了待ち
+    # 戻り値: [(オリジナル画像ファイル名, エラー), ...]
+    def wait(self):
+        errors = []
+        for filename, future in self.futures:
+            error = future.exception()
+            if error is not None:
+                errors.append((filename, error))
+        self.futures = []
+        return errors
@@ -0,0 +1,63 @@
+import time
+import numpy as np
+import cv2
+
+# 画像変換
+import ImageTransform
+
+# サムネイル画像の高さ
+THUMBNAIL_HEIGHT = 400
+
+# オリジナル、サムネイル画像のJPEG品質
+JPEG_QUALITY = 100
+
+# フレームの回転変換(時計回り、90度単位)
+# np.rot90は画素をコピーせずにビューを返すため、エンコード時の1回のみ画素が並び替えられる
+# 90度単位の回転は画素の並び替えのみで、画質は劣化しない
+def rotate_frame(frame, rotate_angle):
+    k = (rotate_angle % 360) // 90
+    return np.rot90(frame, -k)
+
+
+# サムネイル画像作成
+# 回転前の画像を縮小してから回転するため、大きな画像の回転は不要
+def make_thumbnail(image, thum_height=THUMBNAIL_HEIGHT, rotate_angle=0):
+    height, width = image.shape[:2]
+    if rotate_angle % 180 == 90:
+        height, width = width, height
+    thum_width = int(thum_height * width / height)
+    # 回転前の縮小サイズ(幅, 高さ)
+    size = (thum_width, thum_height) if rotate_angle % 180 == 0 else (thum_height, thum_width)
+    thumbnail = cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+    return rotate_frame(thumbnail, rotate_angle)
+
+
+# JPEG保存
+def save_jpeg(filename, image, quality=JPEG_QUALITY):
+    cv2.imwrite(filename, image, [cv2.IMWRITE_JPEG_QUALITY, quality])
+
+
+# 撮影フレームからオリジナル、サムネイル、変換済み画像を保存
+# フレームはBGR順のNumPy配列、各画像はそれぞれ1回だけエンコード
+# stage_timesを渡すと各処理の所要時間(秒)を格納する
+def save_page_images(frame, filename, rotate_angle, config_file, stage_times=None):
+    stage_times = {} if stage_times is None else stage_times
+    # 回転変換(ビューのみ作成)
+    start = time.perf_counter()
+    image = rotate_frame(frame, rotate_angle)
+    stage_times["rotate"] = time.perf_counter() - start
+    # オリジナル画像
+    start = time.perf_counter()
+    save_jpeg(filename, image)
+    stage_times["original"] = time.perf_counter() - start
+    # サムネイル画像
+    start = time.perf_counter()
+    save_jpeg(filename.replace('original', 'thumnail'), make_thumbnail(frame, rotate_angle=rotate_angle))
+    stage_times["thumbnail"] = time.perf_counter() - start
+    # 変換済み画像
+    # 回転は射影変換行列に含めて、回転前のフレームから直接変換
+    start = time.perf_counter()
+    image_trans = ImageTransform.transform(frame, config_file, rotate_angle)
+    cv2.imwrite(filename.replace('original', 'transformed'), image_trans)
+    stage_times["transform"] = time.perf_counter() - start
+    return stage_times
@@ -0,0 +1,142 @@
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+# Qt関係
+from PyQt5.QtCore import QObject, pyqtSignal
+
+# 撮影、後処理(Qtなしの共通処理)
+from CapturePipeline import capture_pages, postprocess_page, postprocess_executor
+from CapturePipeline import MAX_QUEUED_FRAMES, POSTPROCESS_WORKERS
+
+# 処理段階(撮影、回転とオリジナル/サムネイル保存、射影変換)
+STAGES = ["capture", "save", "transform"]
+STAGE_NAMES = {"capture": "撮影", "save": "保存", "transform": "変換"}
+
+# 撮影開始用スレッド
+# 撮影スレッドプールとは分けて、左右同時撮影の完了待ちを行う
+trigger_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="trigger")
+
+
+# 撮影と後処理のパイプライン
+# 撮影したフレームは上限付きのキューに入り、後処理が追いつかない間は撮影を受け付けない
+# 完了通知はQtシグナルでGUIスレッドへ届ける
+class CaptureWorker(QObject):
+    # 撮影完了(フレームはキュー投入済み)
+    captured = pyqtSignal()
+    # 撮影失敗(エラーメッセージ, オリジナル画像ファイル名の一覧)
+    captureFailed = pyqtSignal(str, list)
+    # 後処理完了(オリジナル画像ファイル名)
+    finished = pyqtSignal(str)
+    # 後処理失敗(オリジナル画像ファイル名, エラーメッセージ)
+    failed = pyqtSignal(str, str)
+    # キュー状態、処理速度の更新
+    statsChanged = pyqtSignal()
+
+    def __init__(self, parent=None, max_frames=MAX_QUEUED_FRAMES):
+        super().__init__(parent)
+        # キューの上限
+        self.max_frames = max_frames
+        # キュー内、処理中のフレーム数
+        self.pending = 0
+        # 撮影中フラグ
+        self.capturing = False
+        # 処理段階ごとの(処理枚数, 処理時間)の履歴
+        self.stage_history = {stage: deque(maxlen=20) for stage in STAGES}
+        self.captured.connect(self.on_captured)
+        self.captureFailed.connect(self.on_capture_failed)
+        self.finished.connect(self.on_job_done)
+        self.failed.connect(self.on_job_done)
+
+    # 次の撮影を受け付けられるか
+    def can_accept(self, frames=2):
+        return not self.capturing and self.pending + frames <= self.max_frames
+
+    # 撮影と後処理の登録
+    # captures: [(カメラ番号, オリジナル画像ファイル名, 回転角度, コンフィグファイル), ...]
+    def capture(self, captures):
+        self.capturing = True
+        self.pending += len(captures)
+        self.statsChanged.emit()
+        future = trigger_executor.submit(self.run_capture, captures)
+        return future
+
+    # 撮影(撮影開始用スレッドで呼ばれる)
+    def run_capture(self, captures):
+        try:
+            start = time.perf_counter()
+            results = capture_pages(captures)
+            self.stage_history["capture"].append((len(captures), time.perf_counter() - start))
+        except Exception as error:
+            self.emit_safely(self.captureFailed, str(error), [filename for _, filename, _, _ in captures])
+            return None
+
+        # フレームを後処理のキューへ投入
+        for (camid, filename, rotate_angle, config_file), (frame, _) in zip(captures, results):
+            self.submit(frame, filename, rotate_angle, config_file)
+        self.emit_safely(self.captured)
+        return results
+
+    # 後処理の登録
+    def submit(self, frame, filename, rotate_angle, config_file):
+        future = postprocess_executor.submit(self.run_postprocess, frame, filename, rotate_angle, config_file)
+        future.add_done_callback(lambda future: self.on_future_done(future, filename))
+        return future
+
+    # 後処理(後処理用スレッドで呼ばれる)
+    def run_postprocess(self, frame, filename, rotate_angle, config_file):
+        stage_times = postprocess_page(frame, filename, rotate_angle, config_file)
+        self.stage_history["save"].append((1, stage_times["rotate"] + stage_times["original"] + stage_times["thumbnail"]))
+        self.stage_history["transform"].append((1, stage_times["transform"]))
+        return stage_times
+
+    # 撮影終了時の動作(GUIスレッドで呼ばれる)
+    def on_captured(self, *args):
+        self.capturing = False
+        self.statsChanged.emit()
+
+    # 撮影失敗時の動作(GUIスレッドで呼ばれる)
+    def on_capture_failed(self, message, filenames):
+        self.pending -= len(filenames)
+        self.on_captured()
+
+    # 処理件数の更新(GUIスレッドで呼ばれる)
+    def on_job_done(self, *args):
+        self.pending -= 1
+        self.statsChanged.emit()
+
+    # 後処理終了時(後処理用スレッドで呼ばれる)
+    def on_future_done(self, future, filename):
+        error = future.exception()
+        if error is None:
+            self.emit_safely(self.finished, filename)
+        else:
+            self.emit_safely(self.failed, filename, str(error))
+
+    # ワーカースレッドからのシグナル送信
+    def emit_safely(self, signal, *args):
+        try:
+            signal.emit(*args)
+        except RuntimeError:
+            # 書籍編集ページが閉じられている場合
+            pass
+
+    # 処理段階ごとの処理速度(枚/分)
+    # 計測前はNone
+    def throughput(self, stage):
+        history = list(self.stage_history[stage])
+        count = sum(items for items, _ in history)
+        duration = sum(seconds for _, seconds in history)
+        if count == 0 or duration <= 0:
+            return None
+        workers = POSTPROCESS_WORKERS if stage != "capture" else 1
+        return count * 60.0 / duration * workers
+
+    # キュー状態、処理速度の表示用テキスト
+    def stats_text(self):
+        texts = [f"処理待ち {self.pending}/{self.max_frames}"]
+        for stage in STAGES:
+            rate = self.throughput(stage)
+            rate = "-" if rate is None else f"{rate:.0f}"
+            texts.append(f"{STAGE_NAMES[stage]} {rate}枚/分")
+        return "  ".join(texts)
@@ -0,0 +1,127 @@
+import os
+import json
+import time
+import threading
+
+# コンフィグファイルの読み込みと変更検知(Qtを使用しない)
+# 読み込んだ内容はメモリに保持し、ファイルが更新された場合のみ読み直す
+# GUIではConfigWatcher(QFileSystemWatcher)が変更を検知してQtシグナルで通知する
+
+# コンフィグフォルダ
+CONFIGURE_DIR = os.path.join(".", "Configure")
+
+# カメラ毎のコンフィグファイル
+CAMERA_CONFIG_FILES = [
+    os.path.join(CONFIGURE_DIR, "camera0_configure_recommend.json"),
+    os.path.join(CONFIGURE_DIR, "camera1_configure_recommend.json")]
+
+# ファイル更新の確認間隔(秒)
+# 変更通知がない環境(コマンドライン、ワーカープロセス)でも、この間隔で更新を確認する
+CHECK_INTERVAL = 1.0
+
+
+# ファイルの更新情報(更新時刻, サイズ)
+# ファイルがない場合はNone
+def file_signature(path):
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+# コンフィグファイルのキャッシュ
+# 返す辞書は呼び出し元で共有するため書き換えない
+class ConfigStore:
+    def __init__(self, check_interval=CHECK_INTERVAL):
+        self.check_interval = check_interval
+        # ファイル毎の(更新情報, 内容, 最終確認時刻)
+        self.entries = {}
+        # 変更時に呼び出す関数(パス, 内容)
+        # パスごと、およびNone(全ファイル)
+        self.callbacks = {}
+        self.lock = threading.Lock()
+
+    # コンフィグの取得
+    # ファイルがない場合はdefault
+    def get(self, path, default=None):
+        key = os.path.normpath(path)
+        entry = self.entries.get(key)
+        if entry is None or time.monotonic() - entry[2] >= self.check_interval:
+            self.check(key)
+            entry = self.entries.get(key)
+        if entry is None or entry[1] is None:
+            return default
+        return entry[1]
+
+    # ファイルの更新確認と読み直し
+    # path省略時は読み込み済みの全ファイル
+    # 戻り値: 変更されたファイルの一覧
+    def check(self, path=None):
+        keys = list(self.entries) if path is None else [os.path.normpath(path)]
+        changed = []
+        for key in keys:
+            with self.lock:
+                signature = file_signature(key)
+                entry = self.entries.get(key)
+                if entry is not None and entry[0] == signature:
+                    self.entries[key] = (entry[0], entry[1], time.monotonic())
+                    continue
+                if entry is not None and signature is None:
+                    # 削除、リネーム(保存時の置き換え途中を含む)の場合は前回の内容のまま通知しない
+                    # 再作成された場合は更新情報が変わるため読み直す
+                    self.entries[key] = (entry[0], entry[1], time.monotonic())
+                    continue
+                try:
+                    config = self.load(key) if signature is not None else None
+                except ValueError:
+                    # 書き込み途中の場合は前回の内容のまま、次回に読み直す
+                    if entry is not None:
+                        self.entries[key] = (entry[0], entry[1], time.monotonic())
+                        continue
+                    raise
+                self.entries[key] = (signature, config, time.monotonic())
+            if entry is not None:
+                changed.append(key)
+                self.notify(key, config)
+        return changed
+
+    # ファイル読み込み
+    def load(self, path):
+        with open(path,'r', encoding="utf-8") as f:
+            return json.load(f)
+
+    # 変更時に呼び出す関数の登録
+    # path省略時は全ファイルの変更で呼び出す
+    def subscribe(self, callback, path=None):
+        key = None if path is None else os.path.normpath(path)
+        with self.lock:
+            self.callbacks[key] = self.callbacks.get(key, []) + [callback]
+
+    def unsubscribe(self, callback, path=None):
+        key = None if path is None else os.path.normpath(path)
+        with self.lock:
+            self.callbacks[key] = [c for c in self.callbacks.get(key, []) if c != callback]
+
+    # 変更の通知(確認したスレッドで呼ばれる)
+    def notify(self, key, config):
+        for callback in self.callbacks.get(key, []) + self.callbacks.get(None, []):
+            callback(key, config)
+
+    # 読み込み済みのファイル一覧
+    def paths(self):
+        return list(self.entries)
+
+
+# 共通のコンフィグキャッシュ(プロセス内で共有)
+config_store = ConfigStore()
+
+
+# カメラの回転角度(コンフィグのRoteIndexから)
+# コンフィグファイルがない、または回転の設定がない場合はdefault
+def camera_rotate_angle(config_file, default=0):
+    config = config_store.get(config_file)
+    try:
+        return config["BasicSetting"]["RoteIndex"]*90 % 360
+    except (TypeError, KeyError):
+        return default
@@ -0,0 +1,57 @@
+import os, glob
+
+# Qt関係
+from PyQt5.QtCore import QObject, QFileSystemWatcher, pyqtSignal
+
+# コンフィグファイルのキャッシュ
+from ConfigStore import config_store, CONFIGURE_DIR
+
+
+# コンフィグファイルの変更通知
+# QFileSystemWatcher(inotify)で変更を検知してキャッシュを読み直し、Qtシグナルで通知する
+# 他のスレッドで更新を検知した場合もGUIスレッドへ通知される
+class ConfigWatcher(QObject):
+    # コンフィグ変更(ファイルパス, 内容)
+    configChanged = pyqtSignal(str, object)
+
+    def __init__(self, store=config_store, parent=None):
+        super().__init__(parent)
+        self.store = store
+        self.watcher = QFileSystemWatcher(self)
+        # エディタ等がファイルを置き換えた場合に備えてフォルダも監視
+        self.watcher.addPath(CONFIGURE_DIR)
+        self.watch_files()
+        self.watcher.fileChanged.connect(self.on_changed)
+        self.watcher.directoryChanged.connect(self.on_changed)
+        self.store.subscribe(self.on_store_changed)
+
+    # コンフィグフォルダのファイルを監視対象に追加
+    # 置き換えられたファイルは監視が外れるため、毎回追加し直す
+    def watch_files(self):
+        watched = set(self.watcher.files())
+        paths = [path for path in glob.glob(os.path.join(CONFIGURE_DIR, "*.json")) if path not in watched]
+        if paths:
+            self.watcher.addPaths(paths)
+
+    # ファイル、フォルダ変更時の動作
+    def on_changed(self, path):
+        self.store.check()
+        self.watch_files()
+
+    # キャッシュ更新時の動作(更新を検知したスレッドで呼ばれる)
+    def on_store_changed(self, path, config):
+        try:
+            self.configChanged.emit(path, config)
+        except RuntimeError:
+            # 削除されている場合
+            pass
+
+
+# 共通の変更通知(GUIスレッドで作成)
+watcher = None
+
+def config_watcher():
+    global watcher
+    if watcher is None:
+        watcher = ConfigWatcher()
+    return watcher
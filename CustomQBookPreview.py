@@ -14,6 +14,9 @@ class CustomQBookPreview(QGraphicsView):
         self.current_image_index = 0
         self.zoom_factor = 1.0
 
+        # 表示直前に画像パスを解決する関数(派生画像の作成など)
+        self.resolve = lambda image_path: image_path
+
         # QGraphicsSceneの作成
         self.scene = QGraphicsScene()
 
@@ -42,7 +45,7 @@ class CustomQBookPreview(QGraphicsView):
         self.image_item = QGraphicsPixmapItem()
         self.scene.addItem(self.image_item)
 
-        pixmap = QPixmap(image_path)
+        pixmap = QPixmap(self.resolve(image_path))
         self.image_item.setPixmap(pixmap)
         self.update_arrow_positions()
 
@@ -1,9 +1,18 @@
-import sys
+import os, sys
+import time
+import threading
+from functools import partial
 from PyQt5.QtWidgets import QApplication, QGraphicsView, QGraphicsScene, QGraphicsPixmapItem, QMainWindow
-from PyQt5.QtGui import QImage, QPixmap, QTransform
-from PyQt5.QtCore import QTimer, Qt, QPoint
+from PyQt5.QtGui import QImage, QPixmap, QTransform, QPainter, QColor, qRgba
+from PyQt5.QtCore import Qt, QPoint, QTimer, pyqtSignal
 import numpy as np
-from picamera2 import Picamera2
+
+# カメラ毎のプレビューフレーム配信
+from FrameBroker import frame_broker, unsubscribe_all
+# フォーカス評価値、ピーキング
+from FocusMetric import FocusMeter
+# 表示性能の計測
+from PreviewStats import PreviewStats
 
 #def post_callback(request):
 #    # Read the metadata we get back from every request
@@ -32,7 +41,25 @@ from picamera2 import Picamera2
 #        pretty_metadata.append(row)
 #    print('\n'.join(pretty_metadata))
 
+# 表示サイズ変更からストリームサイズ反映までの待ち時間(ミリ秒)
+VIEW_RENEGOTIATE_DELAY = 300
+
+# フォーカスピーキングの色(マスクの0:透明、1:合焦したエッジ)
+PEAKING_COLORS = [qRgba(0, 0, 0, 0), qRgba(255, 0, 64, 255)]
+
+# 環境変数SBC_PREVIEW_STATS=1の場合、表示性能(FPS、遅延、描画時間、間引き/欠落)を重ねて表示
+PREVIEW_STATS_ENV = "SBC_PREVIEW_STATS"
+
 class CustomQCameraPreview(QGraphicsView):
+    # プレビューフレーム更新(回転前のフレーム)
+    frameUpdated = pyqtSignal(object)
+    # 新しいフレームの到着(カメラのスレッドから送信し、GUIスレッドで受信)
+    frameReady = pyqtSignal()
+    # 非表示になりフレームの受信を停止した
+    previewHidden = pyqtSignal()
+    # ストリームサイズの変更完了(変更用スレッドから送信し、GUIスレッドで受信)
+    viewApplied = pyqtSignal(bool)
+
     def __init__(self, camera):
         super().__init__()
         
@@ -40,6 +67,11 @@ class CustomQCameraPreview(QGraphicsView):
         self.setScene(self.scene)
         self.pixmap_item = QGraphicsPixmapItem()
         self.scene.addItem(self.pixmap_item)
+        # フォーカスピーキングの重ね表示
+        # フレームの子アイテムにして、回転と表示範囲をフレームと合わせる
+        self.peaking_item = QGraphicsPixmapItem(self.pixmap_item)
+        self.peaking_item.hide()
+        self.focus_meter = None
         
         self.camera = camera
         self.zoom_factor = 1.0  # 初期ズームレベル
@@ -51,33 +83,229 @@ class CustomQCameraPreview(QGraphicsView):
         self.drag_start_position = None
         self.rotation_angle = 0
         
-        # メイン側で呼び出し
-        self.timer = QTimer()
-        self.timer.timeout.connect(self.update_frame)
-        self.timer.start(30)  # 30ミリ秒ごとにフレームを更新
-
-    def update_frame(self):
-        frame = self.camera.capture_array()
-        height, width, channel = frame.shape
-        bytes_per_line = 3 * width
-        q_image = QImage(frame.data, width, height, bytes_per_line, QImage.Format_RGB888)
-        pixmap = QPixmap.fromImage(q_image)
+        # 表示中のフレームとサイズ
+        self.frame = None
+        self.frame_size = None
+        # 未表示の最新フレーム(表示前に次のフレームが届いた場合は上書き)
+        self.pending_frame = None
+        self.pending_metadata = None
+        self.frame_lock = threading.Lock()
         
-        # Rotate the pixmap
-        transform = QTransform().rotate(self.rotation_angle)
-        rotated_pixmap = pixmap.transformed(transform, Qt.SmoothTransformation)
+        # 表示性能の計測
+        # 表示待ちのフレームのSensorTimestampと転送時間(描画完了時に記録)
+        self.stats = PreviewStats()
+        self.stats_overlay = os.environ.get(PREVIEW_STATS_ENV) == "1"
+        self.unpainted = False
+        self.unpainted_timestamp = None
+        self.upload_time = 0.0
         
-        self.pixmap_item.setPixmap(rotated_pixmap)
+        # フレーム完了時にカメラのスレッドから通知を受ける
+        # GUIスレッドはセンサを待たず、届いたフレームのみ表示する
+        # フレームはカメラ毎の配信から受け取り、他のプレビューと共有する(読み取り専用)
+        # 表示中のみ購読し、非表示(非アクティブなタブ、保存済みページの表示中など)の間は停止する
+        self.frameReady.connect(self.on_frame_ready, Qt.QueuedConnection)
+        self.broker = frame_broker(camera)
+        self.destroyed.connect(partial(unsubscribe_all, self.on_frame, id(self)))
         
-        # fitInViewを使用して画像をビューのサイズに合わせる
-        self.fitInView(self.pixmap_item, Qt.KeepAspectRatio)
+        # プレビューのストリームサイズを表示サイズに合わせる
+        # サイズ変更が落ち着いてから反映する(反映時はカメラを再起動するため)
+        self.viewTimer = QTimer(self)
+        self.viewTimer.setSingleShot(True)
+        self.viewTimer.setInterval(VIEW_RENEGOTIATE_DELAY)
+        self.viewTimer.timeout.connect(self.negotiate_view)
+        self.viewApplied.connect(self.on_view_applied, Qt.QueuedConnection)
+
+    # 表示するカメラの変更
+    def set_camera(self, camera):
+        if camera is self.camera:
+            return
+        visible = self.isVisible()
+        if visible:
+            self.broker.unsubscribe(self.on_frame)
+            self.broker.release_view(id(self))
+        with self.frame_lock:
+            self.pending_frame = None
+        self.stats.reset()
+        self.camera = camera
+        self.broker = frame_broker(camera)
+        if visible:
+            self.broker.subscribe(self.on_frame)
+            self.viewTimer.start()
+
+    # 表示時にプレビュー再開
+    def showEvent(self, event):
+        # 非表示の間のフレームは欠落として数えない
+        self.stats.restart()
+        self.broker.subscribe(self.on_frame)
+        self.viewTimer.start()
+        super().showEvent(event)
+
+    # 非表示時にプレビュー停止
+    def hideEvent(self, event):
+        self.broker.unsubscribe(self.on_frame)
+        self.broker.release_view(id(self))
+        self.viewTimer.stop()
+        with self.frame_lock:
+            self.pending_frame = None
+        self.previewHidden.emit()
+        super().hideEvent(event)
+
+    # 表示サイズ(物理画素、回転前の向き)をカメラへ通知
+    def negotiate_view(self):
+        ratio = self.devicePixelRatioF()
+        width = int(self.viewport().width() * ratio)
+        height = int(self.viewport().height() * ratio)
+        if self.rotation_angle % 180 == 90:
+            width, height = height, width
+        # カメラの再起動は変更用スレッドで行い、完了を待たない
+        future = self.broker.request_view(id(self), width, height)
+        if future is not None:
+            future.add_done_callback(self.emit_view_applied)
+
+    # ストリームサイズの変更完了の通知(変更用スレッドで呼ばれる)
+    def emit_view_applied(self, future):
+        try:
+            self.viewApplied.emit(future.exception() is None and future.result())
+        except RuntimeError:
+            # Widgetが削除されている場合
+            pass
+
+    # ストリームサイズの変更完了時の動作(GUIスレッドで呼ばれる)
+    def on_view_applied(self, applied):
+        if not self.isVisible():
+            return
+        if not applied:
+            # 静止画撮影中の場合は後で再試行
+            self.viewTimer.start()
+            return
+        # カメラ再起動の間のフレームは欠落として数えない
+        self.stats.restart()
+        # コンフィグ再設定後もデジタルズームを維持
+        if self.zoom_factor != 1.0:
+            self.update_scaler_crop()
+
+    # フレーム到着時の動作(カメラのスレッドで呼ばれる)
+    def on_frame(self, frame):
+        with self.frame_lock:
+            scheduled = self.pending_frame is not None
+            self.pending_frame = frame
+            self.pending_metadata = self.broker.metadata
+        self.stats.on_received(self.pending_metadata, scheduled)
+        # 表示待ちの通知がある場合は送らない(古いフレームは表示せずに捨てる)
+        if not scheduled:
+            try:
+                self.frameReady.emit()
+            except RuntimeError:
+                # Widgetが削除されている場合
+                pass
+
+    # 新しいフレームの表示(GUIスレッドで呼ばれる)
+    def on_frame_ready(self):
+        with self.frame_lock:
+            frame, self.pending_frame = self.pending_frame, None
+            metadata = self.pending_metadata
+        if frame is None:
+            return
+        self.frameUpdated.emit(frame)
+        start = time.perf_counter()
+        self.update_frame(frame)
+        # 描画前に次のフレームを転送した場合は間引きとして数える
+        if self.unpainted:
+            self.stats.on_coalesced()
+        self.unpainted = True
+        self.unpainted_timestamp = metadata.get("SensorTimestamp") if metadata is not None else None
+        self.upload_time = time.perf_counter() - start
+        if self.focus_meter is not None:
+            self.update_peaking(frame)
+
+    # 表示性能の重ね表示の切り替え
+    # 計測は表示の有無によらず行い、statsから取得できる
+    def set_stats_overlay(self, enabled):
+        self.stats_overlay = enabled
+        self.viewport().update()
+
+    # 描画(ビューポートの再描画)
+    # フレームの描画完了時に遅延と描画時間を記録する
+    def paintEvent(self, event):
+        start = time.perf_counter()
+        super().paintEvent(event)
+        if self.unpainted:
+            self.unpainted = False
+            self.stats.on_displayed(self.unpainted_timestamp, self.upload_time + time.perf_counter() - start)
+        if self.stats_overlay:
+            self.draw_stats()
+
+    # 表示性能の描画(ビューポートの左上)
+    def draw_stats(self):
+        painter = QPainter(self.viewport())
+        text = self.stats.text()
+        rect = painter.fontMetrics().boundingRect(0, 0, self.viewport().width(), self.viewport().height(), Qt.AlignLeft, text)
+        rect.adjust(-4, -2, 4, 2)
+        rect.moveTo(4, 4)
+        painter.fillRect(rect, QColor(0, 0, 0, 160))
+        painter.setPen(Qt.white)
+        painter.drawText(rect, Qt.AlignCenter, text)
+        painter.end()
+
+    # フォーカスピーキングの表示切り替え
+    def set_focus_peaking(self, enabled):
+        if enabled and self.focus_meter is None:
+            self.focus_meter = FocusMeter(peaking=True)
+            if self.frame is not None:
+                self.update_peaking(self.frame)
+        elif not enabled:
+            self.focus_meter = None
+            self.peaking_item.hide()
+
+    # フォーカスピーキングの描画
+    # 縮小画像で計算したマスクを、フレームの大きさに拡大して重ねる
+    def update_peaking(self, frame):
+        self.focus_meter.measure(frame)
+        mask = self.focus_meter.mask
+        height, width = mask.shape
+        q_image = QImage(mask.data, width, height, mask.strides[0], QImage.Format_Indexed8)
+        q_image.setColorTable(PEAKING_COLORS)
+        self.peaking_item.setPixmap(QPixmap.fromImage(q_image))
+        self.peaking_item.setTransform(QTransform.fromScale(frame.shape[1] / width, frame.shape[0] / height))
+        self.peaking_item.show()
+
+    # フレームの描画
+    # frameを省略した場合は表示中のフレームを描き直す
+    # フレームはQPixmapへ1回転送するのみで、回転と縮小はアイテムの変換として描画時に行う
+    # 4チャンネル(XRGB8888)はFormat_RGB32と同じ並びのため、転送時の変換も不要
+    def update_frame(self, frame=None):
+        if frame is None:
+            frame = self.frame
+            if frame is None:
+                return
+        self.frame = frame
+        height, width, channel = frame.shape
+        image_format = QImage.Format_RGB32 if channel == 4 else QImage.Format_RGB888
+        q_image = QImage(frame.data, width, height, frame.strides[0], image_format)
+        self.pixmap_item.setPixmap(QPixmap.fromImage(q_image))
+        
+        # フレームサイズが変わった場合のみ回転、表示範囲を合わせる
+        if (width, height) != self.frame_size:
+            self.frame_size = (width, height)
+            self.fit_view()
         
         # 現在のズーム倍率を出力
         #print(f"Zoom factor: {self.zoom_factor}")
+
+    # 回転(画像中心)と表示範囲の設定
+    def fit_view(self):
+        self.pixmap_item.setTransformOriginPoint(self.pixmap_item.boundingRect().center())
+        self.pixmap_item.setRotation(self.rotation_angle)
+        self.scene.setSceneRect(self.pixmap_item.sceneBoundingRect())
+        # fitInViewを使用して画像をビューのサイズに合わせる
+        self.fitInView(self.pixmap_item, Qt.KeepAspectRatio)
     
     def resizeEvent(self, event):
         # ウィンドウサイズが変更されたときにもfitInViewを呼び出す
         self.fitInView(self.pixmap_item, Qt.KeepAspectRatio)
+        # ストリームサイズの再設定
+        if self.isVisible():
+            self.viewTimer.start()
         super().resizeEvent(event)
 
     def wheelEvent(self, event):
@@ -88,8 +316,8 @@ class CustomQCameraPreview(QGraphicsView):
             self.zoom_factor = max(self.zoom_factor / 1.1, self.min_zoom)  # ズームアウト
         
         # ScalerCropを更新してズームを適用
+        # 次のフレームからズームが反映される
         self.update_scaler_crop()
-        self.update_frame()  # フレームを更新してズームを反映
 
     def mousePressEvent(self, event):
         if event.button() == Qt.LeftButton:
@@ -157,15 +385,14 @@ class CustomQCameraPreview(QGraphicsView):
         
         # シーンをクリアして再設定
         self.reset_view()
+        # 向きが変わるためストリームサイズを再設定
+        if self.isVisible():
+            self.viewTimer.start()
 
     def reset_view(self):
-        self.scene.clear()
-        self.scene = QGraphicsScene()
-        self.setScene(self.scene)
-        self.pixmap_item = QGraphicsPixmapItem()
-        self.scene.addItem(self.pixmap_item)
+        # 表示中のフレームを描き直して、回転と表示範囲を再設定
         self.update_frame()
-        self.fitInView(self.pixmap_item, Qt.KeepAspectRatio)
+        self.fit_view()
 
 #class MainWindow(QMainWindow):
 #    def __init__(self, camera):
@@ -8,8 +8,8 @@ from PyQt5.QtWidgets import QSlider, QDoubleSpinBox
 from PyQt5.QtWidgets import QMessageBox
 
 from PyQt5.QtWidgets import QLabel
-from PyQt5.QtGui import QPainter, QColor, QPen
-from PyQt5.QtCore import QRect
+from PyQt5.QtGui import QPainter, QColor, QPen, QPolygonF
+from PyQt5.QtCore import QRect, QPointF
 
 
 class controlSlider(QWidget):
@@ -204,3 +204,46 @@ class QCircleLabel(QLabel):
 
         # 親クラスのpaintEventを呼び出して、他の描画処理を行う
         super().paintEvent(event)
+
+
+# 時系列のグラフ(フォーカス評価値のライブ表示用)
+# 系列毎に表示期間内の最大値で正規化して描画し、現在値と最大値を表示する
+class QLivePlot(QWidget):
+    def __init__(self, seconds=10.0, parent=None):
+        super().__init__(parent)
+        self.seconds = seconds
+        # 系列(名前, 色, 経過秒の配列, 値の配列, 強調表示)
+        self.series = []
+        self.setMinimumHeight(120)
+
+    # 系列の設定と再描画
+    def setSeries(self, series):
+        self.series = series
+        self.update()
+
+    def paintEvent(self, event):
+        painter = QPainter(self)
+        painter.setRenderHint(QPainter.Antialiasing)
+        painter.fillRect(self.rect(), QColor(32, 32, 32))
+        width, height = self.width(), self.height()
+        margin = 4
+        font_height = painter.fontMetrics().height()
+        plot_top = margin + font_height * len(self.series)
+        plot_height = max(1, height - plot_top - margin)
+
+        for row, (name, color, times, values, emphasis) in enumerate(self.series):
+            valid = ~np.isnan(values)
+            times, values = times[valid], values[valid]
+            peak = float(values.max()) if len(values) > 0 else 0.0
+            current = float(values[-1]) if len(values) > 0 else 0.0
+            # 現在値と最大値
+            painter.setPen(QColor(color))
+            painter.drawText(margin, margin + font_height * (row + 1) - 3, f"{name}: {current:.1f} (最大 {peak:.1f})")
+            if len(values) < 2 or peak <= 0:
+                continue
+            # 右端が現在、左端がseconds秒前
+            xs = width - margin - (-times / self.seconds) * (width - margin * 2)
+            ys = plot_top + plot_height * (1.0 - values / peak)
+            polygon = QPolygonF([QPointF(x, y) for x, y in zip(xs, ys)])
+            painter.setPen(QPen(QColor(color), 2 if emphasis else 1))
+            painter.drawPolyline(polygon)
@@ -0,0 +1,388 @@
+import os, glob
+import json
+import time
+import fcntl
+import atexit
+import hashlib
+import threading
+from contextlib import contextmanager
+import cv2
+
+# 画像変換
+import ImageTransform
+# サムネイル作成
+from ThumbnailMaker import make_thumbnail_file
+from CaptureProcess import THUMBNAIL_HEIGHT
+
+# カメラ毎のコンフィグファイル
+# GlobalVariablesはカメラを初期化するため、ここでは読み込まない
+from ConfigStore import CAMERA_CONFIG_FILES as configfiles
+# ファイルの更新情報(更新時刻, サイズ)
+from ConfigStore import file_signature
+
+# 派生画像の種類とファイル名の接尾辞
+KINDS = {"thumbnail": "_thumnail", "transformed": "_transformed"}
+
+# 容量上限で削除してよい派生画像の種類
+# サムネイルは見開き一覧で常に使用するため削除しない
+EVICTABLE_KINDS = ["transformed"]
+
+# 削除対象の派生画像の合計容量の上限(本棚全体)
+MAX_CACHE_BYTES = 8 * 1024**3
+
+# 容量上限の確認(全書籍の記録の集計)を行う間隔
+# 前回の確認から作成した削除対象の派生画像の容量(バイト)、または経過時間(秒)が超えた場合のみ確認する
+EVICT_CHECK_BYTES = 256 * 1024**2
+EVICT_CHECK_INTERVAL = 600.0
+
+# 書籍フォルダ毎の記録ファイル
+MANIFEST_FILE = "derived.json"
+
+# 作成途中の派生画像の拡張子
+# 書き込み完了後にリネームするため、中断しても壊れたファイルは残らない
+TMP_SUFFIX = ".tmp.jpg"
+
+# 記録ファイルのロックファイルの拡張子
+# GUIと一括変換のプロセスが同時に記録ファイルを更新しても記録が失われないようにする
+LOCK_SUFFIX = ".lock"
+
+# 最終使用時刻を記録ファイルへ保存する間隔(秒)
+# 表示毎にSDカードへ書き込まないよう、それまではメモリ上に保持する
+USED_FLUSH_INTERVAL = 60.0
+
+
+# オリジナル画像に対応するコンフィグファイル
+# 左ページはカメラ0、右ページと表紙、裏表紙はカメラ1
+def page_config_file(filename):
+    if "_left_" in os.path.basename(filename):
+        return configfiles[0]
+    return configfiles[1]
+
+
+# オリジナル画像に対応する派生画像のファイル名
+def derived_path(src, kind):
+    return src.replace("_original", KINDS[kind])
+
+
+# ファイルのハッシュ値
+def file_hash(path):
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024*1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+# 派生画像の作成パラメータ
+# 記録ファイルと比較するため、JSONで表現できる値にする
+# config_file: 変換に使用したコンフィグファイル(省略時はページの左右で決定)
+def derive_params(src, kind, config_file=None):
+    if kind == "transformed":
+        config_file = config_file if config_file is not None else page_config_file(src)
+        params = {"config": os.path.basename(config_file),
+                  "points": ImageTransform.engine.acrylic_points(config_file),
+                  "geometry": [ImageTransform.WMIN, ImageTransform.HMIN, ImageTransform.WIDTH, ImageTransform.HEIGHT]}
+    else:
+        params = {"height": THUMBNAIL_HEIGHT}
+    return json.loads(json.dumps(params))
+
+
+# 変換済み画像の作成
+def make_transformed_file(src, dst, config_file):
+    image_org = cv2.imread(src)
+    if image_org is None:
+        raise IOError(f"画像を読み込めません: {src}")
+    image_trans = ImageTransform.transform(image_org, config_file)
+    tmp = dst[:-len(".jpg")] + TMP_SUFFIX
+    cv2.imwrite(tmp, image_trans)
+    os.replace(tmp, dst)
+    return dst
+
+
+# 派生画像の作成
+def generate(src, kind, config_file=None):
+    dst = derived_path(src, kind)
+    if kind == "transformed":
+        config_file = config_file if config_file is not None else page_config_file(src)
+        return make_transformed_file(src, dst, config_file)
+    return make_thumbnail_file(src, dst)
+
+
+# 書籍フォルダの派生画像の記録
+# 派生画像毎に、元画像のハッシュ値と作成パラメータ、容量、最終使用時刻を保存する
+# 元画像または作成パラメータが変わった派生画像は、使用時に作り直す
+# 記録ファイルの更新は、プロセス間のロックを取得して読み直してから行う
+class DerivedCache:
+    def __init__(self, book_dir):
+        self.book_dir = book_dir
+        self.manifest = os.path.join(book_dir, MANIFEST_FILE)
+        # 派生画像のファイル名 -> 記録
+        self.entries = {}
+        # 元画像のファイル名 -> (サイズ, 更新時刻, ハッシュ値)
+        self.sources = {}
+        # 読み込み時の記録ファイルの更新情報
+        self.manifest_signature = None
+        # 未保存の最終使用時刻(派生画像のファイル名 -> 時刻)
+        self.used = {}
+        self.used_flushed = time.monotonic()
+        self.lock = threading.RLock()
+        # プロセス間のロック(ロックファイル)と入れ子の深さ
+        self.lock_file = None
+        self.lock_depth = 0
+
+    # 記録ファイルの更新用のロック(プロセス内、プロセス間)
+    @contextmanager
+    def locked(self):
+        with self.lock:
+            if self.lock_depth == 0 and os.path.isdir(self.book_dir):
+                self.lock_file = open(self.manifest + LOCK_SUFFIX, 'a')
+                fcntl.flock(self.lock_file, fcntl.LOCK_EX)
+            self.lock_depth += 1
+            try:
+                yield
+            finally:
+                self.lock_depth -= 1
+                if self.lock_depth == 0 and self.lock_file is not None:
+                    fcntl.flock(self.lock_file, fcntl.LOCK_UN)
+                    self.lock_file.close()
+                    self.lock_file = None
+
+    # 記録ファイルの読み込み
+    # 別プロセス(一括変換など)で更新された場合のみ読み直す(force=Trueの場合は常に読み直す)
+    # 未保存の最終使用時刻は読み直した記録に反映する
+    def refresh(self, force=False):
+        signature = file_signature(self.manifest)
+        if signature is None or (signature == self.manifest_signature and not force):
+            return
+        with open(self.manifest, 'r', encoding="utf-8") as f:
+            data = json.load(f)
+        self.entries = data.get("entries", {})
+        self.sources = {name: tuple(value) for name, value in data.get("sources", {}).items()}
+        self.manifest_signature = signature
+        for name, used in self.used.items():
+            entry = self.entries.get(name)
+            if entry is not None:
+                entry["used"] = max(entry["used"], used)
+
+    # 記録ファイルの保存(locked()の中で、refresh(force=True)の後に呼ぶ)
+    def save(self):
+        self.used = {}
+        self.used_flushed = time.monotonic()
+        if not os.path.isdir(self.book_dir):
+            # 書籍フォルダが削除されている場合
+            return
+        tmp = self.manifest + ".tmp"
+        with open(tmp, 'w') as fout:
+            json.dump({"entries": self.entries,
+                       "sources": {name: list(value) for name, value in self.sources.items()}}, fout, indent=4)
+        os.replace(tmp, self.manifest)
+        self.manifest_signature = file_signature(self.manifest)
+
+    # 最終使用時刻の更新
+    # メモリ上のみ更新し、保存は一定間隔毎(またはflush)
+    def touch(self, name):
+        now = time.time()
+        with self.lock:
+            self.used[name] = now
+            entry = self.entries.get(name)
+            if entry is not None:
+                entry["used"] = now
+            if time.monotonic() - self.used_flushed >= USED_FLUSH_INTERVAL:
+                self.flush()
+
+    # 未保存の最終使用時刻の保存
+    def flush(self):
+        with self.locked():
+            if not self.used:
+                return
+            self.refresh(force=True)
+            self.save()
+
+    # 元画像のハッシュ値
+    # サイズと更新時刻が変わっていなければ記録済みの値を使う
+    def source_hash(self, src):
+        stat = os.stat(src)
+        name = os.path.basename(src)
+        cached = self.sources.get(name)
+        if cached is not None and cached[0] == stat.st_size and cached[1] == stat.st_mtime_ns:
+            return cached[2]
+        digest = file_hash(src)
+        self.sources[name] = (stat.st_size, stat.st_mtime_ns, digest)
+        return digest
+
+    # 変換に使用するコンフィグファイル
+    # 撮影時に記録したものを優先し、記録がない場合はページの左右で決定
+    def config_file(self, src):
+        with self.lock:
+            self.refresh()
+            entry = self.entries.get(os.path.basename(derived_path(src, "transformed")))
+            config_file = entry.get("config_file") if entry is not None else None
+            if config_file is None or not os.path.exists(config_file):
+                return page_config_file(src)
+            return config_file
+
+    # 派生画像が最新か
+    def is_fresh(self, src, kind):
+        dst = derived_path(src, kind)
+        with self.lock:
+            self.refresh()
+            if not os.path.exists(dst):
+                return False
+            entry = self.entries.get(os.path.basename(dst))
+            if entry is None:
+                # 記録がない派生画像は、元画像とコンフィグより新しければ最新として引き継ぐ
+                newer = [os.path.getmtime(src)]
+                if kind == "transformed":
+                    newer.append(os.path.getmtime(page_config_file(src)))
+                if os.path.getmtime(dst) < max(newer):
+                    return False
+                self.record(src, kind)
+                return True
+            config_file = entry.get("config_file")
+            if config_file is not None and not os.path.exists(config_file):
+                return False
+            return entry["source"] == self.source_hash(src) and entry["params"] == derive_params(src, kind, config_file)
+
+    # 作成済みの派生画像を記録
+    # config_file: 変換に使用したコンフィグファイル(撮影時に左右のカメラを入れ替えた場合など)
+    def record(self, src, kind, config_file=None):
+        return self.record_many(src, [kind], config_file)[0]
+
+    # 同じ元画像の複数の派生画像をまとめて記録(記録ファイルの読み書きは1回)
+    # config_fileは変換済み画像のみに使用する
+    def record_many(self, src, kinds, config_file=None):
+        dsts = [derived_path(src, kind) for kind in kinds]
+        with self.locked():
+            self.refresh(force=True)
+            now = time.time()
+            for kind, dst in zip(kinds, dsts):
+                kind_config_file = config_file if kind == "transformed" else None
+                size = os.path.getsize(dst)
+                self.entries[os.path.basename(dst)] = {
+                    "kind": kind,
+                    "config_file": kind_config_file,
+                    "source": self.source_hash(src),
+                    "params": derive_params(src, kind, kind_config_file),
+                    "size": size,
+                    "used": now}
+                if kind in EVICTABLE_KINDS:
+                    count_created(size)
+            self.save()
+        return dsts
+
+    # 最新の派生画像のファイル名
+    # 古い場合、存在しない場合は作成する
+    def ensure(self, src, kind):
+        dst = derived_path(src, kind)
+        with self.lock:
+            if self.is_fresh(src, kind):
+                self.touch(os.path.basename(dst))
+                return dst
+            config_file = self.config_file(src) if kind == "transformed" else None
+            generate(src, kind, config_file)
+            self.record(src, kind, config_file)
+        evict_if_needed()
+        return dst
+
+    # 派生画像の削除
+    def remove(self, name):
+        with self.locked():
+            self.refresh(force=True)
+            entry = self.entries.pop(name, None)
+            self.used.pop(name, None)
+            path = os.path.join(self.book_dir, name)
+            if os.path.exists(path):
+                os.remove(path)
+            self.save()
+        return entry
+
+
+# 書籍フォルダ毎の記録(プロセス内で共有)
+caches = {}
+caches_lock = threading.Lock()
+
+def book_cache(book_dir):
+    key = os.path.normpath(book_dir)
+    with caches_lock:
+        if key not in caches:
+            caches[key] = DerivedCache(key)
+        return caches[key]
+
+
+# 全書籍の未保存の最終使用時刻を保存(終了時)
+def flush_all():
+    with caches_lock:
+        targets = list(caches.values())
+    for cache in targets:
+        cache.flush()
+
+atexit.register(flush_all)
+
+
+# オリジナル画像の派生画像を最新にして、そのファイル名を返す
+def ensure_derived(src, kind="transformed"):
+    return book_cache(os.path.dirname(src)).ensure(src, kind)
+
+
+# 派生画像ファイル名から最新の派生画像を取得
+# プレビュー等で派生画像のファイル名を直接扱う場合に使用
+def ensure_derived_path(path):
+    for kind, suffix in KINDS.items():
+        if suffix in os.path.basename(path):
+            src = path.replace(suffix, "_original")
+            if os.path.exists(src):
+                return ensure_derived(src, kind)
+    return path
+
+
+# 作成済みの派生画像を記録
+# kind: 派生画像の種類、または種類の一覧(まとめて記録する場合)
+def record_derived(src, kind, config_file=None):
+    cache = book_cache(os.path.dirname(src))
+    if isinstance(kind, str):
+        return cache.record(src, kind, config_file)
+    return cache.record_many(src, kind, config_file)
+
+
+# 前回の容量上限の確認から作成した削除対象の派生画像の容量と確認時刻
+evict_state = {"created": 0, "checked": None}
+evict_lock = threading.Lock()
+
+def count_created(size):
+    with evict_lock:
+        evict_state["created"] += size
+
+
+# 作成した容量または経過時間が確認間隔を超えた場合のみ容量上限を確認(撮影、表示毎に呼ぶ)
+# 戻り値: 削除した派生画像の数
+def evict_if_needed(max_bytes=MAX_CACHE_BYTES):
+    with evict_lock:
+        checked = evict_state["checked"]
+        if checked is not None and evict_state["created"] < EVICT_CHECK_BYTES \
+                and time.monotonic() - checked < EVICT_CHECK_INTERVAL:
+            return 0
+    return evict(max_bytes)
+
+
+# 容量上限を超えた場合、最終使用時刻の古い派生画像から削除(本棚全体)
+# 削除した派生画像は次に使用する時に作り直される
+def evict(max_bytes=MAX_CACHE_BYTES):
+    with evict_lock:
+        evict_state["created"] = 0
+        evict_state["checked"] = time.monotonic()
+    items = []
+    for manifest in glob.glob(os.path.join(".", "BookShelf", "*", MANIFEST_FILE)):
+        cache = book_cache(os.path.dirname(manifest))
+        with cache.lock:
+            cache.refresh()
+            items += [(entry["used"], entry["size"], cache, name) for name, entry in cache.entries.items()
+                      if entry["kind"] in EVICTABLE_KINDS]
+    total = sum(size for _, size, _, _ in items)
+    removed = 0
+    for used, size, cache, name in sorted(items, key=lambda item: item[0]):
+        if total <= max_bytes:
+            break
+        cache.remove(name)
+        total -= size
+        removed += 1
+    return removed
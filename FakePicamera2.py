@@ -0,0 +1,281 @@
+import time
+import copy
+import threading
+import numpy as np
+import cv2
+
+# 疑似カメラ(Picamera2の代わりにカメラなしで動作確認、ベンチマークを行う)
+# カメラモジュールV3(IMX708)相当のセンサモード、コントロール、メタデータを返す
+
+# センササイズ
+SENSOR_SIZE = (4608, 2592)
+
+# 既定の遅延(秒)
+# frame: プレビュー時のフレーム間隔、still_frame: フル解像度時のフレーム間隔
+# switch: モード切替、start: カメラ開始
+DEFAULT_LATENCY = {"frame": 1/30, "still_frame": 1/14, "switch": 0.3, "start": 0.2}
+
+# プレビュー時とみなす最大の幅(これより大きいmainはフル解像度として扱う)
+PREVIEW_MAX_WIDTH = 2304
+
+
+# センサフォーマット(picamera2のSensorFormat相当)
+class FakeSensorFormat:
+    def __init__(self, format):
+        self.format = format
+
+    def __str__(self):
+        return self.format
+
+
+# センサモード一覧
+SENSOR_MODES = [
+    {"format": FakeSensorFormat("SRGGB10_CSI2P"), "unpacked": "SRGGB10", "bit_depth": 10,
+     "size": size, "fps": fps, "crop_limits": (0, 0, SENSOR_SIZE[0], SENSOR_SIZE[1]), "exposure_limits": (9, None)}
+    for size, fps in [((1536, 864), 120.13), ((2304, 1296), 56.03), ((4608, 2592), 14.35)]]
+
+# コントロール(最小値, 最大値, 既定値)
+CAMERA_CONTROLS = {
+    "Saturation": (0.0, 32.0, 1.0),
+    "Contrast": (0.0, 32.0, 1.0),
+    "Sharpness": (0.0, 16.0, 1.0),
+    "Brightness": (-1.0, 1.0, 0.0),
+    "AfMode": (0, 2, 0),
+    "AfMetering": (0, 1, 0),
+    "AfRange": (0, 2, 0),
+    "AfSpeed": (0, 1, 0),
+    "AfTrigger": (0, 1, 0),
+    "AfPause": (0, 2, 0),
+    "AfWindows": ((0, 0, 0, 0), (65535, 65535, 65535, 65535), (0, 0, 0, 0)),
+    "LensPosition": (0.0, 15.0, 1.0),
+    "ExposureTime": (9, 112015443, 20000),
+    "AnalogueGain": (1.12, 16.0, 1.0),
+    "ScalerCrop": ((0, 0, 64, 64), (0, 0, SENSOR_SIZE[0], SENSOR_SIZE[1]), (0, 0, SENSOR_SIZE[0], SENSOR_SIZE[1])),
+}
+
+
+# 疑似的な見開き画像(BGR順)
+# 文字行を模した矩形と紙の質感(固定ノイズ)を描画し、JPEG保存や変換の負荷を実物に近づける
+def synthesize_spread(width, height, page=0):
+    rng = np.random.default_rng(page)
+    image = np.full((height, width, 3), 40, np.uint8)
+    # 紙
+    x0, y0, x1, y1 = int(width*0.08), int(height*0.06), int(width*0.92), int(height*0.94)
+    cv2.rectangle(image, (x0, y0), (x1, y1), (225, 232, 236), -1)
+    # 文字行
+    line_height = max(2, (y1 - y0) // 60)
+    for y in range(y0 + 2*line_height, y1 - 2*line_height, 2*line_height):
+        length = int((x1 - x0 - 4*line_height) * rng.uniform(0.3, 1.0))
+        cv2.rectangle(image, (x0 + 2*line_height, y), (x0 + 2*line_height + length, y + line_height), (30, 30, 30), -1)
+    # 紙の質感(センサノイズ相当)
+    noise = rng.integers(0, 12, (height, width, 1), dtype=np.uint8)
+    image[y0:y1, x0:x1] -= noise[y0:y1, x0:x1]
+    return image
+
+
+# ストリームのフォーマットに合わせて変換
+# picamera2と同じく、RGB888はBGR順、BGR888はRGB順の配列になる
+def convert_format(image, format):
+    if format == "RGB888":
+        return image
+    if format == "BGR888":
+        return image[:, :, ::-1]
+    if format == "XRGB8888":
+        return cv2.cvtColor(image, cv2.COLOR_BGR2BGRA)
+    if format == "XBGR8888":
+        return cv2.cvtColor(image, cv2.COLOR_BGR2RGBA)
+    if format in ["YUV420", "YVU420"]:
+        return cv2.cvtColor(image, cv2.COLOR_BGR2YUV_I420)
+    raise ValueError(f"未対応のフォーマット: {format}")
+
+
+# 撮影リクエスト(CompletedRequest相当)
+class FakeRequest:
+    def __init__(self, camera, arrays, metadata, config):
+        self.camera = camera
+        self.arrays = arrays
+        self.metadata = metadata
+        # リクエスト作成時のコンフィグ
+        self.config = config
+
+    # ストリームの配列(コピー)
+    def make_array(self, name):
+        return self.arrays[name].copy()
+
+    def get_metadata(self):
+        return dict(self.metadata)
+
+    def release(self):
+        self.arrays = None
+
+
+# 疑似カメラ
+# 開始中は撮影スレッドがフレーム間隔毎にリクエストを作成し、post_callbackを呼ぶ
+class FakePicamera2:
+    def __init__(self, camera_num=0, latency=None):
+        self.camera_num = camera_num
+        self.latency = dict(DEFAULT_LATENCY, **(latency or {}))
+        self.sensor_modes = copy.deepcopy(SENSOR_MODES)
+        self.camera_controls = dict(CAMERA_CONTROLS)
+        self.controls = {name: value[2] for name, value in CAMERA_CONTROLS.items()}
+        self.post_callback = None
+        self.camera_config = None
+        self.started = False
+        # 表示するページ番号(turn_pageで変更)
+        self.page = camera_num
+        # 作成済みの画像(サイズ, フォーマット, ページ)毎
+        self.images = {}
+        # 最新のリクエストと連番
+        self.request = None
+        self.sequence = 0
+        self.condition = threading.Condition()
+        self.thread = None
+
+    # コンフィグ作成
+    def create_configuration(self, use_case, main=None, lores=None, raw=None, buffer_count=4, controls=None):
+        config = {"use_case": use_case,
+                  "main": dict(main or {}),
+                  "lores": dict(lores) if lores else None,
+                  "raw": dict(raw) if raw else {"format": "SRGGB10_CSI2P", "size": SENSOR_SIZE},
+                  "buffer_count": buffer_count,
+                  "controls": dict(controls or {})}
+        return config
+
+    def create_preview_configuration(self, main=None, lores=None, raw=None, buffer_count=4, controls=None):
+        main = dict({"format": "XBGR8888", "size": (640, 480)}, **(main or {}))
+        return self.create_configuration("preview", main, lores, raw, buffer_count, controls)
+
+    def create_still_configuration(self, main=None, lores=None, raw=None, buffer_count=1, controls=None):
+        main = dict({"format": "BGR888", "size": SENSOR_SIZE}, **(main or {}))
+        return self.create_configuration("still", main, lores, raw, buffer_count, controls)
+
+    def create_video_configuration(self, main=None, lores=None, raw=None, buffer_count=6, controls=None):
+        main = dict({"format": "XBGR8888", "size": (1280, 720)}, **(main or {}))
+        return self.create_configuration("video", main, lores, raw, buffer_count, controls)
+
+    def configure(self, config):
+        if self.started:
+            raise RuntimeError("Camera must be stopped before configuring")
+        self.camera_config = copy.deepcopy(config)
+
+    def start(self):
+        if self.started:
+            return
+        if self.camera_config is None:
+            self.configure(self.create_preview_configuration())
+        time.sleep(self.latency["start"])
+        self.started = True
+        self.thread = threading.Thread(target=self.run, name=f"fakecamera{self.camera_num}", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        if not self.started:
+            return
+        self.started = False
+        with self.condition:
+            self.condition.notify_all()
+        self.thread.join()
+        self.thread = None
+
+    def close(self):
+        self.stop()
+
+    # 動作中のモード切替
+    def switch_mode(self, config):
+        time.sleep(self.latency["switch"])
+        with self.condition:
+            self.camera_config = copy.deepcopy(config)
+            # 切替前のフレームは返さない
+            self.request = None
+        return self.camera_config
+
+    def set_controls(self, controls):
+        self.controls.update(dict(controls))
+
+    # ページをめくる(疑似画像の内容を変更)
+    def turn_page(self, pages=2):
+        self.page += pages
+
+    # ストリームの画像
+    def stream_array(self, stream):
+        size = tuple(stream["size"])
+        key = (size, stream["format"], self.page)
+        if key not in self.images:
+            # 古いページの画像は破棄
+            self.images = {k: v for k, v in self.images.items() if k[2] == self.page}
+            self.images[key] = convert_format(synthesize_spread(size[0], size[1], self.page), stream["format"])
+        return self.images[key]
+
+    # フレーム間隔
+    def frame_interval(self):
+        width = self.camera_config["main"]["size"][0]
+        return self.latency["still_frame"] if width > PREVIEW_MAX_WIDTH else self.latency["frame"]
+
+    # メタデータ
+    def make_metadata(self, interval):
+        return {
+            "SensorTimestamp": time.monotonic_ns(),
+            "FrameDuration": int(interval * 1e6),
+            "ExposureTime": 20000,
+            "AnalogueGain": 1.0,
+            "DigitalGain": 1.0,
+            "ColourGains": (2.1, 1.7),
+            "ColourTemperature": 4500,
+            "ColourCorrectionMatrix": (1.8, -0.6, -0.2, -0.3, 1.6, -0.3, 0.0, -0.6, 1.6),
+            "Lux": 400.0,
+            "AeLocked": True,
+            "AfState": 2,
+            "AfPauseState": 0,
+            "LensPosition": float(self.controls.get("LensPosition", 1.0)),
+            "FocusFoM": 1000,
+            "ScalerCrop": tuple(self.controls.get("ScalerCrop", CAMERA_CONTROLS["ScalerCrop"][2])),
+            "SensorBlackLevels": (4096, 4096, 4096, 4096),
+            "SensorTemperature": 40.0,
+        }
+
+    # 撮影スレッド
+    def run(self):
+        next_time = time.perf_counter()
+        while self.started:
+            with self.condition:
+                config = self.camera_config
+            interval = self.frame_interval()
+            next_time += interval
+            delay = next_time - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                next_time = time.perf_counter()
+            arrays = {"main": self.stream_array(config["main"])}
+            if config.get("lores"):
+                arrays["lores"] = self.stream_array(config["lores"])
+            request = FakeRequest(self, arrays, self.make_metadata(interval), config)
+            if self.post_callback is not None:
+                self.post_callback(FakeRequest(self, arrays, request.metadata, config))
+            with self.condition:
+                self.request = request
+                self.sequence += 1
+                self.condition.notify_all()
+
+    # 次のフレームのリクエスト
+    def capture_request(self, wait=None):
+        if not self.started:
+            raise RuntimeError("Camera is not running")
+        with self.condition:
+            sequence = self.sequence
+            while self.started and (self.sequence == sequence or self.request is None):
+                self.condition.wait(wait)
+            if not self.started:
+                raise RuntimeError("Camera is not running")
+            # 呼び出し毎に別のリクエストとして返す(releaseが他へ影響しないように)
+            return FakeRequest(self, self.request.arrays, self.request.metadata, self.request.config)
+
+    # 次のフレームの配列
+    def capture_array(self, name="main", wait=None):
+        request = self.capture_request(wait)
+        array = request.make_array(name)
+        request.release()
+        return array
+
+    def capture_metadata(self, wait=None):
+        return self.capture_request(wait).get_metadata()
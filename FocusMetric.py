@@ -0,0 +1,129 @@
+import time
+import argparse
+import numpy as np
+import cv2
+
+# メタデータのリングバッファ(フォーカス評価値の履歴に使用)
+from MetadataBuffer import MetadataBuffer
+
+# フォーカス評価値とフォーカスピーキング(Qtを使用しない)
+# プレビュー(loresまたはプレビュー用main)のフレームを縮小したグレー画像で計算する
+# Laplacian: ラプラシアンの分散、Tenengrad: ソーベル勾配の2乗平均(どちらも大きいほど合焦)
+
+# 評価に使用する縮小画像の幅(初期値、最小値)
+FOCUS_ANALYSIS_WIDTH = 480
+FOCUS_MIN_WIDTH = 160
+
+# 1フレームあたりの計算時間の上限(秒)
+# 超えた場合は縮小画像の幅を小さくする
+FOCUS_BUDGET = 0.004
+
+# フォーカスピーキングのしきい値(ラプラシアンの絶対値)
+PEAKING_THRESHOLD = 48
+
+# 履歴を記録する評価値
+FOCUS_KEYS = ["Laplacian", "Tenengrad"]
+
+
+# 評価用の縮小グレー画像
+# 間引きで幅の2倍程度まで縮小してから平均化で縮小し、緑チャンネルを輝度の代わりに使用する
+# (BGR888、XRGB8888のどちらも緑は2チャンネル目)
+def downscale_gray(frame, width):
+    height = max(1, round(frame.shape[0] * width / frame.shape[1]))
+    step = max(1, frame.shape[1] // (width * 2))
+    green = frame[::step, ::step, 1] if frame.ndim == 3 else frame[::step, ::step]
+    if green.shape[1] <= width:
+        return np.ascontiguousarray(green)
+    return cv2.resize(np.ascontiguousarray(green), (width, height), interpolation=cv2.INTER_AREA)
+
+
+# ラプラシアンの分散
+def laplacian_variance(gray):
+    return float(cv2.Laplacian(gray, cv2.CV_32F).var())
+
+
+# Tenengrad(ソーベル勾配の2乗平均)
+def tenengrad(gray):
+    gx = cv2.Sobel(gray, cv2.CV_32F, 1, 0, ksize=3)
+    gy = cv2.Sobel(gray, cv2.CV_32F, 0, 1, ksize=3)
+    return float(np.mean(gx * gx + gy * gy))
+
+
+# フォーカスピーキングのマスク(合焦しているエッジが1、それ以外0のuint8画像)
+def peaking_mask(gray, threshold=PEAKING_THRESHOLD):
+    edges = cv2.convertScaleAbs(cv2.Laplacian(gray, cv2.CV_16S))
+    return (edges > threshold).view(np.uint8)
+
+
+# カメラ毎のフォーカス評価
+# フレームはカメラのスレッドから受け取り(on_frame)、評価は呼び出し元のスレッドで行う
+class FocusMeter:
+    def __init__(self, title="", width=FOCUS_ANALYSIS_WIDTH, budget=FOCUS_BUDGET, peaking=False):
+        self.width = width
+        self.budget = budget
+        self.peaking = peaking
+        # 未評価の最新フレーム
+        self.pending_frame = None
+        # 最新の評価値とピーキングのマスク
+        self.metrics = None
+        self.mask = None
+        # 最後の計算時間(秒)
+        self.elapsed = 0.0
+        # 前回のフレームの大きさ(高さ, 幅)
+        self.frame_size = None
+        # 評価値の履歴
+        self.history = MetadataBuffer(title, keys=FOCUS_KEYS)
+
+    # フレーム到着時の動作(カメラのスレッドで呼ばれる)
+    # 参照を保持するのみ
+    def on_frame(self, frame):
+        self.pending_frame = frame
+
+    # 評価値の計算
+    # frame省略時は未評価の最新フレーム、ない場合はNone
+    def measure(self, frame=None):
+        if frame is None:
+            frame, self.pending_frame = self.pending_frame, None
+            if frame is None:
+                return None
+        # プレビューのストリームサイズが変わった場合(表示サイズ変更時)
+        # 縮小画像の大きさにより評価値の大きさが変わるため、履歴は消去する
+        if frame.shape[:2] != self.frame_size:
+            if self.frame_size is not None:
+                self.history.clear()
+            self.frame_size = frame.shape[:2]
+        start = time.perf_counter()
+        gray = downscale_gray(frame, self.width)
+        self.metrics = {"Laplacian": laplacian_variance(gray), "Tenengrad": tenengrad(gray)}
+        if self.peaking:
+            self.mask = peaking_mask(gray)
+        self.elapsed = time.perf_counter() - start
+        self.history.push(self.metrics)
+        self.fit_budget()
+        return self.metrics
+
+    # 計算時間が上限を超えた場合は縮小画像の幅を小さくする
+    # 幅により評価値の大きさが変わるため、履歴は消去する
+    def fit_budget(self):
+        if self.elapsed <= self.budget or self.width <= FOCUS_MIN_WIDTH:
+            return
+        self.width = max(FOCUS_MIN_WIDTH, self.width * 3 // 4)
+        self.history.clear()
+
+
+if __name__ == '__main__':
+    # 使い方: python FocusMetric.py image.jpg [--width 480]
+    parser = argparse.ArgumentParser(description="画像のフォーカス評価値を表示します")
+    parser.add_argument("images", nargs="+", help="画像ファイル")
+    parser.add_argument("--width", type=int, default=FOCUS_ANALYSIS_WIDTH, help="評価に使用する縮小画像の幅")
+    args = parser.parse_args()
+
+    for image_file in args.images:
+        image = cv2.imread(image_file)
+        if image is None:
+            print(f"{image_file}: 読み込めません")
+            continue
+        meter = FocusMeter(width=args.width, peaking=True)
+        metrics = meter.measure(image)
+        print(f"{image_file}: Laplacian {metrics['Laplacian']:.1f}  Tenengrad {metrics['Tenengrad']:.1f}  "
+              f"ピーキング {np.count_nonzero(meter.mask)}画素  {meter.elapsed*1000:.2f} ms")
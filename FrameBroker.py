@@ -0,0 +1,139 @@
+import time
+import threading
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
+
+# PiCamera2グローバル変数
+from GlobalVariables import picam2s, preview_stream, is_preview_request
+from GlobalVariables import fit_preview_width, set_preview_width, preview_widths
+from GlobalVariables import add_frame_callback, remove_frame_callback
+from GlobalVariables import pimetadatas
+
+# 非表示になったプレビューの表示領域を保持する時間(秒)
+# タブ切替の度にストリームサイズを変更(カメラを再起動)しないよう、保持する間は縮小しない
+VIEW_HOLD_SECONDS = 30
+
+# ストリームサイズを縮小する割合の下限
+# 縮小幅がこれ未満の場合は現在のサイズのまま使用する(拡大は常に反映)
+PREVIEW_SHRINK_RATIO = 0.25
+
+# ストリームサイズ変更用スレッド
+# カメラの停止、コンフィグ設定、開始はGUIスレッドで行わない(カメラ毎の順序を保つため1スレッド)
+view_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="preview_view")
+
+
+# カメラ毎のプレビューフレーム配信
+# フレームはカメラのスレッドで1回だけ取り出し、読み取り専用の同じ配列を全購読者へ渡す
+# 購読者がいない間はフレームを取り出さない
+class FrameBroker:
+    def __init__(self, camera):
+        self.camera = camera
+        # 購読者(フレームを引数に、カメラのスレッドで呼ばれる関数)
+        self.subscribers = []
+        self.lock = threading.Lock()
+        # 最新のフレーム(読み取り専用)
+        self.frame = None
+        # 最新のフレームのメタデータ(post_callbackで記録済みのものを参照)
+        self.metadata = None
+        self.metadata_buffer = pimetadatas[picam2s.index(camera)]
+        # 取り出したフレーム数
+        self.frame_count = 0
+        # 表示中のプレビュー毎の表示領域(幅, 高さ)
+        self.views = {}
+        # 非表示になったプレビュー毎の((幅, 高さ), 解除時刻)
+        self.released_views = {}
+        # 変更を依頼済みのプレビュー幅(未依頼、反映失敗時はNone)
+        self.target_width = None
+
+    # 購読者数
+    @property
+    def subscriber_count(self):
+        return len(self.subscribers)
+
+    # 購読開始
+    # 最初の購読者でフレームの取り出しを開始
+    def subscribe(self, callback):
+        with self.lock:
+            if callback in self.subscribers:
+                return self.subscriber_count
+            self.subscribers = self.subscribers + [callback]
+            first = len(self.subscribers) == 1
+        if first:
+            add_frame_callback(self.camera, self.on_request)
+        return self.subscriber_count
+
+    # 購読終了
+    # 購読者がいなくなればフレームの取り出しを停止
+    def unsubscribe(self, callback):
+        with self.lock:
+            if callback not in self.subscribers:
+                return self.subscriber_count
+            self.subscribers = [subscriber for subscriber in self.subscribers if subscriber != callback]
+            last = len(self.subscribers) == 0
+        if last:
+            remove_frame_callback(self.camera, self.on_request)
+            self.frame = None
+        return self.subscriber_count
+
+    # プレビューの表示領域を登録して、プレビューのストリームサイズを合わせる(GUIスレッドで呼ばれる)
+    # 複数のプレビューがある場合、非表示になってから保持時間内のプレビューを含めて最も大きい表示領域に合わせる
+    # 戻り値: 変更しない場合None、変更する場合は反映結果(True、静止画撮影中で反映できない場合False)のfuture
+    def request_view(self, key, width, height):
+        now = time.monotonic()
+        self.views[key] = (width, height)
+        self.released_views.pop(key, None)
+        self.released_views = {k: (size, released) for k, (size, released) in self.released_views.items()
+                               if now - released < VIEW_HOLD_SECONDS}
+        sizes = list(self.views.values()) + [size for size, _ in self.released_views.values()]
+        camid = picam2s.index(self.camera)
+        preview_width = max(fit_preview_width(camid, w, h) for w, h in sizes)
+        current_width = self.target_width if self.target_width is not None else preview_widths[camid]
+        if current_width * (1 - PREVIEW_SHRINK_RATIO) < preview_width <= current_width:
+            return None
+        self.target_width = preview_width
+        future = view_executor.submit(set_preview_width, camid, preview_width)
+        future.add_done_callback(partial(self.on_view_applied, preview_width))
+        return future
+
+    # ストリームサイズ変更の完了時(変更用スレッドで呼ばれる)
+    # 反映できなかった場合は次の登録で再度依頼する
+    def on_view_applied(self, preview_width, future):
+        if (future.exception() is not None or not future.result()) and self.target_width == preview_width:
+            self.target_width = None
+
+    # プレビューの表示領域の登録解除
+    # 表示領域は保持時間の間残し、ストリームサイズは次の登録まで変更しない
+    def release_view(self, key):
+        size = self.views.pop(key, None)
+        if size is not None:
+            self.released_views[key] = (size, time.monotonic())
+
+    # フレーム完了時の動作(カメラのスレッドで呼ばれる)
+    def on_request(self, request):
+        # 購読者一覧は差し替えのみ行うため、ロックなしで参照できる
+        subscribers = self.subscribers
+        if len(subscribers) == 0 or not is_preview_request(self.camera, request):
+            return
+        # 撮影モードに応じてmainまたはloresストリームを取得
+        frame = request.make_array(preview_stream(self.camera))
+        # 購読者間で共有するため書き換えを禁止
+        frame.flags.writeable = False
+        self.frame = frame
+        self.metadata = self.metadata_buffer.latest
+        self.frame_count += 1
+        for callback in subscribers:
+            callback(frame)
+
+
+# カメラ毎の配信(プロセス内で共有)
+brokers = [FrameBroker(camera) for camera in picam2s]
+
+def frame_broker(camera):
+    return brokers[picam2s.index(camera)]
+
+
+# 全カメラの購読、表示領域の登録を解除(プレビュー削除時)
+def unsubscribe_all(callback, key):
+    for broker in brokers:
+        broker.unsubscribe(callback)
+        broker.release_view(key)
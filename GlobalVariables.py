@@ -1,7 +1,23 @@
 import numpy as np
 
+import os
+import threading
+
+# カメラの実装
+# 環境変数SBC_CAMERA=fakeの場合、またはpicamera2がない場合は疑似カメラ(FakePicamera2)を使用
+CAMERA_BACKEND_ENV = "SBC_CAMERA"
+if os.environ.get(CAMERA_BACKEND_ENV) == "fake":
+    from FakePicamera2 import FakePicamera2 as Picamera2
+else:
+    try:
+        from picamera2 import Picamera2
+    except ImportError:
+        if os.environ.get(CAMERA_BACKEND_ENV) == "picamera2":
+            raise
+        print("picamera2がないため疑似カメラを使用します")
+        from FakePicamera2 import FakePicamera2 as Picamera2
+
 # カメラインスタンス
-from picamera2 import Picamera2
 picam2s = [Picamera2(0), Picamera2(1)]
 
 # コンフィグ作成
@@ -18,124 +34,169 @@ for camid in [0, 1]:
 #    print(piconfigs[camid]["still"])
 #    print(piconfigs[camid]["preview"])
 
-# メタデータ表示
-pimetadatas = ["", ""]
-
-meta_keys = [
-    "AeLocked",
-    "AfPauseState",
-    "AfState",
-    "AnalogueGain",
-    "ColourCorrectionMatrix",
-    "ColourGains",
-    "ColourTemperature",
-    "DigitalGain",
-    "ExposureTime",
-    "FocusFoM",
-    "FrameDuration",
-    "LensPosition",
-    "Lux",
-    "ScalerCrop",
-    "SensorBlackLevels",
-    "SensorTemperature",
-    "SensorTimestamp"
-]
+# メタデータの記録
+# post_callbackでは格納のみ行い、表示用の文字列は表示時に作成する
+from MetadataBuffer import MetadataBuffer
+pimetadatas = [MetadataBuffer("camera0"), MetadataBuffer("camera1")]
+
+# フレーム完了時に呼び出す関数(カメラ毎)
+# post_callbackから呼ばれるため、登録した関数はカメラのスレッドで実行される
+frame_callbacks = [[], []]
+
+def add_frame_callback(camera, callback):
+    frame_callbacks[picam2s.index(camera)].append(callback)
+
+def remove_frame_callback(camera, callback):
+    callbacks = frame_callbacks[picam2s.index(camera)]
+    if callback in callbacks:
+        callbacks.remove(callback)
+
+def dispatch_frame(camid, request):
+    # 登録、解除はGUIスレッドで行われるため、コピーして呼び出す
+    for callback in list(frame_callbacks[camid]):
+        callback(request)
 
 # post_callbackを設定
 def post_callback0(request):
-    # Read the metadata we get back from every request
-    metadata = request.get_metadata()
-    # Put Awb to the end, as they only flash up sometimes
-    sorted_metadata = sorted(metadata.items(), key=lambda x: x[0] if "Awb" not in x[0] else f"Z{x[0]}")
-    # And print everything nicely
-    pretty_metadata = ["camera0"]
-    for k, v in sorted_metadata:
-        # まれになにか大量のビット列が入ってくる
-        if k not in meta_keys:
-            continue
-        row = ""
-        try:
-            iter(v)
-            if k == "ColourCorrectionMatrix":
-                matrix = np.around(np.reshape(v, (-1, 3)), decimals=2)
-                row = f"{k}:\n{matrix}"
-            else:
-                row_data = [f'{x:.2f}' if type(x) is float else f'{x}' for x in v]
-                row = f"{k}: ({', '.join(row_data)})"
-        except TypeError:
-            if type(v) is float:
-                row = f"{k}: {v:.2f}"
-            else:
-                row = f"{k}: {v}"
-        pretty_metadata.append(row)
-    #print('\n'.join(pretty_metadata))
-    pimetadatas[0] = '\n'.join(pretty_metadata)
+    # メタデータの格納
+    pimetadatas[0].push(request.get_metadata())
+    # フレームの通知
+    dispatch_frame(0, request)
 picam2s[0].post_callback = post_callback0
 
 def post_callback1(request):
-    # Read the metadata we get back from every request
-    metadata = request.get_metadata()
-    # Put Awb to the end, as they only flash up sometimes
-    sorted_metadata = sorted(metadata.items(), key=lambda x: x[0] if "Awb" not in x[0] else f"Z{x[0]}")
-    # And print everything nicely
-    pretty_metadata = ["camera1"]
-    for k, v in sorted_metadata:
-        # まれになにか大量のビット列が入ってくる
-        if k not in meta_keys:
-            continue
-        row = ""
-        try:
-            iter(v)
-            if k == "ColourCorrectionMatrix":
-                matrix = np.around(np.reshape(v, (-1, 3)), decimals=2)
-                row = f"{k}:\n{matrix}"
-            else:
-                row_data = [f'{x:.2f}' if type(x) is float else f'{x}' for x in v]
-                row = f"{k}: ({', '.join(row_data)})"
-        except TypeError:
-            if type(v) is float:
-                row = f"{k}: {v:.2f}"
-            else:
-                row = f"{k}: {v}"
-        pretty_metadata.append(row)
-    #print('\n'.join(pretty_metadata))
-    pimetadatas[1] = '\n'.join(pretty_metadata)
+    # メタデータの格納
+    pimetadatas[1].push(request.get_metadata())
+    # フレームの通知
+    dispatch_frame(1, request)
 picam2s[1].post_callback = post_callback1
 
 
+# 撮影モード
+# 0:撮影毎にプレビューから静止画へモード切替
+# 1:常時静止画コンフィグで動作し、プレビューはloresストリームを使用
+CAPTURE_MODE_SWITCH = 0
+CAPTURE_MODE_STILL = 1
+picapmodes = [CAPTURE_MODE_SWITCH, CAPTURE_MODE_SWITCH]
+
+# プレビューのフォーマット
+# XRGB8888はBGRX順の配列になり、QImage.Format_RGB32と同じ並びのため変換なしで表示できる
+PREVIEW_FORMAT = "XRGB8888"
+
+# プレビューの最大幅、最小幅
+PREVIEW_MAX_WIDTH = 2000
+PREVIEW_MIN_WIDTH = 320
+# プレビュー幅の単位(ISPの出力幅の制約に合わせる)
+PREVIEW_WIDTH_ALIGN = 32
+
+# カメラ毎のプレビュー幅
+# 画面上のプレビューのサイズから決定し、縮小はISPで行う
+preview_widths = [PREVIEW_MAX_WIDTH, PREVIEW_MAX_WIDTH]
+
+# カメラ毎のロック
+# 静止画撮影中にプレビューのコンフィグを変更しないようにする
+camera_locks = [threading.Lock(), threading.Lock()]
+
+# 画像サイズ、センサフォーマットからコンフィグ更新
+def update_piconfigs(camid, width, height, sensorFormat):
+    # プレビューサイズ
+    preview_width = min(width, preview_widths[camid])
+    preview_height = int(preview_width* (height / width))
+    preview_height = preview_height if preview_height%2==0 else preview_height-1
+    
+    # 静止画コンフィグ更新
+    # RGB888はBGR順の配列になるため、そのままOpenCVで扱える
+    piconfigs[camid]["still"]['main']['format'] = "RGB888"
+    piconfigs[camid]["still"]['main']['size'] = (width, height)
+    piconfigs[camid]["still"]['raw'] = sensorFormat
+    # プレビューコンフィグ更新
+    piconfigs[camid]["preview"]['main']['format'] = PREVIEW_FORMAT
+    piconfigs[camid]["preview"]['main']['size'] = (preview_width, preview_height)
+    piconfigs[camid]["preview"]['raw'] = sensorFormat
+    # 常時静止画コンフィグ更新
+    # フル解像度のmainとプレビュー用のloresを同時に出力
+    piconfigs[camid]["stilllores"] = picam2s[camid].create_still_configuration(
+        main={"format": "RGB888", "size": (width, height)},
+        lores={"format": PREVIEW_FORMAT, "size": (preview_width, preview_height)},
+        raw=sensorFormat,
+        buffer_count=2)
+
+# 撮影モードに応じたカメラ起動時のコンフィグ
+def active_piconfig(camid):
+    if picapmodes[camid] == CAPTURE_MODE_STILL:
+        return piconfigs[camid]["stilllores"]
+    return piconfigs[camid]["preview"]
+
+# 表示領域(幅, 高さ)に合わせたプレビュー幅
+# 画像の縦横比を保ったまま表示領域に収まる幅
+def fit_preview_width(camid, view_width, view_height):
+    width, height = piconfigs[camid]["still"]['main']['size']
+    fit_width = min(view_width, view_height * width / height)
+    fit_width = int(-(-fit_width // PREVIEW_WIDTH_ALIGN) * PREVIEW_WIDTH_ALIGN)
+    return max(PREVIEW_MIN_WIDTH, min(fit_width, PREVIEW_MAX_WIDTH, width))
+
+# プレビュー幅の変更とカメラへの反映
+# 動作中のカメラは停止、コンフィグ設定、開始を行う
+# 戻り値: 反映した場合True、静止画撮影中で反映できない場合False
+def set_preview_width(camid, preview_width):
+    if preview_width == preview_widths[camid]:
+        return True
+    if not camera_locks[camid].acquire(blocking=False):
+        return False
+    try:
+        preview_widths[camid] = preview_width
+        still_config = piconfigs[camid]["still"]
+        update_piconfigs(camid, *still_config['main']['size'], still_config['raw'])
+        camera = picam2s[camid]
+        started = camera.started
+        if started:
+            camera.stop()
+        camera.configure(active_piconfig(camid))
+        if started:
+            camera.start()
+    finally:
+        camera_locks[camid].release()
+    return True
+
+# 撮影モードに応じたプレビュー用ストリーム名
+def preview_stream(camera):
+    camid = picam2s.index(camera)
+    return "lores" if picapmodes[camid] == CAPTURE_MODE_STILL else "main"
+
+# プレビューに使用できるリクエストか
+# モード切替の撮影中に届くフル解像度のフレームは対象外
+def is_preview_request(camera, request):
+    config = request.config
+    stream = preview_stream(camera)
+    return config.get(stream) is not None and (stream == "lores" or config.get("use_case") != "still")
+
+
 # 初期コンフィグの反映
-import os, json
-configfiles = [
-    os.path.join(".", "Configure", "camera0_configure_recommend.json"),
-    os.path.join(".", "Configure", "camera1_configure_recommend.json")]
+# コンフィグはConfigStoreで1回だけ読み込み、以降はメモリ上の内容を使用
+from ConfigStore import config_store, CAMERA_CONFIG_FILES as configfiles
     
 for camid in [0, 1]:
     # コンフィグファイル読み込み
     config_file = configfiles[camid]
-    with open(config_file,'r', encoding="utf-8") as f:
-        config = json.load(f)
+    config = config_store.get(config_file)
     
     # 画像サイズ
     width, height = config["BasicSetting"]["ImageSize"]
     
     # センサフォーマット
-    sensorFormat = config["BasicSetting"]["sensorFormat"]
+    # キャッシュの内容は書き換えずにコピーして使用
+    sensorFormat = dict(config["BasicSetting"]["sensorFormat"])
     sensorFormat['size'] = tuple(sensorFormat['size'])
     print(sensorFormat)
     
-    # 静止画コンフィグ更新
-    piconfigs[camid]["still"]['main']['size'] = (width, height)
-    piconfigs[camid]["still"]['raw'] = sensorFormat
-    # プレビューコンフィグ更新
-    piconfigs[camid]["preview"]['main']['format'] = "BGR888"
-    preview_width = width if width < 2000 else 2000
-    preview_height = int(preview_width* (height / width))
-    preview_height = preview_height if preview_height%2==0 else preview_height-1
-    piconfigs[camid]["preview"]['main']['size'] = (preview_width, preview_height)
-    piconfigs[camid]["preview"]['raw'] = sensorFormat
+    # 撮影モード
+    picapmodes[camid] = config["BasicSetting"].get("CaptureMode", CAPTURE_MODE_SWITCH)
+    
+    # コンフィグ更新
+    update_piconfigs(camid, width, height, sensorFormat)
 
     # カメラコンフィグ設定
-    picam2s[camid].configure(piconfigs[camid]["preview"])  
+    picam2s[camid].configure(active_piconfig(camid))  
 
     # 画質調整
     # 彩度
@@ -0,0 +1,154 @@
+import os, sys
+import argparse
+
+# 書籍フォルダ操作
+import BookStore
+
+# 画面なしのコマンドライン操作(Qtを使用しない)
+# 書籍の作成、撮影、サムネイル/変換済み画像の再作成、エクスポートを行う
+# カメラ、OpenCVは撮影、再作成を行う場合のみ読み込み、起動を速くする
+
+
+# 書籍一覧の表示
+def command_list(args):
+    for book_info in BookStore.load_book_infos():
+        print(f"{book_info['id']}  {len(book_info['ordered']):4d}見開き  {book_info['title']}")
+
+
+# 新規書籍の作成
+def command_new(args):
+    bookid = BookStore.create_book()
+    print(bookid)
+
+
+# キー入力毎に撮影
+# Enterで撮影、qで終了(フットスイッチ等のキーボード入力にも対応)
+def key_triggers():
+    while True:
+        print("Enterで撮影、qで終了: ", end="", flush=True)
+        line = sys.stdin.readline()
+        if line == "" or line.strip().lower() == "q":
+            return
+        yield
+
+
+# ページめくりを検出して撮影
+# プレビューフレームをページめくり検出に入力し、静止したら撮影
+def auto_triggers(cameras):
+    from GlobalVariables import preview_stream
+    from PageTurnDetector import PageTurnDetector, load_detector_config
+    detector = PageTurnDetector(load_detector_config())
+    print("ページめくりを待っています(Ctrl+Cで終了)", flush=True)
+    while True:
+        for side, camera in enumerate(cameras):
+            if detector.update(camera.capture_array(preview_stream(camera)), side):
+                yield
+
+
+# 見開きの撮影
+def command_capture(args):
+    from GlobalVariables import picam2s, configfiles
+    from ConfigStore import camera_rotate_angle
+    from CapturePipeline import CapturePipeline
+    from CaptureLog import spread_side
+
+    book_info = BookStore.load_book_info(args.bookid)
+    book_dir = BookStore.book_dir(args.bookid)
+    # 左右ページのカメラ番号
+    camids = {"left": args.left, "right": args.right}
+    angles = {side: camera_rotate_angle(configfiles[camid]) for side, camid in camids.items()}
+
+    for camera in picam2s:
+        camera.start()
+    pipeline = CapturePipeline()
+    triggers = auto_triggers(picam2s) if args.auto else key_triggers()
+    count = 0
+    try:
+        for _ in triggers:
+            prefix = BookStore.new_spread_prefix(args.bookid, book_info["ordered"])
+            captures = [(camid, os.path.join(book_dir, f"{prefix}_{side}_original.jpg"), angles[side], configfiles[camid])
+                        for side, camid in camids.items()]
+            pipeline.capture(captures)
+            book_info = BookStore.add_spread(args.bookid, prefix)
+            count += 1
+            print(f"撮影: {prefix}", flush=True)
+            if args.count is not None and count >= args.count:
+                break
+    except KeyboardInterrupt:
+        pass
+    finally:
+        # 処理待ちの保存を完了させてからカメラ停止
+        errors = pipeline.wait()
+        for camera in picam2s:
+            camera.stop()
+    # 保存に失敗した見開きはページ並び順から削除
+    for filename, error in errors:
+        print(f"後処理エラー: {filename} {error}")
+        BookStore.remove_spread(args.bookid, spread_side(filename)[0])
+    print(f"{count}見開きを撮影しました")
+
+
+# サムネイル、変換済み画像の再作成
+def command_regenerate(args):
+    from ThumbnailMaker import regenerate_thumbnails
+    from BulkTransform import bulk_transform, all_book_dirs
+
+    book_dirs = all_book_dirs() if args.all else [BookStore.book_dir(bookid) for bookid in args.bookids]
+    if len(book_dirs) == 0:
+        raise SystemExit("書籍IDまたは--allを指定してください")
+    if not args.transforms_only:
+        for book_dir in book_dirs:
+            files = regenerate_thumbnails(book_dir)
+            print(f"{book_dir}: {len(files)}枚のサムネイルを作成しました")
+    if not args.thumbnails_only:
+        done, total = bulk_transform(book_dirs, args.workers, args.force)
+        print(f"{done}枚の画像を変換しました")
+
+
+# エクスポート
+def command_export(args):
+    postfix = "transformed" if args.transformed else "original"
+    print(BookStore.export_book(args.bookid, args.save_path, postfix))
+
+
+if __name__ == '__main__':
+    # 使い方: python HeadlessCapture.py list
+    #         python HeadlessCapture.py new
+    #         python HeadlessCapture.py capture 0001 [--auto] [--count 10]
+    #         python HeadlessCapture.py regenerate 0001 | --all [--thumbnails-only | --transforms-only]
+    #         python HeadlessCapture.py export 0001 book.pdf [--transformed]
+    parser = argparse.ArgumentParser(description="画面なしで書籍の撮影、画像処理、エクスポートを行います")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    subparser = subparsers.add_parser("list", help="書籍一覧")
+    subparser.set_defaults(func=command_list)
+
+    subparser = subparsers.add_parser("new", help="新規書籍を作成して書籍IDを表示")
+    subparser.set_defaults(func=command_new)
+
+    subparser = subparsers.add_parser("capture", help="見開きを撮影")
+    subparser.add_argument("bookid", help="書籍ID")
+    subparser.add_argument("--auto", action="store_true", help="ページめくりを検出して自動撮影")
+    subparser.add_argument("--count", type=int, default=None, help="撮影する見開き数")
+    subparser.add_argument("--left", type=int, default=0, help="左ページのカメラ番号")
+    subparser.add_argument("--right", type=int, default=1, help="右ページのカメラ番号")
+    subparser.set_defaults(func=command_capture)
+
+    subparser = subparsers.add_parser("regenerate", help="サムネイル、変換済み画像を再作成")
+    subparser.add_argument("bookids", nargs="*", help="書籍ID")
+    subparser.add_argument("--all", action="store_true", help="本棚の全書籍を対象にする")
+    subparser.add_argument("--workers", type=int, default=None, help="変換の並列数")
+    subparser.add_argument("--force", action="store_true", help="変換済み画像が新しくても再変換する")
+    group = subparser.add_mutually_exclusive_group()
+    group.add_argument("--thumbnails-only", action="store_true", help="サムネイルのみ")
+    group.add_argument("--transforms-only", action="store_true", help="変換済み画像のみ")
+    subparser.set_defaults(func=command_regenerate)
+
+    subparser = subparsers.add_parser("export", help="書籍をエクスポート")
+    subparser.add_argument("bookid", help="書籍ID")
+    subparser.add_argument("save_path", help="保存先(拡張子なしはフォルダ、.tar、.zip、.pdf)")
+    subparser.add_argument("--transformed", action="store_true", help="変換済み画像をエクスポート")
+    subparser.set_defaults(func=command_export)
+
+    args = parser.parse_args()
+    args.func(args)
@@ -1,32 +1,139 @@
-import os
 import cv2
 import numpy as np
-import json
+import threading
+from collections import OrderedDict
 
-# 画像変換
-def transform(image_org, config_file):
-    # コンフィグファイル読み込み
-    with open(config_file,'r', encoding="utf-8") as f:
-        config = json.load(f)
-            
-    # アクリル板の4点座標
-    src = []
-    for ivert, circle in enumerate(config["ImageTransform"]["AcrylicPoints"]):
-        x, y = circle
-        src.append((x, y))
+# コンフィグファイルのキャッシュ
+from ConfigStore import config_store
+
+# 300dpiで変換
+# 変換画像の余白
+WMIN = 100
+HMIN = 100
+# 変換画像内のページサイズ(182mm x (300-13-13)mm)
+WIDTH = int(182/25.4*300)
+HEIGHT = int((300-13-13)/25.4*300)
+
+# 保持するremapテーブルの最大数
+MAX_REMAP_CACHE = 4
+
+# remapテーブル作成時の分割行数(メモリ使用量を抑えるため)
+REMAP_CHUNK_ROWS = 256
+
+
+# 回転前の画像座標から回転後の画像座標への変換行列(時計回り、90度単位)
+def rotation_matrix(rotate_angle, width, height):
+    angle = rotate_angle % 360
+    if angle == 90:
+        return np.float64([[0, -1, height-1], [1, 0, 0], [0, 0, 1]])
+    elif angle == 180:
+        return np.float64([[-1, 0, width-1], [0, -1, height-1], [0, 0, 1]])
+    elif angle == 270:
+        return np.float64([[0, 1, 0], [-1, 0, width-1], [0, 0, 1]])
+    return np.eye(3)
+
+
+# 変換画像のサイズ
+def output_size():
+    return (WMIN+WIDTH+WMIN, HMIN+HEIGHT+HMIN)
+
+
+# 射影変換行列
+# src: アクリル板の4点座標
+def perspective_matrix(src, rotate_angle=0, image_size=None):
     src = np.float32(src)
-    
-    # 300dpiで変換
-    wmin = 100
-    hmin = 100
-    width = int(182/25.4*300)
-    height = int((300-13-13)/25.4*300) 
-            
     # 変換画像内の4点
-    dst = np.float32([(wmin, hmin), (wmin+width, hmin), (wmin+width, hmin+height), (wmin, hmin+height)])
-    
-    # 射影変換
+    dst = np.float32([(WMIN, HMIN), (WMIN+WIDTH, HMIN), (WMIN+WIDTH, HMIN+HEIGHT), (WMIN, HMIN+HEIGHT)])
     M = cv2.getPerspectiveTransform(src, dst)
-    image_trans = cv2.warpPerspective(image_org, M, (wmin+width+wmin,hmin+height+hmin), borderValue=(0, 0,0))
-    
-    return image_trans
+    # 回転変換を合成
+    if rotate_angle % 360 != 0:
+        width, height = image_size
+        M = M @ rotation_matrix(rotate_angle, width, height)
+    return M
+
+
+# 射影変換行列から固定小数点のremapテーブルを作成
+def build_remap_tables(M, size):
+    width, height = size
+    Minv = np.linalg.inv(M)
+    map1 = np.empty((height, width, 2), np.int16)
+    map2 = np.empty((height, width), np.uint16)
+    xs = np.arange(width, dtype=np.float64)
+    for y0 in range(0, height, REMAP_CHUNK_ROWS):
+        y1 = min(y0 + REMAP_CHUNK_ROWS, height)
+        ys = np.arange(y0, y1, dtype=np.float64)[:, None]
+        # 変換画像の座標から元画像の座標を計算
+        W = Minv[2, 0]*xs + Minv[2, 1]*ys + Minv[2, 2]
+        X = (Minv[0, 0]*xs + Minv[0, 1]*ys + Minv[0, 2]) / W
+        Y = (Minv[1, 0]*xs + Minv[1, 1]*ys + Minv[1, 2]) / W
+        map1[y0:y1], map2[y0:y1] = cv2.convertMaps(X.astype(np.float32), Y.astype(np.float32), cv2.CV_16SC2)
+    return map1, map2
+
+
+# 画像変換エンジン
+# コンフィグ、射影変換行列、remapテーブルをキャッシュして、同じカメラの画像変換で再利用する
+class TransformEngine:
+    def __init__(self, use_remap=True):
+        # remapテーブルを使用するか
+        self.use_remap = use_remap
+        # 射影変換行列
+        self.matrices = {}
+        # remapテーブル(古いものから破棄)
+        self.remaps = OrderedDict()
+        self.lock = threading.Lock()
+
+    # アクリル板の4点座標
+    # コンフィグはConfigStoreのキャッシュから取得(ファイル更新時のみ再読み込み)
+    def acrylic_points(self, config_file):
+        config = config_store.get(config_file)
+        return tuple((x, y) for x, y in config["ImageTransform"]["AcrylicPoints"])
+
+    # キャッシュのキー(アクリル板の4点、変換画像の形状、回転角度、入力画像サイズ)
+    # 辞書のキーとしてハッシュ化される
+    def cache_key(self, points, rotate_angle, image_size):
+        return (points, WMIN, HMIN, WIDTH, HEIGHT, rotate_angle % 360, image_size)
+
+    # 射影変換行列
+    def matrix(self, points, rotate_angle, image_size):
+        key = self.cache_key(points, rotate_angle, image_size)
+        M = self.matrices.get(key)
+        if M is None:
+            M = perspective_matrix(points, rotate_angle, image_size)
+            self.matrices[key] = M
+        return M
+
+    # remapテーブル
+    def remap_tables(self, points, rotate_angle, image_size):
+        key = self.cache_key(points, rotate_angle, image_size)
+        with self.lock:
+            tables = self.remaps.get(key)
+            if tables is None:
+                tables = build_remap_tables(self.matrix(points, rotate_angle, image_size), output_size())
+                self.remaps[key] = tables
+                # 上限を超えた場合は古いものから破棄
+                while len(self.remaps) > MAX_REMAP_CACHE:
+                    self.remaps.popitem(last=False)
+            else:
+                self.remaps.move_to_end(key)
+        return tables
+
+    # 画像変換
+    # rotate_angleを指定した場合、image_orgは回転前の画像として扱い、回転と射影変換を1回で行う
+    def transform(self, image_org, config_file, rotate_angle=0):
+        points = self.acrylic_points(config_file)
+        image_size = (image_org.shape[1], image_org.shape[0])
+        if self.use_remap:
+            map1, map2 = self.remap_tables(points, rotate_angle, image_size)
+            return cv2.remap(image_org, map1, map2, cv2.INTER_LINEAR, borderMode=cv2.BORDER_CONSTANT, borderValue=(0, 0, 0))
+        M = self.matrix(points, rotate_angle, image_size)
+        return cv2.warpPerspective(image_org, M, output_size(), borderValue=(0, 0, 0))
+
+
+# 共通の画像変換エンジン
+engine = TransformEngine()
+
+
+# 画像変換
+# rotate_angleを指定した場合、image_orgは回転前の画像として扱い、回転と射影変換を1回で行う
+def transform(image_org, config_file, rotate_angle=0):
+    return engine.transform(image_org, config_file, rotate_angle)
@@ -0,0 +1,177 @@
+import time
+import argparse
+import threading
+import numpy as np
+
+# カメラのメタデータのリングバッファ(Qtを使用しない)
+# post_callbackでは受け取ったメタデータを格納するだけで、文字列への整形は表示時に行う
+# 数値のメタデータは確保済みの配列に記録し、直近N秒の履歴として取り出せる
+
+# 表示するメタデータ
+# まれになにか大量のビット列が入ってくるため、これ以外は表示しない
+META_KEYS = [
+    "AeLocked",
+    "AfPauseState",
+    "AfState",
+    "AnalogueGain",
+    "ColourCorrectionMatrix",
+    "ColourGains",
+    "ColourTemperature",
+    "DigitalGain",
+    "ExposureTime",
+    "FocusFoM",
+    "FrameDuration",
+    "LensPosition",
+    "Lux",
+    "ScalerCrop",
+    "SensorBlackLevels",
+    "SensorTemperature",
+    "SensorTimestamp"
+]
+
+# 履歴を記録するメタデータ(数値のみ)
+HISTORY_KEYS = [
+    "AnalogueGain",
+    "ColourTemperature",
+    "DigitalGain",
+    "ExposureTime",
+    "FocusFoM",
+    "FrameDuration",
+    "LensPosition",
+    "Lux",
+    "SensorTemperature"
+]
+
+# 記録するフレーム数(30fpsで約1分)
+METADATA_CAPACITY = 2048
+
+
+# メタデータの表示用文字列
+# Awbは時々しか出てこないため最後に表示
+def format_metadata(metadata, title=""):
+    sorted_metadata = sorted(metadata.items(), key=lambda x: x[0] if "Awb" not in x[0] else f"Z{x[0]}")
+    pretty_metadata = [title] if title else []
+    for k, v in sorted_metadata:
+        if k not in META_KEYS:
+            continue
+        row = ""
+        try:
+            iter(v)
+            if k == "ColourCorrectionMatrix":
+                matrix = np.around(np.reshape(v, (-1, 3)), decimals=2)
+                row = f"{k}:\n{matrix}"
+            else:
+                row_data = [f'{x:.2f}' if type(x) is float else f'{x}' for x in v]
+                row = f"{k}: ({', '.join(row_data)})"
+        except TypeError:
+            if type(v) is float:
+                row = f"{k}: {v:.2f}"
+            else:
+                row = f"{k}: {v}"
+        pretty_metadata.append(row)
+    return '\n'.join(pretty_metadata)
+
+
+# カメラ毎のメタデータのリングバッファ
+# 書き込みはカメラのスレッド、読み出しはGUI等の別スレッドから行う
+class MetadataBuffer:
+    def __init__(self, title="", capacity=METADATA_CAPACITY, keys=HISTORY_KEYS):
+        self.title = title
+        self.capacity = capacity
+        self.keys = list(keys)
+        self.columns = {key: i for i, key in enumerate(self.keys)}
+        # 受信時刻(time.monotonic)と数値メタデータ(ない場合はNaN)
+        self.times = np.zeros(capacity, dtype=np.float64)
+        self.values = np.full((capacity, len(self.keys)), np.nan, dtype=np.float64)
+        # 受信したフレーム数
+        self.count = 0
+        # 最新のメタデータ(受け取った辞書をそのまま保持)
+        self.latest = None
+        # 整形済み文字列と整形時のフレーム数
+        self.text_cache = ("", -1)
+        self.lock = threading.Lock()
+
+    # メタデータの格納(カメラのスレッドで毎フレーム呼ばれる)
+    # 確保済みの配列に書き込むのみで、整形や並べ替えは行わない
+    def push(self, metadata):
+        with self.lock:
+            index = self.count % self.capacity
+            self.times[index] = time.monotonic()
+            row = self.values[index]
+            for i, key in enumerate(self.keys):
+                value = metadata.get(key)
+                row[i] = value if isinstance(value, (int, float)) else np.nan
+            self.latest = metadata
+            self.count += 1
+
+    # 最新のメタデータの表示用文字列
+    # 新しいフレームが届いていない場合は前回の文字列を返す
+    def text(self):
+        with self.lock:
+            metadata, count = self.latest, self.count
+        text, cached_count = self.text_cache
+        if cached_count != count:
+            text = format_metadata(metadata, self.title) if metadata is not None else ""
+            self.text_cache = (text, count)
+        return text
+
+    # 最新の値
+    def value(self, key, default=None):
+        metadata = self.latest
+        return metadata.get(key, default) if metadata is not None else default
+
+    # 直近seconds秒の履歴(古い順)
+    # 戻り値: (現在からの経過秒の配列(負の値), {キー: 値の配列})
+    # seconds省略時は記録済みの全フレーム
+    def history(self, keys=None, seconds=None):
+        keys = self.keys if keys is None else keys
+        with self.lock:
+            count = min(self.count, self.capacity)
+            start = self.count - count
+            indices = np.arange(start, self.count) % self.capacity
+            times = self.times[indices]
+            values = self.values[indices][:, [self.columns[key] for key in keys]]
+        times = times - time.monotonic()
+        if seconds is not None:
+            mask = times >= -seconds
+            times, values = times[mask], values[mask]
+        return times, {key: values[:, i] for i, key in enumerate(keys)}
+
+    # 直近seconds秒のフレームレート
+    def frame_rate(self, seconds=1.0):
+        times, _ = self.history([], seconds)
+        if len(times) < 2 or times[-1] == times[0]:
+            return 0.0
+        return (len(times) - 1) / (times[-1] - times[0])
+
+    # 記録の消去
+    def clear(self):
+        with self.lock:
+            self.count = 0
+            self.latest = None
+            self.values.fill(np.nan)
+            self.text_cache = ("", -1)
+
+
+if __name__ == '__main__':
+    # 使い方: python MetadataBuffer.py [--camera 0] [--seconds 5]
+    parser = argparse.ArgumentParser(description="カメラのメタデータの履歴を表示します")
+    parser.add_argument("--camera", type=int, default=0, help="カメラ番号")
+    parser.add_argument("--seconds", type=float, default=5.0, help="記録する秒数")
+    parser.add_argument("--keys", nargs="*", default=["LensPosition", "ExposureTime", "SensorTemperature"])
+    args = parser.parse_args()
+
+    from GlobalVariables import picam2s, pimetadatas
+    buffer = pimetadatas[args.camera]
+    picam2s[args.camera].start()
+    time.sleep(args.seconds)
+    picam2s[args.camera].stop()
+
+    print(buffer.text())
+    times, history = buffer.history(args.keys, args.seconds)
+    print(f"{len(times)}フレーム  {buffer.frame_rate(args.seconds):.1f} fps")
+    for key, values in history.items():
+        if np.all(np.isnan(values)):
+            print(f"{key}: なし")
+        else:
+            print(f"{key}: 最小 {np.nanmin(values):.2f}  最大 {np.nanmax(values):.2f}  最新 {values[-1]:.2f}")
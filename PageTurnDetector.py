@@ -0,0 +1,170 @@
+import os, glob
+import argparse
+import numpy as np
+import cv2
+
+# コンフィグファイルのキャッシュ
+from ConfigStore import config_store
+
+# 自動撮影のコンフィグファイル
+AUTOCAPTURE_CONFIG_FILE = os.path.join(".", "Configure", "autocapture_configure.json")
+
+# 既定値
+# AnalysisWidth: 判定に使う縮小画像の幅(画素)
+# MotionThreshold: ページめくり中と判定するフレーム間差分(画素値の平均絶対差)
+# StillThreshold: 静止していると判定するフレーム間差分
+# SettleFrames: 静止と判定してから撮影するまでの連続フレーム数
+# ChangeThreshold: 前回撮影時から変化したと判定する差分(手を入れただけの場合は撮影しない)
+DEFAULT_CONFIG = {
+    "AnalysisWidth": 160,
+    "MotionThreshold": 10.0,
+    "StillThreshold": 3.0,
+    "SettleFrames": 10,
+    "ChangeThreshold": 5.0,
+}
+
+
+# 自動撮影のコンフィグ読み込み
+# ファイルがない場合、項目がない場合は既定値
+def load_detector_config(config_file=AUTOCAPTURE_CONFIG_FILE):
+    config = dict(DEFAULT_CONFIG)
+    config.update(config_store.get(config_file, {}))
+    return config
+
+
+# 判定用の縮小画像
+# 間引きと緑チャンネルの取り出しはビューのみで、コピーは最後の1回
+def analysis_image(frame, width):
+    step = max(1, frame.shape[1] // width)
+    small = frame[::step, ::step]
+    if small.ndim == 3:
+        small = small[:, :, 1]
+    return small.astype(np.int16)
+
+
+# 2枚の縮小画像の差分(画素値の平均絶対差)
+def mean_abs_diff(a, b):
+    return float(np.abs(a - b).mean())
+
+
+# ページめくり検出
+# プレビューフレームのフレーム間差分で、ページめくりの動き -> 静止を検出する
+# 複数カメラのフレームを入力でき、全カメラが静止した時点で1回だけ撮影を指示する
+class PageTurnDetector:
+    def __init__(self, config=None):
+        self.config = dict(DEFAULT_CONFIG, **(config or {}))
+        self.reset()
+
+    # 状態の初期化
+    def reset(self):
+        # カメラ毎の直前の縮小画像
+        self.previous = {}
+        # カメラ毎の連続静止フレーム数
+        self.still = {}
+        # カメラ毎の前回撮影時の縮小画像
+        self.reference = {}
+        # 前回撮影後に動きがあったか
+        self.armed = False
+        # 直近のフレーム間差分
+        self.motion = 0.0
+
+    # フレーム入力
+    # source: カメラの識別子
+    # 戻り値: 撮影する場合True
+    def update(self, frame, source=0):
+        gray = analysis_image(frame, self.config["AnalysisWidth"])
+        previous = self.previous.get(source)
+        self.previous[source] = gray
+        if previous is None or previous.shape != gray.shape:
+            self.still[source] = 0
+            return False
+
+        # フレーム間差分
+        self.motion = mean_abs_diff(gray, previous)
+        if self.motion >= self.config["MotionThreshold"]:
+            # ページめくり中(全カメラの静止をやり直す)
+            self.armed = True
+            self.still = {key: 0 for key in self.still}
+        elif self.motion <= self.config["StillThreshold"]:
+            self.still[source] = self.still.get(source, 0) + 1
+        else:
+            self.still[source] = 0
+
+        # 動きの後、全カメラが静止したら撮影
+        if not self.armed or min(self.still.values()) < self.config["SettleFrames"]:
+            return False
+        self.armed = False
+        if not self.changed():
+            return False
+        self.mark_captured()
+        return True
+
+    # カメラの入力停止(プレビュー非表示、カメラ以外の表示に切り替えた場合)
+    # 入力されなくなったカメラの静止を待たないよう、状態から取り除く
+    def forget(self, source):
+        self.previous.pop(source, None)
+        self.still.pop(source, None)
+        self.reference.pop(source, None)
+
+    # 前回撮影時から画像が変化したか
+    def changed(self):
+        for source, gray in self.previous.items():
+            reference = self.reference.get(source)
+            if reference is None or reference.shape != gray.shape:
+                return True
+            if mean_abs_diff(gray, reference) >= self.config["ChangeThreshold"]:
+                return True
+        return False
+
+    # 撮影時の画像を記録(手動撮影時も呼ぶ)
+    def mark_captured(self):
+        self.reference = dict(self.previous)
+
+
+# 記録済みフレームの読み込み
+# path: 画像ファイルのフォルダ(ファイル名順)、または動画ファイル
+def load_frames(path):
+    if os.path.isdir(path):
+        for filename in sorted(glob.glob(os.path.join(path, "*"))):
+            frame = cv2.imread(filename)
+            if frame is not None:
+                yield frame
+        return
+    video = cv2.VideoCapture(path)
+    while True:
+        ok, frame = video.read()
+        if not ok:
+            break
+        yield frame
+    video.release()
+
+
+# 記録済みフレームで検出を再現
+# 戻り値: [(撮影したフレーム番号, フレーム間差分), ...]
+def replay(frames, config=None):
+    detector = PageTurnDetector(config)
+    triggers = []
+    for index, frame in enumerate(frames):
+        if detector.update(frame):
+            triggers.append((index, detector.motion))
+    return triggers
+
+
+if __name__ == '__main__':
+    # 使い方: python PageTurnDetector.py 記録フォルダor動画ファイル [--config ...] [--SettleFrames 5 ...]
+    parser = argparse.ArgumentParser(description="記録済みのプレビューフレームでページめくり検出を再現します")
+    parser.add_argument("frames", help="画像ファイルのフォルダ、または動画ファイル")
+    parser.add_argument("--config", default=AUTOCAPTURE_CONFIG_FILE, help="自動撮影のコンフィグファイル")
+    for key, value in DEFAULT_CONFIG.items():
+        parser.add_argument(f"--{key}", type=type(value), default=None)
+    args = parser.parse_args()
+
+    config = load_detector_config(args.config)
+    for key in DEFAULT_CONFIG:
+        if getattr(args, key) is not None:
+            config[key] = getattr(args, key)
+    print(f"設定: {config}")
+    triggers = replay(load_frames(args.frames), config)
+    for index, motion in triggers:
+        print(f"撮影: フレーム {index}  (差分 {motion:.2f})")
+    print(f"{len(triggers)}回撮影しました")
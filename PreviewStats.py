@@ -0,0 +1,98 @@
+import time
+import threading
+import numpy as np
+
+# メタデータのリングバッファ(表示毎の計測値の履歴に使用)
+from MetadataBuffer import MetadataBuffer
+
+# プレビューの表示性能の計測(Qtを使用しない)
+# 表示フレームレート、センサから画面表示までの遅延、描画時間、間引き/欠落したフレーム数
+
+# 表示毎に記録する計測値(ミリ秒)
+# Latency: SensorTimestampから描画完了まで、RenderTime: QPixmapへの転送と描画
+PREVIEW_STATS_KEYS = ["Latency", "RenderTime"]
+
+# 集計する期間(秒)
+PREVIEW_STATS_SECONDS = 1.0
+
+
+# プレビュー毎の表示性能
+# フレームの受信はカメラのスレッド、表示はGUIスレッドから呼ばれるため、カウンタの更新はロック内で行う
+class PreviewStats:
+    def __init__(self, title=""):
+        self.history = MetadataBuffer(title, keys=PREVIEW_STATS_KEYS)
+        self.lock = threading.Lock()
+        self.reset()
+
+    # 計測値の消去
+    def reset(self):
+        with self.lock:
+            self.history.clear()
+            # 受信したフレーム数
+            self.received = 0
+            # 表示したフレーム数
+            self.displayed = 0
+            # 表示前に次のフレームが届いて間引いたフレーム数
+            self.coalesced = 0
+            # センサのタイムスタンプの間隔から求めた、プレビューに届かなかったフレーム数
+            self.dropped = 0
+            self.last_timestamp = None
+
+    # フレーム受信時(カメラのスレッドで呼ばれる)
+    # metadata: フレームのメタデータ、replaced: 未表示のフレームを上書きした場合True
+    def on_received(self, metadata, replaced):
+        timestamp = metadata.get("SensorTimestamp") if metadata is not None else None
+        duration = metadata.get("FrameDuration") if metadata is not None else None
+        with self.lock:
+            self.received += 1
+            if replaced:
+                self.coalesced += 1
+            if metadata is None:
+                return
+            if timestamp is not None and duration and self.last_timestamp is not None:
+                # フレーム間隔(ナノ秒)がFrameDuration(マイクロ秒)の何倍か
+                frames = round((timestamp - self.last_timestamp) / (duration * 1000))
+                self.dropped += max(0, frames - 1)
+            self.last_timestamp = timestamp
+
+    # 描画前に次のフレームを転送した場合(GUIスレッドで呼ばれる)
+    def on_coalesced(self):
+        with self.lock:
+            self.coalesced += 1
+
+    # フレームの間隔の計測をやり直す
+    # 非表示、カメラ再起動の間のフレームは欠落として数えない
+    def restart(self):
+        with self.lock:
+            self.last_timestamp = None
+
+    # フレームの表示完了時(GUIスレッドで呼ばれる)
+    # timestamp: SensorTimestamp(ナノ秒、time.monotonic_nsと同じ時計)、render_time: 描画時間(秒)
+    def on_displayed(self, timestamp, render_time):
+        with self.lock:
+            self.displayed += 1
+        latency = (time.monotonic_ns() - timestamp) / 1e6 if timestamp is not None else np.nan
+        self.history.push({"Latency": latency, "RenderTime": render_time * 1000})
+
+    # 直近seconds秒の集計
+    def snapshot(self, seconds=PREVIEW_STATS_SECONDS):
+        times, history = self.history.history(PREVIEW_STATS_KEYS, seconds)
+        latency, render_time = history["Latency"], history["RenderTime"]
+        with self.lock:
+            counters = {"received": self.received, "displayed": self.displayed,
+                        "coalesced": self.coalesced, "dropped": self.dropped}
+        return {
+            "fps": float(self.history.frame_rate(seconds)),
+            "latency_ms": float(np.nanmean(latency)) if np.any(~np.isnan(latency)) else None,
+            "latency_max_ms": float(np.nanmax(latency)) if np.any(~np.isnan(latency)) else None,
+            "render_ms": float(np.mean(render_time)) if len(render_time) > 0 else None,
+            **counters,
+        }
+
+    # 表示用文字列
+    def text(self, seconds=PREVIEW_STATS_SECONDS):
+        stats = self.snapshot(seconds)
+        latency = f"{stats['latency_ms']:.0f} ms" if stats["latency_ms"] is not None else "-"
+        render_time = f"{stats['render_ms']:.1f} ms" if stats["render_ms"] is not None else "-"
+        return (f"{stats['fps']:.1f} fps  遅延 {latency}  描画 {render_time}\n"
+                f"間引き {stats['coalesced']}  欠落 {stats['dropped']}")
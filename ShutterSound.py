@@ -0,0 +1,133 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# シャッター音
+SHUTTER_SOUND_FILE = os.path.join(".", "Resource", "shutter.mp3")
+
+# 同時に再生できる数(連続撮影で前の音と重なってもよい)
+VOICES = 2
+
+# 再生方式を指定する環境変数(gst, playsound, silent)
+# 未指定の場合はgst、playsound、silentの順に使用できるものを選ぶ
+SOUND_BACKEND_ENV = "SHUTTER_SOUND"
+
+# 再生完了を待つ最大時間(秒)
+PLAY_TIMEOUT = 5
+
+
+# 無音(音声出力がない環境、ヘッドレス動作用)
+# 再生回数のみ数える
+class SilentBackend:
+    name = "silent"
+
+    def __init__(self, path, voices=VOICES):
+        self.count = 0
+
+    def play(self):
+        self.count += 1
+
+
+# GStreamer
+# 起動時にデコードとプリロールを済ませておき、再生時は先頭へシークして再生するのみ
+# 初回の音が出ない問題もプリロールで解消される
+# 再生スレッドで再生完了まで待ち、バスに溜まったメッセージを捨ててプリロール状態へ戻す
+class GstBackend:
+    name = "gst"
+
+    def __init__(self, path, voices=VOICES):
+        import gi
+        gi.require_version("Gst", "1.0")
+        from gi.repository import Gst
+        self.Gst = Gst
+        Gst.init(None)
+        uri = Gst.filename_to_uri(os.path.abspath(path))
+        # 重ねて再生できるように複数のプレイヤーを順番に使う
+        self.players = []
+        for _ in range(voices):
+            player = Gst.ElementFactory.make("playbin", None)
+            if player is None:
+                raise RuntimeError("playbinを作成できません")
+            player.set_property("uri", uri)
+            player.set_state(Gst.State.PAUSED)
+            self.players.append(player)
+        self.next = 0
+        self.lock = threading.Lock()
+
+    def play(self):
+        Gst = self.Gst
+        with self.lock:
+            player = self.players[self.next]
+            self.next = (self.next + 1) % len(self.players)
+        bus = player.get_bus()
+        player.seek_simple(Gst.Format.TIME, Gst.SeekFlags.FLUSH | Gst.SeekFlags.ACCURATE, 0)
+        player.set_state(Gst.State.PLAYING)
+        # EOS、エラー以外のメッセージ(状態変化など)は読み捨てられる
+        message = bus.timed_pop_filtered(PLAY_TIMEOUT * Gst.SECOND, Gst.MessageType.EOS | Gst.MessageType.ERROR)
+        player.set_state(Gst.State.PAUSED)
+        while bus.pop() is not None:
+            pass
+        if message is not None and message.type == Gst.MessageType.ERROR:
+            error, _ = message.parse_error()
+            raise RuntimeError(error.message)
+
+
+# playsound
+# 再生毎にファイルを読み込むため遅延は大きいが、再生スレッドで待つためGUIは止まらない
+class PlaysoundBackend:
+    name = "playsound"
+
+    def __init__(self, path, voices=VOICES):
+        from playsound import playsound
+        self.playsound = playsound
+        self.path = path
+
+    def play(self):
+        self.playsound(self.path)
+
+
+BACKENDS = {backend.name: backend for backend in [GstBackend, PlaysoundBackend, SilentBackend]}
+
+
+# 再生方式の作成
+# name: 再生方式(省略時は環境変数、使用できるものの順)
+def create_backend(path, name=None, voices=VOICES):
+    name = name if name is not None else os.environ.get(SOUND_BACKEND_ENV)
+    if name is not None:
+        return BACKENDS[name](path, voices)
+    for backend in [GstBackend, PlaysoundBackend]:
+        try:
+            return backend(path, voices)
+        except Exception as error:
+            print(f"シャッター音({backend.name})を使用できません: {error}")
+    return SilentBackend(path, voices)
+
+
+# シャッター音
+# 再生は専用スレッドで行い、呼び出し側は待たない
+class ShutterSound:
+    def __init__(self, path=SHUTTER_SOUND_FILE, backend=None, voices=VOICES):
+        self.backend = create_backend(path, backend, voices)
+        self.executor = ThreadPoolExecutor(max_workers=voices, thread_name_prefix="sound")
+
+    # 再生(すぐに戻る)
+    def play(self):
+        future = self.executor.submit(self.backend.play)
+        future.add_done_callback(self.on_played)
+        return future
+
+    # 再生エラーは撮影に影響させない
+    def on_played(self, future):
+        error = future.exception()
+        if error is not None:
+            print(f"シャッター音を再生できません: {error}")
+
+
+# 共通のシャッター音(全ての書籍編集ページで共有)
+shared_shutter_sound = None
+
+def get_shutter_sound():
+    global shared_shutter_sound
+    if shared_shutter_sound is None:
+        shared_shutter_sound = ShutterSound()
+    return shared_shutter_sound
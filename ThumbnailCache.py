@@ -0,0 +1,94 @@
+import os
+from collections import OrderedDict
+
+# Qt関係
+from PyQt5.QtCore import Qt, QSize
+from PyQt5.QtGui import QPixmap, QImageReader
+
+# ファイルの更新情報(更新時刻, サイズ)
+from ConfigStore import file_signature
+
+# 表示用に縮小したサムネイルのキャッシュ(GUIスレッドで使用)
+# 見開き一覧の描画、スクロール毎にファイルを読み込まないよう、縮小済みのQPixmapを保持する
+# ファイルの更新時刻とサイズが変わった場合は読み直す
+
+# キャッシュの容量上限(バイト)
+# 高さ200のサムネイルで約2000枚(1000見開き)分
+THUMBNAIL_CACHE_BYTES = 256 * 1024**2
+
+
+# 指定した高さに縮小したQPixmapの読み込み
+# JPEGは読み込み時に縮小するため、元の大きさで展開してから縮小するより速い
+def load_scaled_pixmap(path, height):
+    reader = QImageReader(path)
+    size = reader.size()
+    if size.isValid() and size.height() > height:
+        reader.setScaledSize(QSize(max(1, round(size.width() * height / size.height())), height))
+        reader.setQuality(100)
+    image = reader.read()
+    if image.isNull():
+        return QPixmap()
+    if image.height() != height:
+        image = image.scaledToHeight(height, Qt.SmoothTransformation)
+    return QPixmap.fromImage(image)
+
+
+# 縮小済みサムネイルのLRUキャッシュ
+# (パス, 高さ)毎に(更新情報, QPixmap, バイト数)を保持し、容量上限を超えたら古いものから削除
+class ThumbnailCache:
+    def __init__(self, max_bytes=THUMBNAIL_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    # 縮小済みのサムネイル
+    # ファイルがない、または読み込めない場合はNone
+    def pixmap(self, path, height):
+        key = (os.path.normpath(path), height)
+        signature = file_signature(path)
+        entry = self.entries.get(key)
+        if entry is not None and entry[0] == signature:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+        self.misses += 1
+        self.remove(key)
+        if signature is None:
+            return None
+        pixmap = load_scaled_pixmap(path, height)
+        if pixmap.isNull():
+            return None
+        size = pixmap.width() * pixmap.height() * pixmap.depth() // 8
+        self.entries[key] = (signature, pixmap, size)
+        self.bytes += size
+        while self.bytes > self.max_bytes and len(self.entries) > 1:
+            _, (_, _, evicted) = self.entries.popitem(last=False)
+            self.bytes -= evicted
+        return pixmap
+
+    def remove(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.bytes -= entry[2]
+
+    # ファイルのキャッシュを削除(ページ削除、再撮影時)
+    def invalidate(self, path):
+        path = os.path.normpath(path)
+        for key in [key for key in self.entries if key[0] == path]:
+            self.remove(key)
+
+    # フォルダ内のファイルのキャッシュを削除(書籍削除時)
+    def invalidate_dir(self, directory):
+        directory = os.path.normpath(directory) + os.sep
+        for key in [key for key in self.entries if key[0].startswith(directory)]:
+            self.remove(key)
+
+    def clear(self):
+        self.entries.clear()
+        self.bytes = 0
+
+
+# 共通のサムネイルキャッシュ(書籍編集ページ間で共有)
+thumbnail_cache = ThumbnailCache()
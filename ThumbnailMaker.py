@@ -0,0 +1,46 @@
+import os, glob
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image
+
+# サムネイル画像の高さ、JPEG品質
+from CaptureProcess import THUMBNAIL_HEIGHT, JPEG_QUALITY
+
+
+# 画像ファイルからサムネイル画像を作成
+# JPEGはdraftで1/2、1/4、1/8の縮小デコード(IDCT)を行い、小さな画像から最終的な縮小を行う
+def make_thumbnail_file(src, dst, thum_height=THUMBNAIL_HEIGHT):
+    with Image.open(src) as image:
+        # ヘッダから画像サイズ取得
+        width, height = image.size
+        thum_width = int(thum_height * width / height)
+        # 縮小デコード(サムネイルサイズ以上で最小の倍率を選択)
+        image.draft("RGB", (thum_width, thum_height))
+        image = image.convert("RGB")
+        # 最終的な縮小
+        thumbnail = image.resize((thum_width, thum_height), Image.BOX)
+    thumbnail.save(dst, "JPEG", quality=JPEG_QUALITY)
+    return dst
+
+
+# 書籍フォルダのサムネイル画像を一括で再作成
+# workers: 並列数(省略時はCPUコア数)
+def regenerate_thumbnails(book_dir, workers=None):
+    sources = sorted(glob.glob(os.path.join(book_dir, "*_original.jpg")))
+    jobs = [(src, src.replace("_original", "_thumnail")) for src in sources]
+    workers = workers if workers is not None else os.cpu_count()
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="thumbnail") as executor:
+        results = list(executor.map(lambda job: make_thumbnail_file(*job), jobs))
+    return results
+
+
+if __name__ == '__main__':
+    # 使い方: python ThumbnailMaker.py 0001 [--workers 4]
+    parser = argparse.ArgumentParser(description="書籍のサムネイル画像を一括で再作成します")
+    parser.add_argument("bookid", help="書籍ID")
+    parser.add_argument("--workers", type=int, default=None, help="並列数")
+    args = parser.parse_args()
+    book_dir = os.path.join(".", "BookShelf", args.bookid)
+    files = regenerate_thumbnails(book_dir, args.workers)
+    print(f"{len(files)}枚のサムネイルを作成しました")